@@ -0,0 +1,34 @@
+"""account outbox
+
+Revision ID: 5b2e9c41a7d3
+Revises: dc48cd6fdc74
+Create Date: 2026-10-19 13:40:07.512804
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b2e9c41a7d3'
+down_revision: Union[str, None] = 'dc48cd6fdc74'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('accountoutbox',
+    sa.Column('account_id', sa.Uuid(), nullable=False),
+    sa.Column('observed_at', sa.Float(), nullable=False),
+    sa.Column('urgent', sa.Boolean(), server_default='false', nullable=False),
+    sa.Column('seq', sa.BigInteger(), server_default='0', nullable=False),
+    sa.Column('locked_until', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['account_id'], ['account.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('account_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('accountoutbox')
@@ -0,0 +1,34 @@
+"""chain state
+
+Revision ID: 8f41c0d2e6b9
+Revises: 5b2e9c41a7d3
+Create Date: 2026-10-19 15:02:44.170953
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f41c0d2e6b9'
+down_revision: Union[str, None] = '5b2e9c41a7d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('chainstate',
+    sa.Column('chain', postgresql.ENUM('optimism', 'ethereum', name='chain', create_type=False), nullable=False),
+    sa.Column('snx_price', sa.Numeric(precision=50, scale=0), nullable=False),
+    sa.Column('sds_price', sa.Numeric(precision=50, scale=0), nullable=False),
+    sa.Column('period_start', sa.BigInteger(), nullable=False),
+    sa.Column('period_end', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('chain')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('chainstate')
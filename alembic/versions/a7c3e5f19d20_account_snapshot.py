@@ -0,0 +1,54 @@
+"""account snapshot
+
+Revision ID: a7c3e5f19d20
+Revises: 8f41c0d2e6b9
+Create Date: 2026-10-19 17:26:31.845102
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e5f19d20'
+down_revision: Union[str, None] = '8f41c0d2e6b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Partitioned by day. Partitions are created ahead and dropped after
+    # retention by the observers, see app.snx_staking.account_history
+    op.execute(
+        """
+        CREATE TABLE accountsnapshot (
+            account_id UUID NOT NULL,
+            observed_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            c_ratio FLOAT NOT NULL,
+            collateral NUMERIC(50, 0) NOT NULL,
+            debt NUMERIC(50, 0) NOT NULL,
+            PRIMARY KEY (account_id, observed_at)
+        ) PARTITION BY RANGE (observed_at)
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE accountsnapshothourly (
+            account_id UUID NOT NULL,
+            hour TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            c_ratio_min FLOAT NOT NULL,
+            c_ratio_max FLOAT NOT NULL,
+            c_ratio FLOAT NOT NULL,
+            collateral NUMERIC(50, 0) NOT NULL,
+            debt NUMERIC(50, 0) NOT NULL,
+            PRIMARY KEY (account_id, hour)
+        ) PARTITION BY RANGE (hour)
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('accountsnapshothourly')
+    op.drop_table('accountsnapshot')
@@ -0,0 +1,44 @@
+"""fixed point c_ratio
+
+Revision ID: c4d81b7e2f05
+Revises: a7c3e5f19d20
+Create Date: 2026-10-19 19:02:47.113906
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d81b7e2f05'
+down_revision: Union[str, None] = 'a7c3e5f19d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# c-ratios are stored in app.fixed_point.C_RATIO_UNIT
+C_RATIO_UNIT = 10**5
+C_RATIO_COLUMNS = [
+    ('account', 'c_ratio'),
+    ('accountsnapshot', 'c_ratio'),
+    ('accountsnapshothourly', 'c_ratio_min'),
+    ('accountsnapshothourly', 'c_ratio_max'),
+    ('accountsnapshothourly', 'c_ratio'),
+]
+
+
+def upgrade() -> None:
+    for table, column in C_RATIO_COLUMNS:
+        op.alter_column(table, column,
+                   existing_type=sa.Float(),
+                   type_=sa.BigInteger(),
+                   postgresql_using=f'round({column} * {C_RATIO_UNIT})::bigint')
+
+
+def downgrade() -> None:
+    for table, column in C_RATIO_COLUMNS:
+        op.alter_column(table, column,
+                   existing_type=sa.BigInteger(),
+                   type_=sa.Float(),
+                   postgresql_using=f'{column}::float / {C_RATIO_UNIT}')
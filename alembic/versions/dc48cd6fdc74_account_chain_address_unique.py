@@ -0,0 +1,95 @@
+"""account chain address unique
+
+Revision ID: dc48cd6fdc74
+Revises: cefd7af89e12
+Create Date: 2026-10-19 10:12:41.218391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'dc48cd6fdc74'
+down_revision: Union[str, None] = 'cefd7af89e12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Keep one row per (chain, address), preferring an inited one,
+    # and move chat accounts of the duplicates onto it.
+    op.execute(
+        """
+        CREATE TEMP TABLE account_duplicate ON COMMIT DROP AS
+        SELECT id, keep_id FROM (
+            SELECT id, first_value(id) OVER (
+                PARTITION BY chain, address ORDER BY inited DESC, id
+            ) AS keep_id
+            FROM account
+        ) ranked
+        WHERE id <> keep_id
+        """
+    )
+    # A chat linked to several duplicates would get as many links to the kept row.
+    # Keep one chat account per chat, preferring the one already on the kept row,
+    # move the notifs of the others onto it and drop the ones that became identical.
+    op.execute(
+        """
+        CREATE TEMP TABLE chat_account_duplicate ON COMMIT DROP AS
+        SELECT id, keep_id FROM (
+            SELECT chataccount.id, first_value(chataccount.id) OVER (
+                PARTITION BY
+                    chataccount.chat_id,
+                    coalesce(account_duplicate.keep_id, chataccount.account_id)
+                ORDER BY account_duplicate.keep_id IS NOT NULL, chataccount.id
+            ) AS keep_id
+            FROM chataccount
+            LEFT JOIN account_duplicate ON chataccount.account_id = account_duplicate.id
+        ) ranked
+        WHERE id <> keep_id
+        """
+    )
+    op.execute(
+        """
+        UPDATE notif SET chat_account_id = chat_account_duplicate.keep_id
+        FROM chat_account_duplicate WHERE notif.chat_account_id = chat_account_duplicate.id
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM notif USING notif kept
+        WHERE notif.chat_account_id IN (SELECT keep_id FROM chat_account_duplicate)
+            AND kept.chat_account_id = notif.chat_account_id
+            AND kept.type = notif.type
+            AND kept.params = notif.params
+            AND kept.id < notif.id
+        """
+    )
+    op.execute(
+        "DELETE FROM chataccount USING chat_account_duplicate"
+        " WHERE chataccount.id = chat_account_duplicate.id"
+    )
+    op.execute(
+        """
+        UPDATE chataccount SET account_id = account_duplicate.keep_id
+        FROM account_duplicate WHERE chataccount.account_id = account_duplicate.id
+        """
+    )
+    op.execute("DELETE FROM account USING account_duplicate WHERE account.id = account_duplicate.id")
+
+    op.drop_index('ix_account_address', table_name='account')
+    op.create_index(
+        'ix_account_chain_address',
+        'account',
+        ['chain', 'address'],
+        unique=True,
+        postgresql_include=['id'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_account_chain_address', table_name='account')
+    op.create_index('ix_account_address', 'account', ['address'], unique=False)
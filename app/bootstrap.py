@@ -1,126 +1,378 @@
 import asyncio
+import time
+from collections.abc import Coroutine
 
-from dotenv import load_dotenv
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
-from telegram.ext import Application, ApplicationBuilder, ContextTypes
+from telegram import Bot
+from telegram.ext import Application, ApplicationBuilder, CallbackContext, ContextTypes
 
-from app.common import Chain, ChainConfig, SNXData, SNXMultiChainData
-from app.config import Config
-from app.data_access import UOWFactoryType, uow_factory_maker
-from app.snx_staking import AccountManager, SNXDataManager, StakingObserver, bootstrap_synthetix
+from app import metrics, profiling
+from app.common import Chain, ChainConfig, SNXMultiChainData
+from app.config import AppRole, Config
+from app.data_access import (
+    ACCOUNT_OUTBOX_CHANNEL,
+    SNX_DATA_CHANNEL,
+    PgListener,
+    ReplicaMonitor,
+    UOWFactoryType,
+    instrument_engine,
+    metered_pool,
+    set_query_debug,
+    uow_factory_maker,
+)
+from app.loop_monitor import LoopMonitor
+from app.offload import Offload
+from app.snx_staking import (
+    AccountManager,
+    ShardCoordinator,
+    SNXDataManager,
+    StakingObserver,
+    bootstrap_synthetix,
+    load_snx_data,
+    maintain_account_history,
+)
 from app.telegram_bot import (
     AccountUpdateProcessor,
     BotData,
+    ChatCache,
     ChatData,
+    MeteredRequest,
     SnxBotContext,
+    TrackedApplication,
+    admin_handlers,
     error_handler,
     handlers,
     run_account_update_processor,
+    run_pg_listener,
     update_staking_observers_job,
 )
+from app.traffic import TrafficRecorder
 
+OBSERVERS_UPDATE_INTERVAL = 60
+ACCOUNT_HISTORY_MAINTENANCE_INTERVAL = 60 * 10
 
-def bootstrap() -> Application:
-    load_dotenv()
-    config = Config()
 
-    # UOW
-    engine = create_async_engine(
-        config.db_connection,
-    )
-    session_factory = async_sessionmaker(
-        bind=engine,
-        class_=AsyncSession,
-        expire_on_commit=False,
+def bootstrap(config: Config) -> Application:
+    """Bot frontend. With AppRole.all also the observers and the update processor"""
+    uow_factory = bootstrap_uow_factory(config)
+    pg_listener = PgListener(config.db_connection)
+    chat_cache = ChatCache(config.chat_cache_ttl)
+    recorder = bootstrap_traffic_recorder(config)
+
+    # SNX
+    snx_multichain_data = SNXMultiChainData(config.chains)
+
+    # TG APP
+    tg_app = bootstrap_telegram_bot(config.telegram_token, recorder, config.admin_ids)
+
+    tg_app.bot_data = BotData(
+        snx_data=snx_multichain_data,
+        uow_factory=uow_factory,
+        pg_listener=pg_listener,
+        chat_cache=chat_cache,
     )
-    uow_factory = uow_factory_maker(session_factory)
 
-    # ASYNC QUEUES
-    new_accounts_queues = {Chain(chain): asyncio.Queue() for chain in Chain}
-    updates_accounts_queue = asyncio.Queue()
+    if config.app_role is AppRole.all:
+        tg_app.bot_data["staking_observers"] = bootstrap_staking_observers(
+            config, uow_factory, config.chains, snx_multichain_data, recorder
+        )
+        tg_app.bot_data["account_update_processor"] = bootstrap_account_update_processor(
+            config, tg_app.bot, uow_factory, snx_multichain_data, pg_listener, chat_cache
+        )
 
-    # SNX
+        tg_app.job_queue.run_repeating(
+            update_staking_observers_job,
+            OBSERVERS_UPDATE_INTERVAL,
+            first=1,
+            name="Update staking observers",
+        )
+        tg_app.job_queue.run_once(
+            run_account_update_processor, 0.1, name="Account update processor"
+        )
+
+        async def maintain_account_history_job(_: CallbackContext) -> None:
+            await maintain_history(config, uow_factory)
+
+        tg_app.job_queue.run_repeating(
+            maintain_account_history_job,
+            ACCOUNT_HISTORY_MAINTENANCE_INTERVAL,
+            first=0,
+            name="Account history maintenance",
+        )
+    else:
+        subscribe_snx_data(pg_listener, uow_factory, snx_multichain_data)
+
+    tg_app.job_queue.run_once(run_pg_listener, 0, name="Postgres listener")
+
+    if config.metrics_port:
+
+        async def run_metrics_server_job(_: CallbackContext) -> None:
+            asyncio.create_task(metrics.run_metrics_server(config.metrics_port))
+
+        tg_app.job_queue.run_once(run_metrics_server_job, 0, name="Metrics server")
+
+    if config.loop_stall_threshold:
+
+        async def run_loop_monitor_job(_: CallbackContext) -> None:
+            asyncio.create_task(LoopMonitor(config.loop_stall_threshold).run())
+
+        tg_app.job_queue.run_once(run_loop_monitor_job, 0, name="Loop monitor")
+
+    async def install_profiling_job(_: CallbackContext) -> None:
+        install_profiling(config)
+
+    tg_app.job_queue.run_once(install_profiling_job, 0, name="Profiling")
+
+    return tg_app
+
+
+async def run_observers(config: Config) -> None:
+    """Observers of config.observer_chain, or of all chains, without the bot"""
+    install_profiling(config)
+    uow_factory = bootstrap_uow_factory(config)
     snx_multichain_data = SNXMultiChainData(config.chains)
+    chain_configs = (
+        {config.observer_chain: config.chains[config.observer_chain]}
+        if config.observer_chain
+        else config.chains
+    )
 
     staking_observers = bootstrap_staking_observers(
-        uow_factory,
-        config.chains,
-        snx_multichain_data,
-        config.etherscan_key,
-        new_accounts_queues,
-        updates_accounts_queue,
+        config, uow_factory, chain_configs, snx_multichain_data, bootstrap_traffic_recorder(config)
     )
 
-    # TG APP
-    tg_app = bootstrap_telegram_bot(config.telegram_token)
+    async def update_staking_observers() -> None:
+        while True:
+            await asyncio.gather(
+                *[observer.update() for observer in staking_observers.values()],
+                return_exceptions=True,
+            )
+            await asyncio.sleep(OBSERVERS_UPDATE_INTERVAL)
+
+    async def maintain_account_history_loop() -> None:
+        while True:
+            await maintain_history(config, uow_factory)
+            await asyncio.sleep(ACCOUNT_HISTORY_MAINTENANCE_INTERVAL)
 
-    account_update_processor = AccountUpdateProcessor(
-        tg_app.bot, uow_factory, snx_multichain_data, updates_accounts_queue
+    await asyncio.gather(
+        update_staking_observers(),
+        maintain_account_history_loop(),
+        *metrics_server(config),
+        *loop_monitor(config),
     )
 
-    tg_app.bot_data = BotData(
-        snx_data=snx_multichain_data,
-        uow_factory=uow_factory,
-        new_accounts_queues=new_accounts_queues,
-        staking_observers=staking_observers,
-        account_update_processor=account_update_processor,
+
+async def run_worker(config: Config) -> None:
+    """Account update processor, sending notifs and dashboards without polling updates"""
+    install_profiling(config)
+    uow_factory = bootstrap_uow_factory(config)
+    pg_listener = PgListener(config.db_connection)
+
+    snx_multichain_data = SNXMultiChainData(config.chains)
+    await load_snx_data(uow_factory, snx_multichain_data)
+    subscribe_snx_data(pg_listener, uow_factory, snx_multichain_data)
+
+    recorder = bootstrap_traffic_recorder(config)
+    request = recorder.telegram_request() if recorder else MeteredRequest()
+    async with Bot(config.telegram_token, request=request) as bot:
+        account_update_processor = bootstrap_account_update_processor(
+            config, bot, uow_factory, snx_multichain_data, pg_listener
+        )
+        await asyncio.gather(
+            pg_listener.run(),
+            account_update_processor.worker(),
+            *metrics_server(config),
+            *loop_monitor(config),
+        )
+
+
+def metrics_server(config: Config) -> list[Coroutine]:
+    return [metrics.run_metrics_server(config.metrics_port)] if config.metrics_port else []
+
+
+def install_profiling(config: Config) -> None:
+    """Profiles go to config.profile_dir, signals arm them. Needs the running loop"""
+    profiling.set_profile_dir(config.profile_dir)
+    profiling.install_signal_handlers(config.profile_count)
+
+
+def loop_monitor(config: Config) -> list[Coroutine]:
+    return [LoopMonitor(config.loop_stall_threshold).run()] if config.loop_stall_threshold else []
+
+
+async def maintain_history(config: Config, uow_factory: UOWFactoryType) -> None:
+    await maintain_account_history(
+        uow_factory, config.account_snapshot_retention_days, config.account_history_retention_days
     )
 
-    tg_app.job_queue.run_repeating(
-        update_staking_observers_job, 60, first=1, name="Update staking observers"
+
+def bootstrap_uow_factory(config: Config) -> UOWFactoryType:
+    set_query_debug(config.query_debug)
+    engine = instrument_engine(
+        create_async_engine(
+            config.db_connection,
+            poolclass=metered_pool("primary"),
+        )
     )
-    tg_app.job_queue.run_once(run_account_update_processor, 0.1, name="Account update processor")
+    session_factory = async_sessionmaker(
+        bind=engine,
+        class_=AsyncSession,
+        expire_on_commit=False,
+    )
+    if not config.db_replica_connection:
+        return uow_factory_maker(session_factory)
 
-    return tg_app
+    replica_engine = instrument_engine(
+        create_async_engine(config.db_replica_connection, poolclass=metered_pool("replica"))
+    )
+    replica_session_factory = async_sessionmaker(
+        bind=replica_engine,
+        class_=AsyncSession,
+        expire_on_commit=False,
+    )
+    replica_monitor = ReplicaMonitor(replica_engine, config.db_replica_max_lag)
+    return uow_factory_maker(session_factory, replica_session_factory, replica_monitor)
+
+
+def bootstrap_traffic_recorder(config: Config) -> TrafficRecorder | None:
+    if not config.traffic_record_dir:
+        return None
+    return TrafficRecorder.in_dir(config.traffic_record_dir, config.app_role)
 
 
-def bootstrap_telegram_bot(telegram_token: str) -> Application:
+def bootstrap_telegram_bot(
+    telegram_token: str,
+    recorder: TrafficRecorder | None = None,
+    admin_ids: list[int] | None = None,
+) -> Application:
     context_types = ContextTypes(context=SnxBotContext, chat_data=ChatData, bot_data=BotData)
-    app = ApplicationBuilder().token(telegram_token).context_types(context_types).build()
+    request_kwargs = {"connection_pool_size": 256}
+    request = (
+        recorder.telegram_request(**request_kwargs)
+        if recorder
+        else MeteredRequest(**request_kwargs)
+    )
+    app = (
+        ApplicationBuilder()
+        .token(telegram_token)
+        .request(request)
+        .context_types(context_types)
+        .application_class(TrackedApplication)
+        .build()
+    )
     app.add_handlers(handlers)
+    if admin_ids:
+        app.add_handlers(admin_handlers(admin_ids))
     app.add_error_handler(error_handler)
 
     return app
 
 
+def bootstrap_account_update_processor(
+    config: Config,
+    bot: Bot,
+    uow_factory: UOWFactoryType,
+    snx_multichain_data: SNXMultiChainData,
+    pg_listener: PgListener,
+    chat_cache: ChatCache | None = None,
+) -> AccountUpdateProcessor:
+    updates_available = asyncio.Event()
+
+    async def on_outbox_notification(_: str | None) -> None:
+        updates_available.set()
+
+    pg_listener.subscribe(ACCOUNT_OUTBOX_CHANNEL, on_outbox_notification)
+
+    async def collect_outbox_metrics() -> None:
+        async with uow_factory() as uow:
+            depth, oldest_observed_at = await uow.outbox.pending_stats()
+        metrics.OUTBOX_DEPTH.set(depth)
+        metrics.OUTBOX_OLDEST_SECONDS.set(
+            time.time() - oldest_observed_at if oldest_observed_at else 0
+        )
+
+    metrics.add_collector(collect_outbox_metrics)
+
+    return AccountUpdateProcessor(
+        bot,
+        uow_factory,
+        snx_multichain_data,
+        updates_available,
+        digest_window=config.notif_digest_window,
+        batch_size=config.outbox_batch_size,
+        lease=config.outbox_lease,
+        poll_interval=config.outbox_poll_interval,
+        chat_cache=chat_cache,
+    )
+
+
+def subscribe_snx_data(
+    pg_listener: PgListener, uow_factory: UOWFactoryType, snx_multichain_data: SNXMultiChainData
+) -> None:
+    """Keeps snx_multichain_data in sync with observers running in other processes"""
+
+    async def on_snx_data_notification(_: str | None) -> None:
+        await load_snx_data(uow_factory, snx_multichain_data)
+
+    pg_listener.subscribe(SNX_DATA_CHANNEL, on_snx_data_notification)
+
+
 def bootstrap_staking_observers(
+    config: Config,
     uow_factory: UOWFactoryType,
     chain_configs: dict[Chain, ChainConfig],
     snx_multichain_data: SNXMultiChainData,
-    etherscan_key: str,
-    new_accounts_queues: dict[Chain, asyncio.Queue],
-    updates_accounts_queue: asyncio.Queue,
+    recorder: TrafficRecorder | None = None,
 ) -> dict[Chain, StakingObserver]:
     staking_observers = {}
+    # the chains share the worker processes
+    offload = Offload(config.offload_workers, config.offload_min_batch)
 
     for chain, chain_config in chain_configs.items():
         staking_observers[chain] = bootstrap_chain(
+            config,
             chain_config,
-            etherscan_key,
             uow_factory,
-            snx_multichain_data[chain],
-            updates_accounts_queue,
-            new_accounts_queues[chain],
+            snx_multichain_data,
+            recorder,
+            offload,
         )
     return staking_observers
 
 
 def bootstrap_chain(
+    config: Config,
     chain_config: ChainConfig,
-    etherscan_key: str,
     uow_factory: UOWFactoryType,
-    snx_data: SNXData,
-    updated_accounts_queue: asyncio.Queue,
-    new_accounts_queue: asyncio.Queue,
+    snx_multichain_data: SNXMultiChainData,
+    recorder: TrafficRecorder | None = None,
+    offload: Offload | None = None,
 ) -> StakingObserver:
-    synthetix = bootstrap_synthetix(chain_config, etherscan_key)
+    synthetix = bootstrap_synthetix(
+        chain_config,
+        config.etherscan_key,
+        provider=recorder.provider(chain_config.chain, chain_config.api) if recorder else None,
+        wrap_abi_fetch=recorder.wrap_abi_fetch(chain_config.chain) if recorder else None,
+        offload=offload,
+    )
+    snx_data = snx_multichain_data[chain_config.chain]
+    shard_coordinator = ShardCoordinator(
+        chain_config.chain, config.db_connection, config.observer_shards
+    )
 
-    snx_data_manager = SNXDataManager(synthetix, snx_data)
+    snx_data_manager = SNXDataManager(synthetix, snx_data, uow_factory)
     account_manager = AccountManager(
-        chain_config.chain, snx_data, synthetix, uow_factory, updated_accounts_queue
+        chain_config.chain,
+        snx_data,
+        synthetix,
+        uow_factory,
+        shard_coordinator,
+        snapshot_interval=config.account_snapshot_interval,
+        offload=offload,
+        outbox_max_depth=config.outbox_max_depth,
     )
     staking_observer = StakingObserver(
-        chain_config.chain, synthetix, snx_data_manager, account_manager, new_accounts_queue
+        chain_config.chain, synthetix, snx_data_manager, account_manager, shard_coordinator
     )
 
     return staking_observer
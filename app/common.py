@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from enum import StrEnum
-from typing import Self
+from typing import NamedTuple, Self
 
 
 class Chain(StrEnum):
@@ -46,6 +46,19 @@ class SNXData:
     period_updated: bool = False
 
 
+class AccountUpdate(NamedTuple):
+    """Pending account update. Delivery latency is measured from observed_at"""
+
+    observed_at: float
+    urgent: bool = False
+
+    def merge(self, newer: Self) -> Self:
+        return AccountUpdate(
+            observed_at=min(self.observed_at, newer.observed_at),
+            urgent=self.urgent or newer.urgent,
+        )
+
+
 class ChainConfig:
     def __init__(
         self, chain: Chain, api: str, address_resolver_address: str, issuance_ratio: float
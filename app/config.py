@@ -1,11 +1,29 @@
+from enum import StrEnum
+
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
 
 from app.common import Chain, ChainConfig
 
 
+class AppRole(StrEnum):
+    # everything in one process
+    all = "all"
+    # chain observers, see Config.observer_chain
+    observer = "observer"
+    # account update processor: notifs and dashboards
+    worker = "worker"
+    # telegram bot frontend
+    bot = "bot"
+
+
 class Config(BaseSettings, extra="allow"):
     etherscan_key: str
     db_connection: str
+    # Hot standby for read-heavy paths, reads go to db_connection without it
+    db_replica_connection: str | None = None
+    # Seconds the replica may lag before reads fall back to the primary
+    db_replica_max_lag: float = 5
     alchemy_key: str
 
     telegram_token: str
@@ -16,8 +34,70 @@ class Config(BaseSettings, extra="allow"):
     ethereum_issuance_ratio: float
     optimism_issuance_ratio: float
 
+    # Separate roles coordinate through postgres and can run as several processes
+    app_role: AppRole = AppRole.all
+    # Chain observed by an observer process, all chains if not set
+    observer_chain: Chain | None = None
+    # Shards of each chain's accounts, split between the running observer instances.
+    # Every shard has one owner, so instances don't duplicate work or alerts
+    observer_shards: int = 1
+
+    # Seconds between snapshots of an account whose metrics move with prices only
+    account_snapshot_interval: int = 900
+    # Days raw account snapshots are kept
+    account_snapshot_retention_days: int = 7
+    # Days the hourly account history for /history is kept
+    account_history_retention_days: int = 180
+
+    # Seconds the bot may serve a cached chat to menus, writes made by the chat drop it sooner
+    chat_cache_ttl: float = 30
+
+    # Seconds to collect notifs for a chat into one message, 0 sends them right away
+    notif_digest_window: float = 0
+    # Account outbox rows the update processor claims at once
+    outbox_batch_size: int = 100
+    # Seconds before rows claimed by a crashed or stuck processor are claimed again
+    outbox_lease: float = 300
+    # Seconds between outbox checks when no notification comes
+    outbox_poll_interval: float = 5
+    # Pending outbox rows over which observers skip their updates until the processor catches
+    # up, 0 for no limit. If not set, a batch for every 30 seconds of outbox_lease: a backlog
+    # the processor works off well within a lease, so claimed rows don't expire while queued
+    outbox_max_depth: int | None = None
+
+    # Worker processes decoding logs, grouping events and recomputing account metrics off the
+    # event loop, see app.offload. 0 runs them in the loop
+    offload_workers: int = 0
+    # Logs or accounts of a batch below which it is processed in the loop anyway
+    offload_min_batch: int = 5_000
+
+    # Port of the Prometheus /metrics endpoint, not served if not set
+    metrics_port: int | None = None
+    # Directory to record chain RPC, ABI and Bot API traffic to, for offline replay, see
+    # app.traffic. Nothing is recorded if not set
+    traffic_record_dir: str | None = None
+    # Warn about observer ticks, worker items and bot updates running more statements than
+    # their budget, see app.data_access.query_stats
+    query_debug: bool = False
+    # Seconds the event loop may be blocked before the stall is logged with the blocking task
+    # and stack, see app.loop_monitor. 0 to not monitor the loop
+    loop_stall_threshold: float = 0.5
+    # Telegram user ids allowed to run admin commands, e.g. /profile
+    admin_ids: list[int] = []
+    # Directory profiles are written to, see app.profiling
+    profile_dir: str = "profiles"
+    # Runs profiled after SIGUSR1, observer ticks, or SIGUSR2, worker items
+    profile_count: int = 1
+
+    @field_validator("observer_chain", "metrics_port", "outbox_max_depth", mode="before")
+    @classmethod
+    def _empty_as_none(cls, value: str | None) -> str | None:
+        return value or None
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        if self.outbox_max_depth is None:
+            self.outbox_max_depth = self.outbox_batch_size * max(1, int(self.outbox_lease // 30))
         self.chains: dict[Chain, ChainConfig] = {}
 
         for chain in Chain.__members__.values():
@@ -1,3 +1,40 @@
+from app.data_access.load_plans import LoadPlan, LoadPlanType
+from app.data_access.notifications import (
+    ACCOUNT_OUTBOX_CHANNEL,
+    SNX_DATA_CHANNEL,
+    PgListener,
+    connect_dedicated,
+)
+from app.data_access.pool import metered_pool
+from app.data_access.query_stats import (
+    QUERY_BUDGETS,
+    QueryBudgetExceededError,
+    QueryStats,
+    expect_queries,
+    instrument_engine,
+    set_query_debug,
+    track_queries,
+)
+from app.data_access.replica import ReplicaMonitor
 from app.data_access.unit_of_work import UnitOfWork, UOWFactoryType, uow_factory_maker
 
-__all__ = ["UnitOfWork", "UOWFactoryType", "uow_factory_maker"]
+__all__ = [
+    "ACCOUNT_OUTBOX_CHANNEL",
+    "QUERY_BUDGETS",
+    "SNX_DATA_CHANNEL",
+    "LoadPlan",
+    "LoadPlanType",
+    "PgListener",
+    "QueryBudgetExceededError",
+    "QueryStats",
+    "ReplicaMonitor",
+    "UnitOfWork",
+    "UOWFactoryType",
+    "uow_factory_maker",
+    "connect_dedicated",
+    "metered_pool",
+    "expect_queries",
+    "instrument_engine",
+    "set_query_debug",
+    "track_queries",
+]
@@ -0,0 +1,28 @@
+from collections.abc import Sequence
+
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.sql.base import ExecutableOption
+
+from app.models import Chat, ChatAccount
+
+LoadPlanType = Sequence[ExecutableOption]
+
+
+class LoadPlan:
+    """Named relationship graphs, one per use case.
+
+    Everything not listed in a plan stays unloaded, so reading it outside
+    the session fails loudly instead of dragging the whole graph along. The
+    update processor reads plain records instead, see app.models RECORDS.
+    """
+
+    # Chat -> chat accounts -> accounts
+    DASHBOARD: LoadPlanType = (selectinload(Chat.chat_accounts).joinedload(ChatAccount.account),)
+    ACCOUNTS_MENU: LoadPlanType = DASHBOARD
+
+    # ChatAccount -> chat, account, notifs
+    CHAT_ACCOUNT_MENU: LoadPlanType = (
+        joinedload(ChatAccount.chat),
+        joinedload(ChatAccount.account),
+        selectinload(ChatAccount.notifs),
+    )
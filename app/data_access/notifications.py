@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+
+import psycopg
+from psycopg import sql
+from sqlalchemy import make_url
+
+logger = logging.getLogger(__name__)
+
+# Payload: empty
+ACCOUNT_OUTBOX_CHANNEL = "account_outbox"
+# Payload: chain
+SNX_DATA_CHANNEL = "snx_data"
+
+NotificationHandlerType = Callable[[str | None], Awaitable[None]]
+
+
+async def connect_dedicated(db_connection: str) -> psycopg.AsyncConnection:
+    """Autocommit connection outside the engine pool, for LISTEN and advisory locks"""
+    conninfo = make_url(db_connection).set(drivername="postgresql").render_as_string(False)
+    return await psycopg.AsyncConnection.connect(conninfo, autocommit=True)
+
+
+class PgListener:
+    """LISTENs on a dedicated connection and passes notification payloads to handlers.
+
+    Notifications sent while disconnected are lost, so after every (re)connect
+    handlers are called with None to catch up from the database.
+    """
+
+    def __init__(self, db_connection: str, reconnect_delay: float = 5) -> None:
+        self._db_connection: str = db_connection
+        self._reconnect_delay: float = reconnect_delay
+        self._handlers: dict[str, list[NotificationHandlerType]] = {}
+
+    def subscribe(self, channel: str, handler: NotificationHandlerType) -> None:
+        self._handlers.setdefault(channel, []).append(handler)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self._listen()
+            except Exception as e:
+                logger.warning(f"Notification listener disconnected: {e!r}")
+            await asyncio.sleep(self._reconnect_delay)
+
+    async def _listen(self) -> None:
+        async with await connect_dedicated(self._db_connection) as conn:
+            for channel in self._handlers:
+                await conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+            for channel in self._handlers:
+                await self._dispatch(channel, None)
+            async for notify in conn.notifies():
+                await self._dispatch(notify.channel, notify.payload)
+
+    async def _dispatch(self, channel: str, payload: str | None) -> None:
+        for handler in self._handlers.get(channel, []):
+            # noinspection PyBroadException
+            try:
+                await handler(payload)
+            except Exception as e:
+                logger.error(f"Failed to handle {channel} notification", exc_info=e)
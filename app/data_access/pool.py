@@ -0,0 +1,25 @@
+import time
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
+
+from app import metrics
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """Records how long checkouts wait for a free connection, or for a new one to connect"""
+
+    metrics_name: str = "primary"
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.DB_POOL_CHECKOUT_SECONDS.observe(
+                time.perf_counter() - started, pool=self.metrics_name
+            )
+
+
+def metered_pool(name: str) -> type[MeteredQueuePool]:
+    """:returns poolclass for create_async_engine, its metrics labeled with name"""
+    return type(f"{name.title()}QueuePool", (MeteredQueuePool,), {"metrics_name": name})
@@ -0,0 +1,146 @@
+"""Statements, rows and time spent per logical operation.
+
+Engines passed to instrument_engine count every statement into the operation
+of the current context, opened with track_queries: an observer tick, a worker
+item, a bot update. Totals go to the operation histograms in app.metrics.
+
+In debug mode, see Config.query_debug, an operation over its QUERY_BUDGETS
+budget logs a warning with its most repeated statement, the usual shape of an
+N+1. expect_queries asserts a budget instead, for benchmarks and tests.
+"""
+
+import logging
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# statements per operation, over them is warned about in debug mode
+QUERY_BUDGETS: dict[str, int] = {
+    "observer_tick": 60,
+    "worker_item": 30,
+    "handler": 15,
+}
+
+_QUERY_STARTED_KEY = "query_stats_started"
+
+_debug: bool = False
+_current: ContextVar["QueryStats | None"] = ContextVar("query_stats", default=None)
+
+
+@dataclass
+class QueryStats:
+    operation: str
+    statements: int = 0
+    # fetched or affected, as reported by the driver
+    rows: int = 0
+    seconds: float = 0
+    units_of_work: int = 0
+    # in debug mode and under expect_queries
+    keep_statements: bool = False
+    # statement: executions, if keep_statements
+    repeated: Counter = field(default_factory=Counter)
+
+    def most_repeated(self) -> tuple[str, int] | None:
+        return self.repeated.most_common(1)[0] if self.repeated else None
+
+
+class QueryBudgetExceededError(AssertionError):
+    pass
+
+
+def set_query_debug(enabled: bool) -> None:
+    global _debug
+    _debug = enabled
+
+
+def _before_cursor_execute(conn, *_) -> None:  # noqa: ANN001
+    conn.info.setdefault(_QUERY_STARTED_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement: str, *_) -> None:  # noqa: ANN001
+    elapsed = time.perf_counter() - conn.info[_QUERY_STARTED_KEY].pop()
+    stats = _current.get()
+    if stats is None:
+        return
+    stats.statements += 1
+    stats.seconds += elapsed
+    if cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+    if stats.keep_statements:
+        stats.repeated[statement] += 1
+
+
+def instrument_engine(engine: AsyncEngine) -> AsyncEngine:
+    """Counts the statements of engine into the current operation"""
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    return engine
+
+
+def note_unit_of_work() -> None:
+    if (stats := _current.get()) is not None:
+        stats.units_of_work += 1
+
+
+@contextmanager
+def _collect(operation: str, keep_statements: bool = False) -> Iterator[QueryStats]:
+    parent = _current.get()
+    keep_statements = keep_statements or _debug or (parent is not None and parent.keep_statements)
+    stats = QueryStats(operation, keep_statements=keep_statements)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+        if parent is not None:
+            parent.statements += stats.statements
+            parent.rows += stats.rows
+            parent.seconds += stats.seconds
+            parent.units_of_work += stats.units_of_work
+            parent.repeated.update(stats.repeated)
+
+
+def _describe(stats: QueryStats) -> str:
+    description = (
+        f"{stats.statements} statements, {stats.rows} rows, {stats.seconds * 1000:.1f}ms, "
+        f"{stats.units_of_work} units of work"
+    )
+    if most_repeated := stats.most_repeated():
+        statement, count = most_repeated
+        description += f", {count}x {' '.join(statement.split())[:200]}"
+    return description
+
+
+@contextmanager
+def track_queries(operation: str, detail: str = "") -> Iterator[QueryStats]:
+    """Counts the statements run in the context as operation.
+
+    :param detail: identifies the instance in budget warnings, e.g. a chain
+    """
+    with _collect(operation) as stats:
+        yield stats
+    metrics.DB_OPERATION_STATEMENTS.observe(stats.statements, operation=operation)
+    metrics.DB_OPERATION_SECONDS.observe(stats.seconds, operation=operation)
+    budget = QUERY_BUDGETS.get(operation)
+    if _debug and budget is not None and stats.statements > budget:
+        name = f"{operation} {detail}" if detail else operation
+        logger.warning(f"{name} over its budget of {budget} statements: {_describe(stats)}")
+
+
+@contextmanager
+def expect_queries(max_statements: int) -> Iterator[QueryStats]:
+    """:raises QueryBudgetExceededError: if the context runs more than max_statements"""
+    with _collect("expect_queries", keep_statements=True) as stats:
+        yield stats
+    if stats.statements > max_statements:
+        raise QueryBudgetExceededError(f"expected at most {max_statements}: {_describe(stats)}")
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+CHECK_TIMEOUT = 2
+
+# Seconds behind the primary, 0 once everything received is replayed
+# or when pointed at a primary, NULL before anything was replayed
+REPLICATION_LAG_QUERY = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+        THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+    """
+)
+
+
+class ReplicaMonitor:
+    """Tells whether reads can go to the replica.
+
+    The replica lag is checked at most every check_interval seconds, callers in
+    between share the last result. A replica behind by more than max_lag seconds,
+    or failing the check, is not used until a later check passes. Neither is it
+    for reads that must see a write made less than max_lag seconds ago.
+    """
+
+    def __init__(self, engine: AsyncEngine, max_lag: float = 5, check_interval: float = 1) -> None:
+        self._engine: AsyncEngine = engine
+        self._max_lag: float = max_lag
+        self._check_interval: float = check_interval
+        self._lock: asyncio.Lock = asyncio.Lock()
+        self._checked_at: float = float("-inf")
+        # until the first check, so its failure is logged
+        self._usable: bool = True
+
+    async def usable(self, written_at: float | None = None) -> bool:
+        """:param written_at: time.monotonic() of a write the reads must see"""
+        if written_at is not None and time.monotonic() - written_at < self._max_lag:
+            return False
+        if time.monotonic() - self._checked_at < self._check_interval:
+            return self._usable
+        async with self._lock:
+            if time.monotonic() - self._checked_at >= self._check_interval:
+                self._usable = await self._check()
+                self._checked_at = time.monotonic()
+        return self._usable
+
+    async def _check(self) -> bool:
+        try:
+            async with asyncio.timeout(CHECK_TIMEOUT), self._engine.connect() as conn:
+                lag = (await conn.execute(REPLICATION_LAG_QUERY)).scalar()
+        except Exception as e:
+            if self._usable:
+                logger.warning(f"Replica unavailable, reading from the primary: {e!r}")
+            return False
+        usable = lag is not None and lag <= self._max_lag
+        if self._usable and not usable:
+            logger.warning(f"Replica lags {lag}s, reading from the primary")
+        return usable
@@ -1,15 +1,47 @@
+import datetime
 import uuid
-from collections.abc import Iterable, Sequence
+from collections.abc import Iterable, Mapping, Sequence
 from typing import TypeVar
 
 from eth_typing import Address
-from sqlalchemy import BinaryExpression, Select, and_, select
+from sqlalchemy import (
+    BinaryExpression,
+    Select,
+    and_,
+    bindparam,
+    delete,
+    exists,
+    func,
+    literal_column,
+    or_,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import InstrumentedAttribute
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.selectable import TableValuedAlias
 from sqlmodel import SQLModel
 
-from app.common import Chain
-from app.models import Account, Chat, ChatAccount, Notif
+from app.common import AccountUpdate, Chain, SNXData
+from app.data_access.load_plans import LoadPlanType
+from app.data_access.notifications import ACCOUNT_OUTBOX_CHANNEL, SNX_DATA_CHANNEL
+from app.models import (
+    ACCOUNT_RECORD_FIELDS,
+    Account,
+    AccountOutbox,
+    AccountRecord,
+    AccountSnapshot,
+    AccountSnapshotHourly,
+    ChainState,
+    Chat,
+    ChatAccount,
+    Notif,
+    NotifRecord,
+)
 
 M = TypeVar("M", bound=SQLModel)
 # For PyCharm doesn't complain about type mismatches
@@ -27,13 +59,15 @@ class GenericSqlRepository[M]:
         res = await self._session.execute(query)
         return res.scalar()
 
-    async def get_one_or_none(self, *criteria: BinaryCriteriaType) -> M | None:
-        query = self._assemble_query(*criteria)
+    async def get_one_or_none(
+        self, *criteria: BinaryCriteriaType, load: LoadPlanType = ()
+    ) -> M | None:
+        query = self._assemble_query(*criteria, load=load)
         res = await self._session.execute(query)
         return res.scalar_one_or_none()
 
-    async def get_all(self, *criteria: BinaryCriteriaType) -> Sequence[M]:
-        query = self._assemble_query(*criteria)
+    async def get_all(self, *criteria: BinaryCriteriaType, load: LoadPlanType = ()) -> Sequence[M]:
+        query = self._assemble_query(*criteria, load=load)
         res = await self._session.execute(query)
         return res.scalars().all()
 
@@ -104,6 +138,50 @@ class GenericSqlRepository[M]:
             chunk_size=chunk_size,
         )
 
+    async def update_all_versioned[R](
+        self,
+        records: Iterable[R],
+        fields: Sequence[str],
+        key: str = "id",
+        version: str = "version",
+    ) -> list[R]:
+        """Writes `fields` of every record in one set-based compare-and-swap UPDATE.
+
+        Each column travels as a single array parameter and is unnested on the server,
+        so the statement size doesn't depend on the number of records. Records are
+        matched by `key`, ORM state is not touched. They are models or plain records
+        with the fields as attributes, e.g. AccountRecord.
+        A row is written only if it still has the version its record was read with,
+        then its version is incremented, on the record too.
+        :returns records not written, their rows were changed or deleted since read
+        """
+        records_list = list(records)
+        if not records_list:
+            return []
+
+        values = self._unnest(
+            {
+                column: [getattr(record, column) for record in records_list]
+                for column in (key, version, *fields)
+            }
+        )
+        table = self._model.__table__
+        stmt = (
+            update(table)
+            .where(table.c[key] == values.c[key], table.c[version] == values.c[version])
+            .values({field: values.c[field] for field in fields} | {version: table.c[version] + 1})
+            .returning(table.c[key])
+        )
+        written = set((await self._session.execute(stmt)).scalars())
+
+        stale = []
+        for record in records_list:
+            if getattr(record, key) in written:
+                setattr(record, version, getattr(record, version) + 1)
+            else:
+                stale.append(record)
+        return stale
+
     async def merge(self, record: M) -> M:
         return await self._session.merge(record)
 
@@ -111,19 +189,36 @@ class GenericSqlRepository[M]:
         await self._session.delete(record)
         await self._session.flush()
 
-    def _assemble_query(self, *criteria: BinaryCriteriaType) -> Select:
+    async def _notify(self, channel: str, payload: str = "") -> None:
+        """Delivered to listeners when the transaction commits, dropped on rollback"""
+        await self._session.execute(select(func.pg_notify(channel, payload)))
+
+    def _unnest(self, columns: dict[str, Sequence]) -> TableValuedAlias:
+        """Rows as one array parameter per column, typed after the model's columns"""
+        table = self._model.__table__
+        arrays = [
+            bindparam(f"{column}_values", list(values), type_=ARRAY(table.c[column].type))
+            for column, values in columns.items()
+        ]
+        return func.unnest(*arrays).table_valued(*columns).render_derived()
+
+    def _assemble_query(self, *criteria: BinaryCriteriaType, load: LoadPlanType = ()) -> Select:
         stmt = select(self._model)
         if criteria:
             stmt = stmt.where(and_(*criteria))
+        if load:
+            stmt = stmt.options(*load)
         return stmt
 
 
 class GenericSqlRepositoryWithUUID(GenericSqlRepository[M]):
-    async def get_by_id_or_none(self, id_: uuid.UUID) -> M:
-        return await self.get_one_or_none(self._model.id == id_)
+    async def get_by_id_or_none(self, id_: uuid.UUID, load: LoadPlanType = ()) -> M:
+        return await self.get_one_or_none(self._model.id == id_, load=load)
 
-    async def get_all_by_ids(self, ids: Sequence[uuid.UUID]) -> Sequence[M]:
-        return await self.get_all(self._model.id.in_(ids))
+    async def get_all_by_ids(
+        self, ids: Sequence[uuid.UUID], load: LoadPlanType = ()
+    ) -> Sequence[M]:
+        return await self.get_all(self._model.id.in_(ids), load=load)
 
     async def get_ids(self, *criteria: BinaryCriteriaType) -> Sequence[uuid.UUID]:
         query = self._assemble_query(*criteria).with_only_columns(self._model.id)
@@ -136,6 +231,44 @@ class GenericSqlRepositoryWithUUID(GenericSqlRepository[M]):
             await self.delete(record)
 
 
+class DailyPartitionedSqlRepository(GenericSqlRepository[M]):
+    """For tables range partitioned by day, with one `<table>_p<YYYYMMDD>` partition per day"""
+
+    def _partition_name(self, day: datetime.date) -> str:
+        return f"{self._model.__tablename__}_p{day:%Y%m%d}"
+
+    async def create_partitions(self, days: Iterable[datetime.date]) -> None:
+        table = self._model.__tablename__
+        for day in days:
+            next_day = day + datetime.timedelta(days=1)
+            await self._session.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {self._partition_name(day)} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{day}') TO ('{next_day}')"
+                )
+            )
+
+    async def drop_partitions_before(self, day: datetime.date) -> list[str]:
+        """:returns dropped partitions"""
+        result = await self._session.execute(
+            text(
+                """
+                SELECT child.relname FROM pg_inherits
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE parent.relname = :table
+                """
+            ),
+            {"table": self._model.__tablename__},
+        )
+        dropped = []
+        for partition in sorted(result.scalars().all()):
+            if partition < self._partition_name(day):
+                await self._session.execute(text(f"DROP TABLE {partition}"))
+                dropped.append(partition)
+        return dropped
+
+
 class AccountRepository(GenericSqlRepositoryWithUUID[Account]):
     _model = Account
 
@@ -143,15 +276,143 @@ class AccountRepository(GenericSqlRepositoryWithUUID[Account]):
         self, address: Address | str, chain: Chain
     ) -> Account | None:
         return await self.get_one_or_none(
-            self._model.address == address, self._model.chain == chain
+            self._model.chain == chain, self._model.address == address
         )
 
-    async def get_all_addresses_for_chain(self, chain: Chain) -> Sequence[Address]:
+    async def get_records(self, *criteria: BinaryCriteriaType) -> list[AccountRecord]:
+        """Accounts as plain records, with a Core select of their columns"""
+        table = self._model.__table__
+        query = select(*(table.c[field] for field in ACCOUNT_RECORD_FIELDS))
+        if criteria:
+            query = query.where(and_(*criteria))
+        result = await self._session.execute(query)
+        return [AccountRecord(*row) for row in result.tuples()]
+
+    async def get_record_by_id_or_none(self, id_: uuid.UUID) -> AccountRecord | None:
+        records = await self.get_records(self._model.id == id_)
+        return records[0] if records else None
+
+    async def get_records_by_ids(self, ids: Sequence[uuid.UUID]) -> list[AccountRecord]:
+        return await self.get_records(self._model.id.in_(ids))
+
+    async def get_records_by_addresses(
+        self, addresses: Iterable[Address | str], chain: Chain
+    ) -> list[AccountRecord]:
+        return await self.get_records(
+            self._model.chain == chain, self._model.address.in_(list(addresses))
+        )
+
+    async def get_all_addresses_for_chain(
+        self, chain: Chain, inited: bool | None = None
+    ) -> Sequence[Address]:
         # noinspection PyTypeChecker
-        query = select(self._model.address).where(self._model.chain == chain).distinct()
+        query = select(self._model.address).where(self._model.chain == chain)
+        if inited is not None:
+            query = query.where(self._model.inited == inited)
         result = await self._session.execute(query)
         return [row[0] for row in result.all()]
 
+    async def create_if_not_exists(
+        self, address: Address | str, chain: Chain
+    ) -> tuple[uuid.UUID, bool]:
+        """:returns account id and whether the account was created"""
+        stmt = pg_insert(self._model).values(address=address, chain=chain)
+        # A no-op update instead of DO NOTHING, so RETURNING also yields the existing row
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self._model.chain, self._model.address],
+            set_={"address": stmt.excluded.address},
+        ).returning(self._model.id, literal_column("xmax = 0"))
+        result = await self._session.execute(stmt)
+        account_id, created = result.one()
+        return account_id, created
+
+
+class AccountSnapshotRepository(DailyPartitionedSqlRepository[AccountSnapshot]):
+    _model = AccountSnapshot
+
+    async def append_all(
+        self, accounts: Sequence[AccountRecord], observed_at: datetime.datetime
+    ) -> None:
+        if not accounts:
+            return
+
+        values = self._unnest(
+            {
+                "account_id": [account.id for account in accounts],
+                "observed_at": [observed_at] * len(accounts),
+                "c_ratio": [account.c_ratio for account in accounts],
+                "collateral": [account.collateral for account in accounts],
+                "debt": [account.debt for account in accounts],
+            }
+        )
+        stmt = pg_insert(self._model).from_select(list(values.c.keys()), select(values))
+        await self._session.execute(stmt.on_conflict_do_nothing())
+
+    async def rollup(self, since: datetime.datetime) -> None:
+        """Aggregates snapshots from the hour of `since` on into AccountSnapshotHourly"""
+        hour = func.date_trunc("hour", self._model.observed_at)
+
+        def last(column: InstrumentedAttribute) -> ColumnElement:
+            return func.array_agg(aggregate_order_by(column, self._model.observed_at.desc()))[1]
+
+        rows = (
+            select(
+                self._model.account_id,
+                hour,
+                func.min(self._model.c_ratio),
+                func.max(self._model.c_ratio),
+                last(self._model.c_ratio),
+                last(self._model.collateral),
+                last(self._model.debt),
+            )
+            .where(self._model.observed_at >= since.replace(minute=0, second=0, microsecond=0))
+            .group_by(self._model.account_id, hour)
+        )
+        hourly = AccountSnapshotHourly.__table__
+        stmt = pg_insert(hourly).from_select(
+            ["account_id", "hour", "c_ratio_min", "c_ratio_max", "c_ratio", "collateral", "debt"],
+            rows,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[hourly.c.account_id, hourly.c.hour],
+            set_={
+                column: stmt.excluded[column]
+                for column in ("c_ratio_min", "c_ratio_max", "c_ratio", "collateral", "debt")
+            },
+        )
+        await self._session.execute(stmt)
+
+
+class AccountSnapshotHourlyRepository(DailyPartitionedSqlRepository[AccountSnapshotHourly]):
+    _model = AccountSnapshotHourly
+
+    async def get_history(
+        self, account_ids: Sequence[uuid.UUID], since: datetime.datetime
+    ) -> Sequence[AccountSnapshotHourly]:
+        query = (
+            self._assemble_query(
+                self._model.account_id.in_(account_ids), self._model.hour >= since
+            )
+        ).order_by(self._model.hour)
+        res = await self._session.execute(query)
+        return res.scalars().all()
+
+
+class ChainStateRepository(GenericSqlRepository[ChainState]):
+    _model = ChainState
+
+    async def save(self, snx_data: SNXData) -> None:
+        values = {
+            "snx_price": snx_data.snx_price,
+            "sds_price": snx_data.sds_price,
+            "period_start": snx_data.period_start,
+            "period_end": snx_data.period_end,
+        }
+        stmt = pg_insert(self._model).values(chain=snx_data.chain, **values)
+        stmt = stmt.on_conflict_do_update(index_elements=[self._model.chain], set_=values)
+        await self._session.execute(stmt)
+        await self._notify(SNX_DATA_CHANNEL, snx_data.chain)
+
 
 class ChatRepository(GenericSqlRepository[Chat]):
     _model = Chat
@@ -163,3 +424,140 @@ class ChatAccountRepository(GenericSqlRepositoryWithUUID[ChatAccount]):
 
 class NotifRepository(GenericSqlRepositoryWithUUID[Notif]):
     _model = Notif
+
+    async def get_subscriptions(
+        self, account_id: uuid.UUID
+    ) -> tuple[list[int], list[NotifRecord]]:
+        """Chats following an account and their notifs on it, with one Core select
+
+        :returns chat ids, notifs
+        """
+        query = (
+            select(ChatAccount.chat_id, Notif.id, Notif.type, Notif.params, Notif.enabled)
+            .select_from(ChatAccount)
+            .outerjoin(Notif, Notif.chat_account_id == ChatAccount.id)
+            .where(ChatAccount.account_id == account_id)
+        )
+        # dict keeps the chats in order, once each
+        chat_ids, notifs = {}, []
+        for chat_id, notif_id, type_, params, enabled in await self._session.execute(query):
+            chat_ids[chat_id] = None
+            if notif_id is not None:
+                notifs.append(NotifRecord(notif_id, type_, params, enabled, chat_id))
+        return list(chat_ids), notifs
+
+    async def set_enabled(self, ids: Sequence[uuid.UUID], enabled: bool) -> None:
+        if not ids:
+            return
+        await self._session.execute(
+            update(self._model)
+            .where(self._model.id.in_(ids))
+            .values(enabled=enabled)
+            .execution_options(synchronize_session=False)
+        )
+
+
+class AccountOutboxRepository(GenericSqlRepository[AccountOutbox]):
+    _model = AccountOutbox
+
+    async def put_all(self, updates: Mapping[uuid.UUID, AccountUpdate]) -> None:
+        """Queues updates, merging them into rows of the same accounts that are still pending"""
+        if not updates:
+            return
+
+        values = self._unnest(
+            {
+                "account_id": updates.keys(),
+                "observed_at": [update.observed_at for update in updates.values()],
+                "urgent": [update.urgent for update in updates.values()],
+            }
+        )
+        table = self._model.__table__
+        # accounts deleted since they were loaded are skipped instead of failing the batch
+        rows = select(values).join(Account, Account.id == values.c.account_id)
+        stmt = pg_insert(table).from_select(["account_id", "observed_at", "urgent"], rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.account_id],
+            set_={
+                "observed_at": func.least(table.c.observed_at, stmt.excluded.observed_at),
+                "urgent": table.c.urgent | stmt.excluded.urgent,
+                "seq": table.c.seq + 1,
+            },
+        )
+        await self._session.execute(stmt)
+        await self._notify(ACCOUNT_OUTBOX_CHANNEL)
+
+    async def claim(self, limit: int, lease: float) -> list[AccountOutbox]:
+        """Locks up to `limit` pending rows for `lease` seconds, urgent and oldest first.
+
+        Rows claimed by other consumers are skipped, rows whose lease expired
+        are claimed again.
+        """
+        now = func.localtimestamp()
+        pending = (
+            select(self._model.account_id)
+            .where(or_(self._model.locked_until.is_(None), self._model.locked_until < now))
+            .order_by(self._model.urgent.desc(), self._model.observed_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        stmt = (
+            update(self._model)
+            .where(self._model.account_id.in_(pending.scalar_subquery()))
+            .values(locked_until=now + datetime.timedelta(seconds=lease))
+            .returning(self._model)
+            .execution_options(synchronize_session=False)
+        )
+        result = await self._session.execute(stmt)
+        claimed = list(result.scalars().all())
+        claimed.sort(key=lambda row: (not row.urgent, row.observed_at))
+        return claimed
+
+    async def pending_stats(self) -> tuple[int, float | None]:
+        """:returns pending rows, claimed ones included, and observed_at of the oldest"""
+        result = await self._session.execute(
+            select(func.count(), func.min(self._model.observed_at))
+        )
+        return tuple(result.one())
+
+    async def deeper_than(self, depth: int) -> bool:
+        """Whether more than `depth` rows are pending, counting no further"""
+        result = await self._session.execute(
+            select(exists(select(self._model.account_id).offset(depth)))
+        )
+        return result.scalar_one()
+
+    async def ack(self, claimed: Sequence[AccountOutbox]) -> None:
+        """Deletes processed rows and releases the ones updated after they were claimed"""
+        if not claimed:
+            return
+
+        values = self._unnest(
+            {
+                "account_id": [row.account_id for row in claimed],
+                "seq": [row.seq for row in claimed],
+            }
+        )
+        table = self._model.__table__
+        await self._session.execute(
+            delete(table).where(
+                table.c.account_id == values.c.account_id, table.c.seq == values.c.seq
+            )
+        )
+        await self._session.execute(
+            update(table)
+            .where(table.c.account_id.in_([row.account_id for row in claimed]))
+            .values(locked_until=None)
+        )
+
+    async def release(self, claimed: Sequence[AccountOutbox], delay: float) -> None:
+        """Makes claimed rows claimable again in `delay` seconds instead of at lease expiry"""
+        if not claimed:
+            return
+
+        await self._session.execute(
+            update(self._model)
+            .where(self._model.account_id.in_([row.account_id for row in claimed]))
+            .values(locked_until=func.localtimestamp() + datetime.timedelta(seconds=delay))
+            .execution_options(synchronize_session=False)
+        )
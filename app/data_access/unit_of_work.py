@@ -1,11 +1,16 @@
 import asyncio
-from collections.abc import Callable
-from typing import Self, TypeVar
+from typing import Protocol, Self, TypeVar
 
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
+from app.data_access.query_stats import note_unit_of_work
+from app.data_access.replica import ReplicaMonitor
 from app.data_access.repositories import (
+    AccountOutboxRepository,
     AccountRepository,
+    AccountSnapshotHourlyRepository,
+    AccountSnapshotRepository,
+    ChainStateRepository,
     ChatAccountRepository,
     ChatRepository,
     NotifRepository,
@@ -15,15 +20,49 @@ T = TypeVar("T")
 
 
 class UnitOfWork:
-    def __init__(self, session_factory: async_sessionmaker) -> None:
+    """Transaction over the repositories, committed on a clean exit.
+
+    A read_only unit of work reads from the replica when the monitor allows it,
+    otherwise from the primary, and is only closed: a rollback would expire the
+    objects it loaded, closing detaches them with their loaded state and the
+    pool ends the transaction. written_at is passed to the monitor, for reads
+    that must see an earlier write.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        replica_session_factory: async_sessionmaker | None = None,
+        replica_monitor: ReplicaMonitor | None = None,
+        read_only: bool = False,
+        written_at: float | None = None,
+    ) -> None:
         self._session_factory: async_sessionmaker = session_factory
+        self._replica_session_factory: async_sessionmaker | None = replica_session_factory
+        self._replica_monitor: ReplicaMonitor | None = replica_monitor
+        self._read_only: bool = read_only
+        self._written_at: float | None = written_at
 
     async def __aenter__(self) -> Self:
-        self._session: AsyncSession = self._session_factory()
+        note_unit_of_work()
+        session_factory = self._session_factory
+        if (
+            self._read_only
+            and self._replica_session_factory is not None
+            and await self._replica_monitor.usable(self._written_at)
+        ):
+            session_factory = self._replica_session_factory
+        self._session: AsyncSession = session_factory()
         self.accounts: AccountRepository = AccountRepository(self._session)
         self.chats: ChatRepository = ChatRepository(self._session)
         self.chat_accounts: ChatAccountRepository = ChatAccountRepository(self._session)
         self.notifs: NotifRepository = NotifRepository(self._session)
+        self.outbox: AccountOutboxRepository = AccountOutboxRepository(self._session)
+        self.chain_states: ChainStateRepository = ChainStateRepository(self._session)
+        self.snapshots: AccountSnapshotRepository = AccountSnapshotRepository(self._session)
+        self.snapshots_hourly: AccountSnapshotHourlyRepository = AccountSnapshotHourlyRepository(
+            self._session
+        )
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:  # noqa: ANN001
@@ -31,7 +70,7 @@ class UnitOfWork:
         try:
             if exc_val:
                 await self.rollback()
-            else:
+            elif not self._read_only:
                 await self.commit()
         finally:
             await self._close()
@@ -49,11 +88,18 @@ class UnitOfWork:
         await asyncio.shield(self._session.close())
 
 
-UOWFactoryType = Callable[[], UnitOfWork]
+class UOWFactoryType(Protocol):
+    def __call__(self, read_only: bool = False, written_at: float | None = None) -> UnitOfWork: ...
 
 
-def uow_factory_maker(session_factory: async_sessionmaker) -> UOWFactoryType:
-    def _create_uow() -> UnitOfWork:
-        return UnitOfWork(session_factory)
+def uow_factory_maker(
+    session_factory: async_sessionmaker,
+    replica_session_factory: async_sessionmaker | None = None,
+    replica_monitor: ReplicaMonitor | None = None,
+) -> UOWFactoryType:
+    def _create_uow(read_only: bool = False, written_at: float | None = None) -> UnitOfWork:
+        return UnitOfWork(
+            session_factory, replica_session_factory, replica_monitor, read_only, written_at
+        )
 
     return _create_uow
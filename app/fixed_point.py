@@ -0,0 +1,40 @@
+"""Account metrics as exact integers.
+
+Amounts keep their on-chain units: SNX, debt share and sUSD counts in WAD,
+collateral in WAD**2 (SNX count times SNX price), debt in WAD. C-ratios are
+integers in C_RATIO_UNIT. Floats appear only in config, user input and
+rendering, each converted once at that edge.
+"""
+
+WAD = 10**18
+# debt share price unit, as returned by the debt share contract
+SDS_PRICE_UNIT = 10**27
+C_RATIO_UNIT = 10**5
+
+
+def collateral(snx_count: int, snx_price: int) -> int:
+    return snx_count * snx_price
+
+
+def debt(sds_count: int, sds_price: int) -> int:
+    return sds_count * sds_price // SDS_PRICE_UNIT
+
+
+def c_ratio(collateral_: int, debt_: int) -> int:
+    """:returns collateral / debt in C_RATIO_UNIT, rounded half up, 0 without debt"""
+    if debt_ == 0:
+        return 0
+    denominator = debt_ * WAD
+    return (2 * collateral_ * C_RATIO_UNIT + denominator) // (2 * denominator)
+
+
+def c_ratio_from_float(ratio: float) -> int:
+    return round(ratio * C_RATIO_UNIT)
+
+
+def c_ratio_percent(ratio: int, digits: int = 1) -> float:
+    return round(ratio * 100 / C_RATIO_UNIT, digits)
+
+
+def from_wad(amount: int, digits: int = 2) -> float:
+    return round(amount / WAD, digits)
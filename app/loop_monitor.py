@@ -0,0 +1,128 @@
+"""Event loop lag sampling and attribution of stalls.
+
+LoopMonitor sleeps for an interval in the loop and records how late it wakes
+up. A watchdog thread checks those wake-ups: once one is late by the stall
+threshold the loop is blocked, and the thread captures what the loop thread is
+running, the current task and the Python stack of the blocking code. When the
+loop is back the stall is logged with its full duration and counted by the
+coroutine the task runs, which names the subsystem, e.g.
+AccountUpdateProcessor.worker or Application.process_update.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from types import FrameType
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# seconds between samples
+SAMPLE_INTERVAL = 0.1
+# innermost frames of the blocking code to log
+STACK_LIMIT = 30
+
+
+@dataclass
+class Stall:
+    # the wake-up the stall came after, see LoopMonitor._last_sample
+    after: float
+    task: str
+    coroutine: str
+    stack: str
+
+
+def _coroutine_name(task: asyncio.Task | None) -> str:
+    if task is None:
+        # a plain callback, e.g. of a protocol or call_soon
+        return "callback"
+    coroutine = task.get_coro()
+    return getattr(coroutine, "__qualname__", type(coroutine).__name__)
+
+
+def _callback_stack(frame: FrameType) -> list[str]:
+    """Formatted frames of the running callback, without the event loop's frames"""
+    stack = traceback.extract_stack(frame, STACK_LIMIT)
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i].filename == asyncio.events.__file__ and stack[i].name == "_run":
+            stack = traceback.StackSummary.from_list(stack[i + 1 :])
+            break
+    return stack.format()
+
+
+class LoopMonitor:
+    def __init__(self, stall_threshold: float, interval: float = SAMPLE_INTERVAL) -> None:
+        """:param stall_threshold: seconds the loop may be blocked before the stall is logged"""
+        self._stall_threshold: float = stall_threshold
+        self._interval: float = interval
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        # time.monotonic() of the last wake-up
+        self._last_sample: float = time.monotonic()
+        self._stall: Stall | None = None
+        self._stopped: threading.Event = threading.Event()
+
+    async def run(self) -> None:
+        """Samples the running loop until cancelled"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_sample = time.monotonic()
+        self._stopped.clear()
+        watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        watchdog.start()
+        try:
+            while True:
+                await asyncio.sleep(self._interval)
+                self._sample()
+        finally:
+            self._stopped.set()
+
+    def _sample(self) -> None:
+        now, last_sample = time.monotonic(), self._last_sample
+        lag = max(now - last_sample - self._interval, 0)
+        self._last_sample = now
+        metrics.LOOP_LAG_SECONDS.observe(lag)
+        if lag < self._stall_threshold:
+            return
+        stall, self._stall = self._stall, None
+        if stall and stall.after != last_sample:
+            # captured late, during an earlier stall
+            stall = None
+        # the watchdog may also not have caught a stall just over the threshold
+        coroutine = stall.coroutine if stall else "unknown"
+        metrics.LOOP_STALLS.inc(coroutine=coroutine)
+        metrics.LOOP_STALL_SECONDS.inc(lag, coroutine=coroutine)
+        if stall:
+            logger.warning(
+                f"Event loop blocked for {lag:.3f}s by task {stall.task} running "
+                f"{stall.coroutine}, stack:\n{stall.stack}"
+            )
+        else:
+            logger.warning(f"Event loop blocked for {lag:.3f}s")
+
+    def _watch(self) -> None:
+        check_interval = min(self._interval, self._stall_threshold) / 2
+        while not self._stopped.wait(check_interval):
+            last_sample = self._last_sample
+            blocked = time.monotonic() - last_sample - self._interval
+            if blocked >= self._stall_threshold and (
+                self._stall is None or self._stall.after != last_sample
+            ):
+                self._stall = self._capture(last_sample)
+
+    def _capture(self, after: float) -> Stall:
+        # read only, from another thread: the task and frames may change while being read
+        task = asyncio.current_task(self._loop)
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = _callback_stack(frame) if frame else []
+        return Stall(
+            after=after,
+            task=task.get_name() if task else "-",
+            coroutine=_coroutine_name(task),
+            stack="".join(stack),
+        )
@@ -1,6 +1,10 @@
+import asyncio
 import logging
 
-from app.bootstrap import bootstrap
+from dotenv import load_dotenv
+
+from app.bootstrap import bootstrap, run_observers, run_worker
+from app.config import AppRole, Config
 
 log_format = "[%(asctime)s] [%(name)s] [%(levelname)s] %(message)s"
 date_format = "%Y-%m-%d %H:%M:%S"
@@ -10,5 +14,13 @@ logging.basicConfig(format=log_format, datefmt=date_format, level=logging.INFO)
 
 
 if __name__ == "__main__":
-    app = bootstrap()
-    app.run_polling()
+    load_dotenv()
+    config = Config()
+    match config.app_role:
+        case AppRole.observer:
+            asyncio.run(run_observers(config))
+        case AppRole.worker:
+            asyncio.run(run_worker(config))
+        case _:
+            app = bootstrap(config)
+            app.run_polling()
@@ -0,0 +1,259 @@
+"""Process metrics in the Prometheus text format.
+
+Metrics are always recorded in memory, the /metrics endpoint is served only
+when Config.metrics_port is set. Collectors registered with add_collector run
+before each scrape, for values read from the database rather than recorded.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections.abc import Awaitable, Callable, Iterator, Sequence
+from contextlib import contextmanager
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CollectorType = Callable[[], Awaitable[None]]
+
+_registry: list["_Metric"] = []
+_collectors: list[CollectorType] = []
+
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict[str, object]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class _Metric:
+    type_: str
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name: str = name
+        self._documentation: str = documentation
+        self._labelnames: tuple[str, ...] = tuple(labelnames)
+        # label values: value
+        self._values: dict[tuple[str, ...], object] = {}
+        _registry.append(self)
+
+    def _key(self, labels: dict[str, object]) -> tuple[str, ...]:
+        if labels.keys() != set(self._labelnames):
+            raise ValueError(f"{self.name} takes labels {self._labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self._labelnames)
+
+    def _samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        for key, value in self._values.items():
+            yield self.name, dict(zip(self._labelnames, key, strict=True)), value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self._documentation}", f"# TYPE {self.name} {self.type_}"]
+        for name, labels, value in self._samples():
+            lines.append(f"{name}{_format_labels(labels)} {float(value)!r}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type_ = "counter"
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type_ = "gauge"
+
+    def set(self, value: float, **labels: object) -> None:
+        self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type_ = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._buckets: tuple[float, ...] = (*sorted(buckets), math.inf)
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        # per bucket counts, then sum
+        if key not in self._values:
+            self._values[key] = [0] * len(self._buckets) + [0.0]
+        observed = self._values[key]
+        for i, bound in enumerate(self._buckets):
+            if value <= bound:
+                observed[i] += 1
+                break
+        observed[-1] += value
+
+    @contextmanager
+    def time(self, **labels: object) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        for key, observed in self._values.items():
+            labels = dict(zip(self._labelnames, key, strict=True))
+            cumulative = 0
+            for bound, count in zip(self._buckets, observed, strict=False):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                yield f"{self.name}_bucket", labels | {"le": le}, cumulative
+            yield f"{self.name}_sum", labels, observed[-1]
+            yield f"{self.name}_count", labels, cumulative
+
+
+# OBSERVER
+RPC_CALL_SECONDS = Histogram(
+    "snx_rpc_call_seconds",
+    "Contract call attempts by function and outcome, ok or error",
+    ["chain", "function", "outcome"],
+)
+GET_LOGS_BLOCKS = Histogram(
+    "snx_get_logs_blocks",
+    "Block range of get_logs requests",
+    ["chain", "event"],
+    buckets=(1, 10, 50, 100, 500, 1_000, 5_000, 10_000),
+)
+GET_LOGS_EVENTS = Histogram(
+    "snx_get_logs_events",
+    "Events returned by get_logs requests",
+    ["chain", "event"],
+    buckets=(0, 1, 10, 100, 1_000, 10_000),
+)
+OBSERVER_PHASE_SECONDS = Histogram(
+    "snx_observer_phase_seconds",
+    "StakingObserver update duration by phase",
+    ["chain", "phase"],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600),
+)
+OBSERVER_LAST_UPDATE = Gauge(
+    "snx_observer_last_update_timestamp_seconds",
+    "Unix time the last observer update completed",
+    ["chain"],
+)
+OFFLOAD_SECONDS = Histogram(
+    "snx_offload_seconds",
+    "CPU-heavy observer stages by where they ran, in the loop or a worker process",
+    ["stage", "where"],
+)
+
+# UPDATE PROCESSOR
+OUTBOX_DEPTH = Gauge("snx_outbox_depth", "Account updates waiting for the update processor")
+OUTBOX_OLDEST_SECONDS = Gauge(
+    "snx_outbox_oldest_seconds", "Seconds since the oldest waiting account update was observed"
+)
+OBSERVER_BACKPRESSURE = Counter(
+    "snx_observer_backpressure_total",
+    "Observer updates skipped while the outbox was over Config.outbox_max_depth",
+    ["chain"],
+)
+UPDATE_PROCESSING_SECONDS = Histogram(
+    "snx_account_update_processing_seconds",
+    "Dashboards and notif evaluation of one account update",
+)
+NOTIF_LATENCY_SECONDS = Histogram(
+    "snx_notif_latency_seconds",
+    "Seconds from an account update being observed, at its block for liquidation flags, to its "
+    "notif message being sent, by lane, urgent or regular",
+    ["lane"],
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+UPDATE_LATENCY_SECONDS = Histogram(
+    "snx_account_update_latency_seconds",
+    "Seconds from an account update being observed to its notifs being sent and acked",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+
+# TELEGRAM
+TELEGRAM_REQUESTS = Counter(
+    "snx_telegram_requests_total",
+    "Bot API requests by method and outcome, ok, retry_after or error",
+    ["method", "outcome"],
+)
+
+# DATABASE
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "snx_db_pool_checkout_seconds",
+    "Wait for a pooled connection, including connecting a new one",
+    ["pool"],
+)
+DB_OPERATION_STATEMENTS = Histogram(
+    "snx_db_operation_statements",
+    "Statements run by an operation: observer tick, worker item or bot update",
+    ["operation"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+DB_OPERATION_SECONDS = Histogram(
+    "snx_db_operation_seconds",
+    "Time in statements of an operation, see snx_db_operation_statements",
+    ["operation"],
+)
+
+# EVENT LOOP
+LOOP_LAG_SECONDS = Histogram(
+    "snx_event_loop_lag_seconds",
+    "Delay of the loop monitor's wake-ups, how long ready callbacks wait",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+LOOP_STALLS = Counter(
+    "snx_event_loop_stalls_total",
+    "Event loop blocked over Config.loop_stall_threshold, by the coroutine of the running task",
+    ["coroutine"],
+)
+LOOP_STALL_SECONDS = Counter(
+    "snx_event_loop_stall_seconds_total",
+    "Seconds of the stalls in snx_event_loop_stalls_total",
+    ["coroutine"],
+)
+
+
+def add_collector(collector: CollectorType) -> None:
+    _collectors.append(collector)
+
+
+async def render() -> str:
+    for collector in _collectors:
+        # noinspection PyBroadException
+        try:
+            await collector()
+        except Exception as e:
+            logger.warning(f"Metrics collector failed: {e!r}")
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+async def _metrics_handler(_: web.Request) -> web.Response:
+    return web.Response(text=await render(), content_type="text/plain", charset="utf-8")
+
+
+async def run_metrics_server(port: int) -> None:
+    """Serves /metrics on port until cancelled"""
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, port=port).start()
+        logger.info(f"Metrics served on :{port}/metrics")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -1,15 +1,29 @@
 import datetime
 import uuid
+from dataclasses import dataclass, fields
 from enum import StrEnum
 from typing import TypedDict
 
-from pydantic import condecimal
-from sqlalchemy import BigInteger, Column, text
+from sqlalchemy import BigInteger, Column, Index, Numeric, TypeDecorator, text
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlmodel import Field, Relationship, SQLModel
 
 from app.common import Chain
 
+# Relationships are loaded on demand. Queries state the graph they need
+# with a plan from app.data_access.load_plans. Bulk paths read plain records
+# instead, see RECORDS.
+
+
+class IntNumeric(TypeDecorator):
+    """On-chain amount, NUMERIC(50, 0) read back as int, see app.fixed_point"""
+
+    impl = Numeric(50, 0)
+    cache_ok = True
+
+    def process_result_value(self, value, dialect) -> int | None:  # noqa
+        return None if value is None else int(value)
+
 
 class UUIDModel(SQLModel, table=False):
     id: uuid.UUID = Field(
@@ -25,32 +39,84 @@ class UUIDModel(SQLModel, table=False):
 
 
 class Account(UUIDModel, table=True):
-    address: str = Field(index=True)
-    chain: Chain = Field()
-    c_ratio: float = Field(default=0, sa_column_kwargs={"server_default": "0"})
-    snx_count: condecimal(max_digits=50, decimal_places=0) = Field(
-        default=0, sa_column_kwargs={"server_default": "0"}
-    )
-    collateral: condecimal(max_digits=50, decimal_places=0) = Field(
-        default=0, sa_column_kwargs={"server_default": "0"}
+    __table_args__ = (
+        # Covers point lookups, per chain address scans and the creation upsert
+        Index(
+            "ix_account_chain_address", "chain", "address", unique=True, postgresql_include=["id"]
+        ),
     )
-    sds_count: condecimal(max_digits=50, decimal_places=0) = Field(
-        default=0, sa_column_kwargs={"server_default": "0"}
-    )
-    debt: condecimal(max_digits=50, decimal_places=0) = Field(
-        default=0, sa_column_kwargs={"server_default": "0"}
+
+    address: str = Field()
+    chain: Chain = Field()
+    # in app.fixed_point.C_RATIO_UNIT
+    c_ratio: int = Field(default=0, sa_type=BigInteger, sa_column_kwargs={"server_default": "0"})
+    snx_count: int = Field(default=0, sa_type=IntNumeric, sa_column_kwargs={"server_default": "0"})
+    collateral: int = Field(
+        default=0, sa_type=IntNumeric, sa_column_kwargs={"server_default": "0"}
     )
-    claimable_snx: condecimal(max_digits=50, decimal_places=0) = Field(
-        default=0, sa_column_kwargs={"server_default": "0"}
+    sds_count: int = Field(default=0, sa_type=IntNumeric, sa_column_kwargs={"server_default": "0"})
+    debt: int = Field(default=0, sa_type=IntNumeric, sa_column_kwargs={"server_default": "0"})
+    claimable_snx: int = Field(
+        default=0, sa_type=IntNumeric, sa_column_kwargs={"server_default": "0"}
     )
     liquidation_deadline: datetime.datetime | None = Field(default=None)
     inited: bool = Field(default=False, sa_column_kwargs={"server_default": "false"})
+    # incremented by every metrics write, see GenericSqlRepository.update_all_versioned
+    version: int = Field(default=0, sa_type=BigInteger, sa_column_kwargs={"server_default": "0"})
     chat_accounts: list["ChatAccount"] = Relationship(
         back_populates="account",
-        sa_relationship_kwargs={"lazy": "selectin", "cascade": "all, delete-orphan"},
+        sa_relationship_kwargs={"cascade": "all, delete-orphan"},
     )
 
 
+class AccountOutbox(SQLModel, table=True):
+    """Account update waiting for the update processor, at most one row per account.
+
+    seq grows with every write, so a consumer only deletes the row it claimed,
+    not one updated again while it was processing.
+    """
+
+    account_id: uuid.UUID = Field(primary_key=True, foreign_key="account.id", ondelete="CASCADE")
+    observed_at: float = Field()
+    urgent: bool = Field(default=False, sa_column_kwargs={"server_default": "false"})
+    seq: int = Field(default=0, sa_type=BigInteger, sa_column_kwargs={"server_default": "0"})
+    locked_until: datetime.datetime | None = Field(default=None)
+
+
+# Snapshot tables are range partitioned by day, see app.snx_staking.account_history
+class AccountSnapshot(SQLModel, table=True):
+    """Account metrics as recomputed by the observer, append only. Units of Account"""
+
+    account_id: uuid.UUID = Field(primary_key=True)
+    observed_at: datetime.datetime = Field(primary_key=True)
+    c_ratio: int = Field(sa_type=BigInteger)
+    collateral: int = Field(sa_type=IntNumeric)
+    debt: int = Field(sa_type=IntNumeric)
+
+
+class AccountSnapshotHourly(SQLModel, table=True):
+    """Hourly rollup of AccountSnapshot, what history is read from"""
+
+    account_id: uuid.UUID = Field(primary_key=True)
+    hour: datetime.datetime = Field(primary_key=True)
+    c_ratio_min: int = Field(sa_type=BigInteger)
+    c_ratio_max: int = Field(sa_type=BigInteger)
+    # last values of the hour
+    c_ratio: int = Field(sa_type=BigInteger)
+    collateral: int = Field(sa_type=IntNumeric)
+    debt: int = Field(sa_type=IntNumeric)
+
+
+class ChainState(SQLModel, table=True):
+    """Latest SNXData of a chain, published by its observer for the other processes"""
+
+    chain: Chain = Field(primary_key=True)
+    snx_price: int = Field(default=0, sa_type=IntNumeric)
+    sds_price: int = Field(default=0, sa_type=IntNumeric)
+    period_start: int = Field(default=0, sa_type=BigInteger)
+    period_end: int = Field(default=0, sa_type=BigInteger)
+
+
 class ChatAccountSettings(TypedDict):
     address: bool
     c_ratio: bool
@@ -77,24 +143,11 @@ class ChatAccount(UUIDModel, table=True):
         sa_column=Column(JSONB), default_factory=lambda: DEFAULT_CHAT_ACCOUNT_SETTINGS.copy()
     )
 
-    chat: "Chat" = Relationship(
-        back_populates="chat_accounts",
-        sa_relationship_kwargs={
-            "lazy": "selectin",
-        },
-    )
-    account: "Account" = Relationship(
-        back_populates="chat_accounts",
-        sa_relationship_kwargs={
-            "lazy": "selectin",
-        },
-    )
+    chat: "Chat" = Relationship(back_populates="chat_accounts")
+    account: "Account" = Relationship(back_populates="chat_accounts")
     notifs: list["Notif"] = Relationship(
         back_populates="chat_account",
-        sa_relationship_kwargs={
-            "lazy": "selectin",
-            "cascade": "all, delete-orphan",
-        },
+        sa_relationship_kwargs={"cascade": "all, delete-orphan"},
     )
 
     def update_settings(self, **kwargs: bool) -> None:
@@ -110,10 +163,7 @@ class Chat(SQLModel, table=True):
 
     chat_accounts: list["ChatAccount"] = Relationship(
         back_populates="chat",
-        sa_relationship_kwargs={
-            "lazy": "selectin",
-            "cascade": "all, delete-orphan",
-        },
+        sa_relationship_kwargs={"cascade": "all, delete-orphan"},
     )
 
     @property
@@ -142,12 +192,7 @@ class Notif(UUIDModel, table=True):
     enabled: bool = Field(default=True)
 
     chat_account_id: uuid.UUID = Field(foreign_key="chataccount.id", ondelete="CASCADE")
-    chat_account: "ChatAccount" = Relationship(
-        back_populates="notifs",
-        sa_relationship_kwargs={
-            "lazy": "selectin",
-        },
-    )
+    chat_account: "ChatAccount" = Relationship(back_populates="notifs")
 
     @property
     def chat(self) -> "Chat":
@@ -160,3 +205,42 @@ class Notif(UUIDModel, table=True):
     def update_params(self, **kwargs: bool) -> None:
         # noinspection PyTypeChecker
         self.params = {**self.params, **kwargs}
+
+
+# RECORDS
+# Rows read by Core selects, without ORM hydration, validation or attribute
+# instrumentation, for the observer and the notif engine. Changes go back with
+# bulk statements, e.g. GenericSqlRepository.update_all_versioned. Handlers
+# keep using the models.
+
+
+@dataclass(slots=True)
+class AccountRecord:
+    """Account columns, see AccountRepository.get_records"""
+
+    id: uuid.UUID
+    address: str
+    chain: Chain
+    c_ratio: int
+    snx_count: int
+    collateral: int
+    sds_count: int
+    debt: int
+    claimable_snx: int
+    liquidation_deadline: datetime.datetime | None
+    inited: bool
+    version: int
+
+
+ACCOUNT_RECORD_FIELDS = tuple(field.name for field in fields(AccountRecord))
+
+
+@dataclass(slots=True)
+class NotifRecord:
+    """Notif of a chat on an account, see NotifRepository.get_subscriptions"""
+
+    id: uuid.UUID
+    type: NotifType
+    params: NotifParams
+    enabled: bool
+    chat_id: int
@@ -0,0 +1,61 @@
+"""Optional process pool for CPU-heavy stages of the observer.
+
+Decoding the logs of a catch-up range, grouping their events and recomputing
+the metrics of every account on a price tick hold the event loop that also
+serves Telegram. With workers, Offload runs such a stage in a process of a
+ProcessPoolExecutor while the loop awaits it. Arguments and results are
+pickled between the processes, so stages take and return compact batches:
+tuples and slotted records, no ORM objects or web3 AttributeDicts.
+
+A batch under min_batch items runs in the loop, shipping it would cost more
+than the stage. Workers are spawned, not forked from a process running the
+loop, its threads and connections, and live as long as the Offload.
+"""
+
+import asyncio
+import multiprocessing
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from typing import TypeVar
+
+from app import metrics
+
+T = TypeVar("T")
+
+# items of a batch worth its round trip to a worker
+MIN_BATCH = 5_000
+
+
+class Offload:
+    def __init__(self, workers: int = 0, min_batch: int = MIN_BATCH) -> None:
+        """:param workers: processes of the pool, 0 runs every stage in the loop"""
+        self._executor: ProcessPoolExecutor | None = (
+            ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+            if workers
+            else None
+        )
+        self._min_batch: int = min_batch
+
+    def offloads(self, size: int) -> bool:
+        """Whether a batch of size items runs in a worker"""
+        return self._executor is not None and size >= self._min_batch
+
+    async def run(self, size: int, stage: Callable[..., T], *args: object) -> T:
+        """:returns stage(*args), run in a worker if the batch of size items is worth it.
+
+        stage and args must pickle: a module level function or a method of a
+        picklable object, and compact arguments.
+        """
+        name = getattr(stage, "__qualname__", type(stage).__name__)
+        if not self.offloads(size):
+            with metrics.OFFLOAD_SECONDS.time(stage=name, where="loop"):
+                return stage(*args)
+        started = time.perf_counter()
+        result = await asyncio.get_running_loop().run_in_executor(self._executor, stage, *args)
+        metrics.OFFLOAD_SECONDS.observe(time.perf_counter() - started, stage=name, where="worker")
+        return result
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
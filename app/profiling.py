@@ -0,0 +1,188 @@
+"""On-demand sampling profiles of observer ticks and worker items.
+
+arm() makes the next runs of a target profiled: while one runs, a thread
+samples the event loop every SAMPLE_INTERVAL. Tasks of the run, the one that
+entered profiled() and the tasks it created, are sampled both when running,
+with the stack of the loop thread, and when suspended, with their coroutine
+stack ending in [await]. So the profile shows where a run spends wall time,
+computing or waiting on RPC and the database, but not other tasks sharing the
+loop meanwhile.
+
+Each run writes collapsed stacks, for flamegraph.pl or speedscope, and a
+summary of the top functions to the profile directory. While nothing is armed
+profiled() returns a shared no-op context manager.
+
+Runs are armed by the admin /profile command, or by signals: SIGUSR1 for
+observer ticks, SIGUSR2 for worker items, see Config.profile_count.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import AbstractContextManager, nullcontext
+from contextvars import ContextVar
+from enum import StrEnum
+from types import FrameType
+
+logger = logging.getLogger(__name__)
+
+# seconds between samples
+SAMPLE_INTERVAL = 0.01
+# functions in each list of the summary
+SUMMARY_TOP = 25
+AWAIT_FRAME = "[await]"
+
+
+class ProfileTarget(StrEnum):
+    # StakingObserver.update
+    observer = "observer"
+    # AccountUpdateProcessor item
+    worker = "worker"
+
+
+SIGNALS = {signal.SIGUSR1: ProfileTarget.observer, signal.SIGUSR2: ProfileTarget.worker}
+
+# target: runs left to profile
+_armed: dict[ProfileTarget, int] = {}
+_profile_dir: str = "profiles"
+_disarmed: AbstractContextManager[None] = nullcontext()
+# tells apart profiles written in the same second
+_sequence = itertools.count()
+_session: ContextVar["_ProfileSession | None"] = ContextVar("profile_session", default=None)
+
+
+def set_profile_dir(directory: str) -> None:
+    global _profile_dir
+    _profile_dir = directory
+
+
+def arm(target: ProfileTarget, count: int = 1) -> None:
+    """Profiles the next count runs of target in this process"""
+    _armed[target] = count
+    logger.info(f"Profiling the next {count} {target} runs to {_profile_dir}")
+
+
+def install_signal_handlers(count: int) -> None:
+    """Arms count runs of a target on its signal, see SIGNALS"""
+    loop = asyncio.get_running_loop()
+    for signum, target in SIGNALS.items():
+        loop.add_signal_handler(signum, arm, target, count)
+
+
+def profiled(target: ProfileTarget, name: str) -> AbstractContextManager[None]:
+    """Profiles the run in the context if target is armed.
+
+    :param name: of the run, in the profile file names
+    """
+    if not _armed.get(target):
+        return _disarmed
+    _armed[target] -= 1
+    return _ProfileSession(target, name)
+
+
+def _frame_name(frame: FrameType) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_qualname}"
+
+
+def _thread_stack(frame: FrameType) -> list[str]:
+    """Frame names of the running callback, outermost first, without the event loop's"""
+    names = []
+    while frame is not None:
+        if frame.f_code.co_filename == asyncio.events.__file__ and frame.f_code.co_name == "_run":
+            break
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return names[::-1]
+
+
+class _ProfileSession(AbstractContextManager[None]):
+    def __init__(self, target: ProfileTarget, name: str) -> None:
+        self._target: ProfileTarget = target
+        self._name: str = name
+        # collapsed stack: samples
+        self._samples: Counter[str] = Counter()
+        self._stopped: threading.Event = threading.Event()
+
+    def __enter__(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._token = _session.set(self)
+        self._started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._sampler.start()
+
+    def __exit__(self, *_) -> None:
+        elapsed = time.perf_counter() - self._started
+        _session.reset(self._token)
+        self._stopped.set()
+        self._sampler.join()
+        try:
+            self._write(elapsed)
+        except OSError as e:
+            logger.error(f"Profile of {self._target} {self._name} not written: {e!r}")
+
+    def _owns(self, task: asyncio.Task) -> bool:
+        return task.get_context().get(_session) is self
+
+    def _sample(self) -> None:
+        while not self._stopped.wait(SAMPLE_INTERVAL):
+            # read only, from another thread: tasks and frames may change while being read
+            running = asyncio.current_task(self._loop)
+            if running is not None and self._owns(running):
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    self._samples[";".join(_thread_stack(frame))] += 1
+            for task in asyncio.all_tasks(self._loop):
+                if task is not running and self._owns(task):
+                    stack = [_frame_name(frame) for frame in task.get_stack()]
+                    self._samples[";".join([*stack, AWAIT_FRAME])] += 1
+
+    def _write(self, elapsed: float) -> None:
+        os.makedirs(_profile_dir, exist_ok=True)
+        path = os.path.join(
+            _profile_dir,
+            f"{self._target}-{self._name}-{time.strftime('%Y%m%d-%H%M%S')}-{next(_sequence)}",
+        )
+        with open(f"{path}.collapsed", "w") as file:
+            file.writelines(f"{stack} {count}\n" for stack, count in self._samples.most_common())
+        summary = self._summary(elapsed)
+        with open(f"{path}.txt", "w") as file:
+            file.write(summary)
+        logger.info(f"Profile written to {path}.collapsed\n{summary}")
+
+    def _summary(self, elapsed: float) -> str:
+        computing, awaiting, total = Counter(), Counter(), Counter()
+        for stack, count in self._samples.items():
+            frames = stack.split(";")
+            if frames[-1] == AWAIT_FRAME:
+                frames.pop()
+                if frames:
+                    awaiting[frames[-1]] += count
+            elif frames:
+                computing[frames[-1]] += count
+            for name in set(frames):
+                total[name] += count
+
+        samples = sum(self._samples.values())
+        lines = [
+            f"{self._target} {self._name}: {elapsed:.3f}s wall, "
+            f"{samples * SAMPLE_INTERVAL:.3f}s over its tasks, sampled every "
+            f"{SAMPLE_INTERVAL * 1000:g}ms"
+        ]
+        for title, counter in (
+            ("computing, self", computing),
+            ("awaiting in", awaiting),
+            ("total, including callees", total),
+        ):
+            lines.append(f"\n{title}, task seconds:")
+            lines.extend(
+                f"{count * SAMPLE_INTERVAL:>10.2f} {count / samples:>7.1%}  {name}"
+                for name, count in counter.most_common(SUMMARY_TOP)
+            )
+        return "\n".join(lines) + "\n"
@@ -1,6 +1,16 @@
+from app.snx_staking.account_history import maintain_account_history
 from app.snx_staking.account_manager import AccountManager
-from app.snx_staking.snx_data_manager import SNXDataManager
+from app.snx_staking.shard_coordinator import ShardCoordinator
+from app.snx_staking.snx_data_manager import SNXDataManager, load_snx_data
 from app.snx_staking.staking_observer import StakingObserver
 from app.snx_staking.synthetix import bootstrap_synthetix
 
-__all__ = ["AccountManager", "SNXDataManager", "StakingObserver", "bootstrap_synthetix"]
+__all__ = [
+    "AccountManager",
+    "SNXDataManager",
+    "ShardCoordinator",
+    "StakingObserver",
+    "bootstrap_synthetix",
+    "load_snx_data",
+    "maintain_account_history",
+]
@@ -0,0 +1,124 @@
+"""Account events from the logs of get_all_events, grouped by account and applied to it.
+
+Logs become slotted AccountEvent records. Transfers become a SEND for the
+sender and a RECEIVE for the receiver, vesting payouts are skipped. Events of
+an account keep the order of get_all_events, by event type, with sends and
+receives last. They are applied as deltas, every changed column of the
+account is set once.
+
+recompute applies the events of an account and recalculates its metrics.
+recompute_rows does it for a batch of MetricRows, a pure function of its
+arguments that may run in a worker of app.offload.
+"""
+
+import datetime
+from collections import defaultdict
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+
+from app.common import SNXData
+from app.models import AccountRecord
+from app.snx_staking.account_metrics import AccountMetrics, MetricRow, calculate
+from app.snx_staking.synthetix import EventLog, EventName
+
+
+@dataclass(slots=True)
+class AccountEvent:
+    type: str
+    block_number: int | None
+    # amount of SNX or debt shares, the deadline timestamp of a liquidation flag
+    value: int = 0
+
+
+def group_events(
+    events: Mapping[str, Sequence[EventLog]], vesting_address: str | None
+) -> dict[str, list[AccountEvent]]:
+    """:returns {address: events}"""
+    by_address: defaultdict[str, list[AccountEvent]] = defaultdict(list)
+    for event_type, logs in events.items():
+        if event_type == EventName.SNX_TRANSFER:
+            continue
+        for block_number, account, value in logs:
+            by_address[account].append(AccountEvent(event_type, block_number, value))
+
+    transfers = [
+        transfer
+        for transfer in events.get(EventName.SNX_TRANSFER, ())
+        if transfer.sender != vesting_address
+    ]
+    for block_number, sender, _, value in transfers:
+        by_address[sender].append(AccountEvent(EventName.SEND, block_number, value))
+    for block_number, _, receiver, value in transfers:
+        by_address[receiver].append(AccountEvent(EventName.RECEIVE, block_number, value))
+    return by_address
+
+
+def apply_events(
+    account: AccountRecord | AccountMetrics, events: Sequence[AccountEvent]
+) -> tuple[bool, bool]:
+    """Applies events in order, setting each changed column once.
+
+    :returns whether collateral and debt events were applied
+    """
+    snx_delta = sds_delta = 0
+    collateral_events = debt_events = fees_claimed = False
+    liquidation: AccountEvent | None = None
+    for event in events:
+        event_type = event.type
+        if event_type == EventName.MINT:
+            sds_delta += event.value
+            debt_events = True
+        elif event_type == EventName.BURN:
+            sds_delta -= event.value
+            debt_events = True
+        elif event_type == EventName.SEND:
+            snx_delta -= event.value
+            collateral_events = True
+        elif event_type == EventName.RECEIVE:
+            snx_delta += event.value
+            collateral_events = True
+        elif event_type == EventName.FEES_CLAIMED:
+            snx_delta += event.value
+            collateral_events = fees_claimed = True
+        else:
+            # the last flag or removal wins
+            liquidation = event
+
+    if sds_delta:
+        account.sds_count += sds_delta
+    if snx_delta:
+        account.snx_count += snx_delta
+    if fees_claimed:
+        account.claimable_snx = 0
+    if liquidation is not None:
+        account.liquidation_deadline = (
+            datetime.datetime.fromtimestamp(liquidation.value)
+            if liquidation.type == EventName.FLAGGED_FOR_LIQUIDATION
+            else None
+        )
+    return collateral_events, debt_events
+
+
+def recompute(
+    account: AccountRecord | AccountMetrics, events: Sequence[AccountEvent], snx_data: SNXData
+) -> None:
+    """Applies events and recalculates the metrics they or the prices changed"""
+    collateral_events, debt_events = apply_events(account, events)
+    calculate(
+        account,
+        snx_data,
+        collateral=snx_data.snx_updated or collateral_events,
+        debt=snx_data.sds_updated or debt_events,
+    )
+
+
+def recompute_rows(
+    batch: Sequence[tuple[MetricRow, Sequence[AccountEvent]]], snx_data: SNXData
+) -> list[MetricRow]:
+    """:returns the rows of the batch, recomputed with their events"""
+    rows = []
+    for row, events in batch:
+        metrics = AccountMetrics(*row)
+        recompute(metrics, events, snx_data)
+        rows.append(metrics.row())
+    return rows
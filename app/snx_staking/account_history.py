@@ -0,0 +1,51 @@
+import datetime
+import logging
+
+from app.data_access import UOWFactoryType
+
+logger = logging.getLogger(__name__)
+
+# Days of partitions created ahead, so snapshot inserts never wait for maintenance
+PARTITIONS_AHEAD = 3
+
+
+async def maintain_account_history(
+    uow_factory: UOWFactoryType, snapshot_retention_days: int, history_retention_days: int
+) -> None:
+    try:
+        await _maintain_account_history(
+            uow_factory, snapshot_retention_days, history_retention_days
+        )
+    except Exception as e:
+        logger.error("Unexpected exception in account history maintenance:", exc_info=e)
+
+
+async def _maintain_account_history(
+    uow_factory: UOWFactoryType, snapshot_retention_days: int, history_retention_days: int
+) -> None:
+    """Creates upcoming partitions, rolls recent snapshots up into hours
+    and drops partitions past retention.
+
+    Idempotent, so any number of observers may run it.
+    """
+    now = datetime.datetime.now()
+    today = now.date()
+    days = [today + datetime.timedelta(days=i) for i in range(PARTITIONS_AHEAD + 1)]
+
+    async with uow_factory() as uow:
+        await uow.snapshots.create_partitions(days)
+        await uow.snapshots_hourly.create_partitions(days)
+
+    async with uow_factory() as uow:
+        # the previous hour too, for snapshots that came in after its last rollup
+        await uow.snapshots.rollup(now - datetime.timedelta(hours=1))
+
+    async with uow_factory() as uow:
+        dropped = await uow.snapshots.drop_partitions_before(
+            today - datetime.timedelta(days=snapshot_retention_days)
+        )
+        dropped += await uow.snapshots_hourly.drop_partitions_before(
+            today - datetime.timedelta(days=history_retention_days)
+        )
+    if dropped:
+        logger.info(f"Dropped account history partitions: {', '.join(dropped)}")
@@ -1,21 +1,38 @@
 import asyncio
 import datetime
 import logging
-from collections import defaultdict
-from decimal import Decimal
+import time
+from collections.abc import Awaitable, Callable, Sequence
 from uuid import UUID
 
 from eth_typing import Address, BlockIdentifier
 from eth_utils import to_checksum_address
-from web3.types import EventData
 
-from app.common import Chain, SNXData
+from app import fixed_point
+from app.common import AccountUpdate, Chain, SNXData
 from app.data_access import UOWFactoryType
-from app.models import Account
-from app.snx_staking.synthetix import EventName, Synthetix
+from app.models import Account, AccountRecord
+from app.offload import Offload
+from app.snx_staking.account_events import (
+    AccountEvent,
+    group_events,
+    recompute,
+    recompute_rows,
+)
+from app.snx_staking.account_metrics import (
+    METRIC_FIELDS,
+    calculate,
+    metric_row,
+    write_metric_row,
+)
+from app.snx_staking.shard_coordinator import ShardCoordinator
+from app.snx_staking.synthetix import AddressData, EventLog, EventName, Synthetix
 
 logger = logging.getLogger(__name__)
 
+# Attempts to write an account that keeps being changed concurrently
+WRITE_ATTEMPTS = 3
+
 
 class AccountManager:
     chain: Chain
@@ -29,182 +46,304 @@ class AccountManager:
         snx_data: SNXData,
         synthetix: Synthetix,
         uow_factory: UOWFactoryType,
-        updated_accounts_queue: asyncio.Queue[UUID],
+        shard_coordinator: ShardCoordinator,
+        snapshot_interval: float = 900,
+        offload: Offload | None = None,
+        outbox_max_depth: int = 0,
     ) -> None:
+        """:param offload: groups events and recomputes large batches in worker processes
+        :param outbox_max_depth: pending outbox rows over which the outbox is full, 0 for no limit
+        """
         self.chain = chain
         self._snx_data = snx_data
         self._synthetix = synthetix
         self._uow_factory = uow_factory
-        self._updated_accounts_queue: asyncio.Queue[UUID] = updated_accounts_queue
+        self._shard_coordinator: ShardCoordinator = shard_coordinator
+        self._snapshot_interval: float = snapshot_interval
+        # account_id: last snapshot time
+        self._snapshot_at: dict[UUID, float] = {}
+        self._offload: Offload = offload or Offload()
+        self._outbox_max_depth: int = outbox_max_depth
+
+    async def outbox_full(self) -> bool:
+        """Whether the update processor is too far behind to take more account updates"""
+        if not self._outbox_max_depth:
+            return False
+        async with self._uow_factory(read_only=True) as uow:
+            return await uow.outbox.deeper_than(self._outbox_max_depth)
 
     async def init_accounts(
         self, addresses: list[Address], block_identifier: BlockIdentifier
     ) -> None:
-        await asyncio.gather(
-            *[
-                asyncio.create_task(self._init_account(address, block_identifier))
-                for address in addresses
-            ],
-            return_exceptions=True,
-        )
-
-    async def init_all_accounts(self, block_identifier: BlockIdentifier) -> None:
-        async with self._uow_factory() as uow:
-            addresses = await uow.accounts.get_all_addresses_for_chain(self.chain)
-        addresses = [to_checksum_address(address) for address in addresses]
-        await self.init_accounts(addresses, block_identifier)
+        addresses = [address for address in addresses if self._shard_coordinator.owns(address)]
+        # failed addresses are left uninited, init_new_accounts retries them
+        address_to_data = await self._load_address_data(addresses, block_identifier)
+        if not address_to_data:
+            return
 
-    async def _init_account(self, address: Address, block_identifier: BlockIdentifier) -> None:
-        account_data = await self._synthetix.load_address_data(address, block_identifier)
         async with self._uow_factory() as uow:
-            if not (
-                account := await uow.accounts.get_by_address_chain_or_none(address, self.chain)
-            ):
-                return
-
-            account.snx_count = Decimal(str(account_data.collateral))
-            account.sds_count = Decimal(str(account_data.debt_share))
-            account.claimable_snx = account_data.fees_available[1]
-
-            liquidation_deadline = (
-                None
-                if account_data.liquidation_deadline == 0
-                else datetime.datetime.fromtimestamp(account_data.liquidation_deadline)
+            accounts = await uow.accounts.get_records_by_addresses(
+                address_to_data.keys(), self.chain
             )
-            account.liquidation_deadline = liquidation_deadline
-
-            self._calculate_collateral(account)
-            self._calculate_debt(account)
-            self._calculate_c_ratio(account)
 
-            account.inited = True
+        async def init_all(
+            accounts: list[AccountRecord], _conflict: bool
+        ) -> dict[UUID, AccountUpdate]:
+            # absolute values, the same written again on a conflict
+            updates = {}
+            for account in accounts:
+                self._apply_address_data(account, address_to_data[account.address])
+                account.inited = True
+                updates[account.id] = AccountUpdate(time.time())
+            return updates
 
-            await self._updated_accounts_queue.put(account.id)
+        accounts = await self._write_accounts(accounts, (*METRIC_FIELDS, "inited"), init_all)
+        await self._record_snapshots(accounts, {account.id for account in accounts})
 
-    async def update_accounts(self, events: dict) -> None:
-        address_to_event = self._group_events(events)
+    async def init_all_accounts(self, block_identifier: BlockIdentifier) -> None:
+        async with self._uow_factory(read_only=True) as uow:
+            addresses = await uow.accounts.get_all_addresses_for_chain(self.chain)
+        addresses = [to_checksum_address(address) for address in addresses]
+        await self.init_accounts(addresses, block_identifier)
 
-        if any([self._snx_data.snx_updated, self._snx_data.sds_updated]):
-            async with self._uow_factory() as uow:
-                addresses_to_update = await uow.accounts.get_all_addresses_for_chain(self.chain)
-        else:
-            addresses_to_update = set(address_to_event.keys())
+    async def init_new_accounts(self, block_identifier: BlockIdentifier) -> None:
+        """Inits accounts added since the last call, or whose init failed"""
+        async with self._uow_factory(read_only=True) as uow:
+            addresses = await uow.accounts.get_all_addresses_for_chain(self.chain, inited=False)
+        if addresses:
+            addresses = [to_checksum_address(address) for address in addresses]
+            await self.init_accounts(addresses, block_identifier)
+
+    async def _load_address_data(
+        self, addresses: Sequence[str], block_identifier: BlockIdentifier
+    ) -> dict[str, AddressData]:
+        """:returns {address: data at the block}, without addresses whose calls failed"""
+        results = await asyncio.gather(
+            *[
+                self._synthetix.load_address_data(address, block_identifier)
+                for address in addresses
+            ],
+            return_exceptions=True,
+        )
+        address_to_data = {}
+        for address, result in zip(addresses, results, strict=True):
+            # load_address_data returns the exceptions of its calls in the fields
+            values = result if isinstance(result, AddressData) else (result,)
+            error = next((value for value in values if isinstance(value, Exception)), None)
+            if error is not None:
+                logger.warning(f"Failed to load {address} data: {error!r}")
+                continue
+            address_to_data[address] = result
+        return address_to_data
+
+    def _apply_address_data(self, account: AccountRecord, account_data: AddressData) -> None:
+        account.snx_count = account_data.collateral
+        account.sds_count = account_data.debt_share
+        account.claimable_snx = account_data.fees_available[1]
+
+        liquidation_deadline = (
+            None
+            if account_data.liquidation_deadline == 0
+            else datetime.datetime.fromtimestamp(account_data.liquidation_deadline)
+        )
+        account.liquidation_deadline = liquidation_deadline
+        calculate(account, self._snx_data)
 
-        tasks = []
-        for address in addresses_to_update:
-            events = address_to_event.get(address, [])
-            tasks.append(asyncio.create_task(self._update_account(address, events)))
-        await asyncio.gather(*tasks, return_exceptions=True)
+    async def update_accounts(
+        self, events: dict[str, list[EventLog]], block_identifier: BlockIdentifier = "latest"
+    ) -> None:
+        """:param block_identifier: block the events were read up to"""
+        address_to_event = await self._offload.run(
+            sum(len(logs) for logs in events.values()),
+            group_events,
+            events,
+            self._synthetix.vesting_contract_address,
+        )
 
-    async def _update_account(self, address: str, events: list) -> None:
+        price_updated = any([self._snx_data.snx_updated, self._snx_data.sds_updated])
         async with self._uow_factory() as uow:
-            if not (
-                account := await uow.accounts.get_by_address_chain_or_none(address, self.chain)
-            ):
-                return
-            self._apply_events(account, events)
-
-            collateral_updated = self._snx_data.snx_updated or any(
-                event["type"] in {EventName.SEND, EventName.RECEIVE, EventName.FEES_CLAIMED}
-                for event in events
-            )
-            debt_updated = self._snx_data.sds_updated or any(
-                event["type"] in {EventName.MINT, EventName.BURN} for event in events
-            )
-
-            if collateral_updated:
-                self._calculate_collateral(account)
-
-            if debt_updated:
-                self._calculate_debt(account)
-
-            if collateral_updated or debt_updated:
-                self._calculate_c_ratio(account)
-
-            await self._updated_accounts_queue.put(account.id)
-
-    # CALCULATIONS
-    def _calculate_collateral(self, account: Account) -> None:
-        account.collateral = account.snx_count * self._snx_data.snx_price
-
-    def _calculate_debt(self, account: Account) -> None:
-        account.debt = (account.sds_count * self._snx_data.sds_price) // (10**27)
-
-    @staticmethod
-    def _calculate_c_ratio(account: Account) -> None:
-        if account.debt != 0:
-            account.c_ratio = round((account.collateral / account.debt / 10**18), 5)
-        else:
-            account.c_ratio = 0
-
-    # EVENTS
-    def _group_events(self, events: dict[str, list[EventData]]) -> dict[str, list]:
-        """:returns dict{address: events}"""
-        if not events:
-            return {}
-        events_by_address = defaultdict(list)
-
-        # handle transfer events
-        transfers = events.pop("Transfer")
-        split_transfers = self._split_transfer_events(transfers)
-        if split_transfers:
-            events.update(split_transfers)
+            if price_updated:
+                accounts = await uow.accounts.get_records(Account.chain == self.chain)
+            else:
+                accounts = await uow.accounts.get_records_by_addresses(
+                    address_to_event.keys(), self.chain
+                )
 
-        for event_type, event_list in events.items():
-            for event in event_list:
-                events_by_address[event["args"]["account"]].append(
-                    {"type": event_type, **event["args"]}
+        # Liquidation flags go first, before a price update fans out to every account
+        flagged, rest = [], []
+        for account in accounts:
+            if not self._shard_coordinator.owns(account.address):
+                continue
+            is_flagged = any(
+                event.type == EventName.FLAGGED_FOR_LIQUIDATION
+                for event in address_to_event.get(account.address, ())
+            )
+            (flagged if is_flagged else rest).append(account)
+        if price_updated:
+            # every owned account is here, forget the deleted ones and those of shards given up
+            owned_ids = {account.id for account in (*flagged, *rest)}
+            self._snapshot_at = {
+                account_id: snapshot_at
+                for account_id, snapshot_at in self._snapshot_at.items()
+                if account_id in owned_ids
+            }
+        for batch in (flagged, rest):
+            await self._update_accounts_batch(batch, address_to_event, block_identifier)
+
+    async def _update_accounts_batch(
+        self,
+        accounts: list[AccountRecord],
+        address_to_event: dict[str, list[AccountEvent]],
+        block_identifier: BlockIdentifier,
+    ) -> None:
+        if not accounts:
+            return
+
+        async def update_all(
+            accounts: list[AccountRecord], conflict: bool
+        ) -> dict[UUID, AccountUpdate]:
+            previous_c_ratios = {account.id: account.c_ratio for account in accounts}
+            if conflict:
+                accounts = await self._reload_conflicting(
+                    accounts, address_to_event, block_identifier
+                )
+            else:
+                await self._recompute(accounts, address_to_event)
+
+            updates = {}
+            for account in accounts:
+                flagged_events = [
+                    event
+                    for event in address_to_event.get(account.address, ())
+                    if event.type == EventName.FLAGGED_FOR_LIQUIDATION
+                ]
+                if flagged_events:
+                    observed_at = await self._synthetix.get_block_timestamp(
+                        flagged_events[0].block_number
+                    )
+                else:
+                    observed_at = time.time()
+                urgent = bool(flagged_events) or self._fell_below_target(
+                    previous_c_ratios[account.id], account.c_ratio
                 )
+                updates[account.id] = AccountUpdate(observed_at, urgent)
+            return updates
 
-        return events_by_address
+        accounts = await self._write_accounts(accounts, METRIC_FIELDS, update_all)
+        await self._record_snapshots(
+            accounts, {account.id for account in accounts if account.address in address_to_event}
+        )
 
-    def _split_transfer_events(self, transfers: list[EventData]) -> dict[str, list]:
-        events = defaultdict(list)
-        for transfer in transfers:
-            if transfer["args"]["from"] == self._synthetix.vesting_contract_address:
+    async def _reload_conflicting(
+        self,
+        accounts: list[AccountRecord],
+        address_to_event: dict[str, list[AccountEvent]],
+        block_identifier: BlockIdentifier,
+    ) -> list[AccountRecord]:
+        """Redoes an update on accounts another writer changed since they were read.
+
+        The other writer may have been an init at a block that includes the events,
+        or an observer that applied the same ones, so applying them again as deltas
+        would count them twice. Accounts with events take their absolute state at
+        block_identifier from the chain instead, the rest are only recalculated.
+        :returns accounts to write, without the ones whose data failed to load
+        """
+        with_events = [account for account in accounts if account.address in address_to_event]
+        address_to_data = await self._load_address_data(
+            [account.address for account in with_events], block_identifier
+        )
+        reloaded = []
+        for account in accounts:
+            if account.address not in address_to_event:
+                calculate(account, self._snx_data)
+            elif data := address_to_data.get(account.address):
+                self._apply_address_data(account, data)
+            else:
                 continue
+            reloaded.append(account)
+        return reloaded
 
-            events[EventName.SEND].append(
-                {
-                    "args": {
-                        "account": transfer["args"]["from"],
-                        "amount": transfer["args"]["value"],
-                    }
-                }
-            )
-            events[EventName.RECEIVE].append(
-                {"args": {"account": transfer["args"]["to"], "amount": transfer["args"]["value"]}}
-            )
-        return events
-
-    @staticmethod
-    def _apply_events(account: Account, events: list[dict]) -> None:
-        handlers = {
-            EventName.MINT: lambda _account, _event: setattr(
-                _account, "sds_count", _account.sds_count + _event["amount"]
-            ),
-            EventName.BURN: lambda _account, _event: setattr(
-                _account, "sds_count", _account.sds_count - _event["amount"]
-            ),
-            EventName.SEND: lambda _account, _event: setattr(
-                _account, "snx_count", _account.snx_count - _event["amount"]
-            ),
-            EventName.RECEIVE: lambda _account, _event: setattr(
-                _account, "snx_count", _account.snx_count + _event["amount"]
-            ),
-            EventName.FEES_CLAIMED: lambda _account, _event: (
-                setattr(_account, "snx_count", _account.snx_count + _event["snxRewards"]),
-                setattr(_account, "claimable_snx", 0),
-            ),
-            EventName.FLAGGED_FOR_LIQUIDATION: lambda _account, _event: setattr(
-                _account,
-                "liquidation_deadline",
-                datetime.datetime.fromtimestamp(_event["deadline"]),
-            ),
-            EventName.REMOVED_FROM_LIQUIDATION: lambda _account, _event: setattr(
-                _account, "liquidation_deadline", None
-            ),
-        }
-
-        for event in events:
-            handlers[event["type"]](account, event)
+    async def _write_accounts(
+        self,
+        accounts: list[AccountRecord],
+        fields: Sequence[str],
+        apply: Callable[[list[AccountRecord], bool], Awaitable[dict[UUID, AccountUpdate]]],
+    ) -> list[AccountRecord]:
+        """Applies changes to account records and writes them with their outbox rows.
+
+        Writes are compare-and-swap on the account version. Accounts written by
+        someone else in the meantime are reloaded and passed to apply again, with
+        conflict set, up to WRITE_ATTEMPTS times. Only accounts apply returns an
+        update for are written.
+        :returns written accounts
+        """
+        written = []
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            updates = await apply(accounts, attempt > 1)
+            accounts = [account for account in accounts if account.id in updates]
+            # the outbox row commits with the metrics it announces
+            async with self._uow_factory() as uow:
+                stale = await uow.accounts.update_all_versioned(accounts, fields)
+                stale_ids = [account.id for account in stale]
+                for account_id in stale_ids:
+                    del updates[account_id]
+                await uow.outbox.put_all(updates)
+            written.extend(account for account in accounts if account.id in updates)
+            if not stale:
+                break
+            if attempt == WRITE_ATTEMPTS:
+                logger.warning(f"Gave up on {len(stale)} accounts written concurrently")
+                break
+            async with self._uow_factory() as uow:
+                accounts = await uow.accounts.get_records_by_ids(stale_ids)
+        return written
+
+    async def _record_snapshots(
+        self, accounts: list[AccountRecord], changed_ids: set[UUID]
+    ) -> None:
+        """Appends account history.
+
+        Accounts changed by their own events or init are recorded right away,
+        the ones moved by prices only at most every snapshot_interval seconds.
+        """
+        now = time.time()
+        due = [
+            account
+            for account in accounts
+            if account.id in changed_ids
+            or now - self._snapshot_at.get(account.id, 0) >= self._snapshot_interval
+        ]
+        if not due:
+            return
+        # history is best effort, a failure must not hold back the observer
+        try:
+            async with self._uow_factory() as uow:
+                await uow.snapshots.append_all(due, datetime.datetime.fromtimestamp(now))
+        except Exception as e:
+            logger.warning(f"Failed to record {len(due)} account snapshots: {e!r}")
+            return
+        for account in due:
+            self._snapshot_at[account.id] = now
+
+    async def _recompute(
+        self, accounts: list[AccountRecord], address_to_event: dict[str, list[AccountEvent]]
+    ) -> None:
+        """Applies the events of accounts and recomputes their metrics.
+
+        A batch large enough for a worker travels as MetricRows, written back after.
+        """
+        if not self._offload.offloads(len(accounts)):
+            for account in accounts:
+                recompute(account, address_to_event.get(account.address, ()), self._snx_data)
+            return
+        batch = [
+            (metric_row(account), address_to_event.get(account.address, ()))
+            for account in accounts
+        ]
+        rows = await self._offload.run(len(batch), recompute_rows, batch, self._snx_data)
+        for account, row in zip(accounts, rows, strict=True):
+            write_metric_row(account, row)
+
+    def _fell_below_target(self, previous_c_ratio: int, c_ratio: int) -> bool:
+        target = fixed_point.c_ratio_from_float(self._snx_data.issuance_ratio)
+        return 0 < c_ratio < target <= previous_c_ratio
@@ -0,0 +1,74 @@
+"""Metrics of an account and their calculation from the Synthetix prices.
+
+AccountMetrics holds the columns the observer recomputes, METRIC_FIELDS,
+apart from the rest of an AccountRecord. Recompute batches carry them to a
+worker of app.offload and back as MetricRow tuples, which pickle several
+times faster.
+"""
+
+import datetime
+from dataclasses import dataclass
+
+from app import fixed_point
+from app.common import SNXData
+from app.models import AccountRecord
+
+# Columns recomputed by the observer, written back with one bulk update
+METRIC_FIELDS = (
+    "snx_count",
+    "sds_count",
+    "collateral",
+    "debt",
+    "c_ratio",
+    "claimable_snx",
+    "liquidation_deadline",
+)
+# values of METRIC_FIELDS
+MetricRow = tuple[int, int, int, int, int, int, datetime.datetime | None]
+
+
+@dataclass(slots=True)
+class AccountMetrics:
+    # fields in the order of METRIC_FIELDS
+    snx_count: int
+    sds_count: int
+    collateral: int
+    debt: int
+    c_ratio: int
+    claimable_snx: int
+    liquidation_deadline: datetime.datetime | None
+
+    def row(self) -> MetricRow:
+        return (
+            self.snx_count,
+            self.sds_count,
+            self.collateral,
+            self.debt,
+            self.c_ratio,
+            self.claimable_snx,
+            self.liquidation_deadline,
+        )
+
+
+def metric_row(account: AccountRecord) -> MetricRow:
+    return tuple(getattr(account, field) for field in METRIC_FIELDS)
+
+
+def write_metric_row(account: AccountRecord, row: MetricRow) -> None:
+    for field, value in zip(METRIC_FIELDS, row, strict=True):
+        setattr(account, field, value)
+
+
+def calculate(
+    account: AccountRecord | AccountMetrics,
+    snx_data: SNXData,
+    collateral: bool = True,
+    debt: bool = True,
+) -> None:
+    """Recalculates collateral and debt from their counts, and the c-ratio if either changed"""
+    if collateral:
+        account.collateral = fixed_point.collateral(account.snx_count, snx_data.snx_price)
+    if debt:
+        account.debt = fixed_point.debt(account.sds_count, snx_data.sds_price)
+    if collateral or debt:
+        account.c_ratio = fixed_point.c_ratio(account.collateral, account.debt)
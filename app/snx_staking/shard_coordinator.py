@@ -0,0 +1,90 @@
+import logging
+import math
+
+import psycopg
+
+from app.common import Chain
+from app.data_access import connect_dedicated
+
+logger = logging.getLogger(__name__)
+
+# First key of the advisory locks, the chain id is added to it
+_LOCK_NAMESPACE = 0x534E5800
+# Second key of the shared lock every running instance holds, shards use 0..shards-1
+_PRESENCE_KEY = 2**31 - 1
+
+
+class ShardCoordinator:
+    """Splits the accounts of a chain into shards between observer instances.
+
+    A shard is owned through a session level advisory lock, so the shards of an
+    instance that dies or loses its connection are taken over by the others.
+    Every instance also holds a shared presence lock and keeps about
+    shards / instances of them, so adding an instance spreads the work.
+    With one shard this is plain leader election.
+    """
+
+    def __init__(self, chain: Chain, db_connection: str, shards: int = 1) -> None:
+        self._chain: Chain = chain
+        self._db_connection: str = db_connection
+        self._namespace: int = _LOCK_NAMESPACE + chain.chain_id
+        self._shards: int = shards
+        self._conn: psycopg.AsyncConnection | None = None
+        self.held: frozenset[int] = frozenset()
+
+    def owns(self, address: str) -> bool:
+        return int(address, 16) % self._shards in self.held
+
+    async def rebalance(self) -> frozenset[int]:
+        """Takes free shards up to a fair share and releases the ones above it
+
+        :returns held shards
+        """
+        try:
+            await self._rebalance()
+        except psycopg.Error as e:
+            logger.warning(f"{self._chain} shard locks lost: {e!r}")
+            self.held = frozenset()
+            if self._conn is not None:
+                await self._conn.close()
+                self._conn = None
+        return self.held
+
+    async def _rebalance(self) -> None:
+        if self._conn is None or self._conn.closed:
+            # locks died with the previous connection
+            self.held = frozenset()
+            self._conn = await connect_dedicated(self._db_connection)
+            await self._conn.execute(
+                "SELECT pg_advisory_lock_shared(%s, %s)", (self._namespace, _PRESENCE_KEY)
+            )
+
+        cursor = await self._conn.execute(
+            """
+            SELECT count(*) FROM pg_locks
+            WHERE locktype = 'advisory' AND granted
+                AND classid = %s::oid AND objid = %s::oid AND objsubid = 2
+            """,
+            (self._namespace, _PRESENCE_KEY),
+        )
+        (instances,) = await cursor.fetchone()
+        fair_share = math.ceil(self._shards / max(instances, 1))
+
+        held = set(self.held)
+        for shard in sorted(held)[fair_share:]:
+            await self._conn.execute("SELECT pg_advisory_unlock(%s, %s)", (self._namespace, shard))
+            held.discard(shard)
+        for shard in range(self._shards):
+            if len(held) >= fair_share:
+                break
+            if shard in held:
+                continue
+            cursor = await self._conn.execute(
+                "SELECT pg_try_advisory_lock(%s, %s)", (self._namespace, shard)
+            )
+            if (await cursor.fetchone())[0]:
+                held.add(shard)
+
+        if held != self.held:
+            logger.info(f"{self._chain} observing shards {sorted(held)} of {self._shards}")
+        self.held = frozenset(held)
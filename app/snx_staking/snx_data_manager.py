@@ -1,7 +1,8 @@
 import asyncio
 import time
 
-from app.common import SNXData
+from app.common import Chain, SNXData, SNXMultiChainData
+from app.data_access import UOWFactoryType
 from app.snx_staking.synthetix import Synthetix
 
 
@@ -9,11 +10,13 @@ class SNXDataManager:
     # Hardcoded because don't see reasons make flexible
     _period_duration: int = 604800
     _synthetix: Synthetix
+    _uow_factory: UOWFactoryType
     snx_data: SNXData
 
-    def __init__(self, synthetix: Synthetix, snx_data: SNXData):
+    def __init__(self, synthetix: Synthetix, snx_data: SNXData, uow_factory: UOWFactoryType):
         self._synthetix: Synthetix = synthetix
         self.snx_data: SNXData = snx_data
+        self._uow_factory: UOWFactoryType = uow_factory
 
     async def _update_prices(self) -> None:
         snx_price, sds_price = await self._synthetix.get_synthetix_prices()
@@ -41,3 +44,22 @@ class SNXDataManager:
         t_update_prices = asyncio.create_task(self._update_prices())
         t_check_period = asyncio.create_task(self._check_new_period())
         await asyncio.gather(t_update_prices, t_check_period, return_exceptions=True)
+
+        if any(
+            [self.snx_data.snx_updated, self.snx_data.sds_updated, self.snx_data.period_updated]
+        ):
+            # processes without an observer for the chain read it from the db
+            async with self._uow_factory() as uow:
+                await uow.chain_states.save(self.snx_data)
+
+
+async def load_snx_data(uow_factory: UOWFactoryType, snx_data: SNXMultiChainData) -> None:
+    """Fills snx_data with what observers saved, for processes that don't observe chains"""
+    async with uow_factory() as uow:
+        chain_states = await uow.chain_states.get_all()
+    for chain_state in chain_states:
+        data = snx_data[Chain(chain_state.chain)]
+        data.snx_price = chain_state.snx_price
+        data.sds_price = chain_state.sds_price
+        data.period_start = chain_state.period_start
+        data.period_end = chain_state.period_end
@@ -1,12 +1,14 @@
-import asyncio
 import logging
 import time
+from contextlib import AbstractContextManager
 from dataclasses import dataclass, field
 
-from eth_typing import AnyAddress
-
+from app import metrics
 from app.common import Chain
+from app.data_access import track_queries
+from app.profiling import ProfileTarget, profiled
 from app.snx_staking.account_manager import AccountManager
+from app.snx_staking.shard_coordinator import ShardCoordinator
 from app.snx_staking.snx_data_manager import SNXDataManager
 from app.snx_staking.synthetix import Synthetix
 
@@ -32,7 +34,7 @@ class StakingObserver:
         synthetix: Synthetix,
         snx_data_manager: SNXDataManager,
         account_manager: AccountManager,
-        new_accounts_queue: asyncio.Queue[AnyAddress],
+        shard_coordinator: ShardCoordinator,
         contracts_check_interval: int = 60 * 60 * 24,
         events_check_interval: int = 60 * 10,
     ):
@@ -40,18 +42,22 @@ class StakingObserver:
         self._synthetix: Synthetix = synthetix
         self._snx_data_manager: SNXDataManager = snx_data_manager
         self._account_manager = account_manager
-        self._new_accounts_queue: asyncio.Queue[AnyAddress] = new_accounts_queue
+        self._shard_coordinator: ShardCoordinator = shard_coordinator
 
         self._contract_check_interval: int = contracts_check_interval
         self._events_check_interval: int = events_check_interval
 
         self._is_first_run = True
 
+    def _phase(self, phase: str) -> AbstractContextManager[None]:
+        return metrics.OBSERVER_PHASE_SECONDS.time(chain=self.chain, phase=phase)
+
     async def _init(self):
         now = time.time()
-        current_block = await self._synthetix.get_block_num()
-        await self._snx_data_manager.update()
-        await self._account_manager.init_all_accounts(current_block)
+        with self._phase("init"):
+            current_block = await self._synthetix.get_block_num()
+            await self._snx_data_manager.update()
+            await self._account_manager.init_all_accounts(current_block)
         logger.info(f"{self.chain} init in {time.time() - now}")
 
         now = time.time()
@@ -61,30 +67,57 @@ class StakingObserver:
 
     async def update(self):
         try:
-            await self._update()
+            with (
+                profiled(ProfileTarget.observer, self.chain),
+                track_queries("observer_tick", self.chain),
+            ):
+                await self._update()
         except Exception as e:
             logger.error("Unexpected exception in StakingObserver:", exc_info=e)
+        else:
+            metrics.OBSERVER_LAST_UPDATE.set(time.time(), chain=self.chain)
 
     async def _update(self):
+        held_shards = self._shard_coordinator.held
+        with self._phase("rebalance"):
+            held = await self._shard_coordinator.rebalance()
+        if not held:
+            # standby, other instances observe the chain
+            return
+
         if self._is_first_run:
-            await self._synthetix.install_contracts()
+            with self._phase("install_contracts"):
+                await self._synthetix.install_contracts()
             await self._init()
             self._is_first_run = False
             return
 
-        update = await self._get_synthetix_update()
+        if self._shard_coordinator.held - held_shards:
+            # accounts of taken over shards are stale since their last owner stopped
+            await self._init()
+            return
+
+        if await self._account_manager.outbox_full():
+            # backpressure: events and prices are picked up once the processor catches up
+            logger.warning(f"{self.chain} update skipped, the account outbox is full")
+            metrics.OBSERVER_BACKPRESSURE.inc(chain=self.chain)
+            return
+
+        with self._phase("synthetix_update"):
+            update = await self._get_synthetix_update()
         if update.reinit:
             await self._init()
             return
 
         # INIT NEW ACCOUNTS
         if update.can_init_new_accounts:
-            new_accounts = []
-            while not self._new_accounts_queue.empty():
-                new_accounts.append(await self._new_accounts_queue.get())
-            await self._account_manager.init_accounts(new_accounts, update.current_block)
+            with self._phase("init_new_accounts"):
+                await self._account_manager.init_new_accounts(update.current_block)
 
-        await self._account_manager.update_accounts(update.events)
+        with self._phase("update_accounts"):
+            await self._account_manager.update_accounts(
+                update.events, update.current_block or "latest"
+            )
 
     async def _get_synthetix_update(self) -> SynthetixUpdate:
         #   1. check address collector updates
@@ -1,16 +1,33 @@
-from app.snx_staking.synthetix._synthetix import Synthetix, bootstrap_synthetix
+from app.snx_staking.synthetix._synthetix import (
+    AddressData,
+    Synthetix,
+    bootstrap_synthetix,
+)
 from app.snx_staking.synthetix.constants import (
     ContractName,
     EventName,
     contract_names,
     contract_to_events,
 )
+from app.snx_staking.synthetix.event_decoder import (
+    EVENT_FIELDS,
+    AccountLog,
+    EventDecoder,
+    EventLog,
+    TransferLog,
+)
 
 __all__ = [
+    "AddressData",
     "Synthetix",
     "bootstrap_synthetix",
     "ContractName",
     "EventName",
     "contract_names",
     "contract_to_events",
+    "EVENT_FIELDS",
+    "AccountLog",
+    "EventDecoder",
+    "EventLog",
+    "TransferLog",
 ]
@@ -1,16 +1,34 @@
 import asyncio
+import logging
+from collections import defaultdict
+from collections.abc import Callable
 from typing import NamedTuple
 
 from eth_typing import AnyAddress
 from web3 import AsyncHTTPProvider, AsyncWeb3
-from web3.types import BlockIdentifier
+from web3.providers.async_base import AsyncBaseProvider
+from web3.types import BlockIdentifier, RPCEndpoint
 
+from app import metrics
 from app.common import Chain, ChainConfig
+from app.offload import Offload
 from app.snx_staking.synthetix.constants import ContractName, contract_to_events
 from app.snx_staking.synthetix.contract_caller import ContractCaller
-from app.snx_staking.synthetix.contract_manager import ContractManager
+from app.snx_staking.synthetix.contract_manager import (
+    ETHERSCAN_API,
+    AbiFetchType,
+    ContractManager,
+)
+from app.snx_staking.synthetix.event_decoder import (
+    EventDecoder,
+    EventLog,
+    LogRow,
+    from_event_data,
+)
 from app.snx_staking.synthetix.utils import create_raw_contract_call
 
+logger = logging.getLogger(__name__)
+
 
 class AddressData(NamedTuple):
     collateral: int
@@ -26,11 +44,13 @@ class Synthetix:
         web3: AsyncWeb3,
         contract_manager: ContractManager,
         contract_caller: ContractCaller,
+        offload: Offload | None = None,
     ):
         self.chain = chain
         self._web3: AsyncWeb3 = web3
         self._contract_manager: ContractManager = contract_manager
         self._contract_caller: ContractCaller = contract_caller
+        self._offload: Offload = offload or Offload()
 
     @property
     def vesting_contract_address(self) -> AnyAddress:
@@ -47,6 +67,10 @@ class Synthetix:
     async def get_block_num(self) -> int:
         return await self._web3.eth.block_number
 
+    async def get_block_timestamp(self, block_identifier: BlockIdentifier) -> int:
+        block = await self._web3.eth.get_block(block_identifier)
+        return block["timestamp"]
+
     # CONTRACT CALL
     async def get_synthetix_prices(self) -> tuple:
         t_snx_price = asyncio.create_task(self._contract_caller.synthetix_price())
@@ -72,26 +96,83 @@ class Synthetix:
         )
 
     # EVENTS
-    async def get_all_events(self, from_block: int, to_block: int) -> dict[str, list]:
+    async def _get_raw_logs(self, filter_params: dict) -> list[dict]:
+        """eth_getLogs past the middleware, the attrdict one would wrap every log and topic"""
+        params = [filter_params]
+        response = await self._web3.provider.make_request(RPCEndpoint("eth_getLogs"), params)
+        return self._web3.manager.formatted_response(response, params)
+
+    async def get_all_events(self, from_block: int, to_block: int) -> dict[str, list[EventLog]]:
+        """:returns {event name: logs}, in the order of contract_to_events"""
         events = {}
         for contract_name, event_names in contract_to_events.items():
             contract = self._contract_manager.get_contract(contract_name)
+            decoders, fallback = {}, []
+            for event_name in event_names:
+                try:
+                    decoders[event_name] = EventDecoder(
+                        event_name, getattr(contract.events, event_name).abi
+                    )
+                except ValueError as e:
+                    logger.warning(f"{self.chain} {event_name} decoded by web3: {e}")
+                    fallback.append(event_name)
+
+            decoded = {}
+            if decoders:
+                # one request for the events of a contract
+                raw_logs = await self._get_raw_logs(
+                    {
+                        "address": [contract.address],
+                        "fromBlock": hex(from_block),
+                        "toBlock": hex(to_block),
+                        "topics": [[decoder.topic for decoder in decoders.values()]],
+                    }
+                )
+                topic_to_rows: defaultdict[str, list[LogRow]] = defaultdict(list)
+                for log in raw_logs:
+                    topics = log["topics"]
+                    topic_to_rows[topics[0]].append((log["blockNumber"], topics, log["data"]))
+                for event_name, decoder in decoders.items():
+                    rows = topic_to_rows[decoder.topic]
+                    decoded[event_name] = await self._offload.run(
+                        len(rows), decoder.decode_rows, rows
+                    )
+            for event_name in fallback:
+                logs = await getattr(contract.events, event_name).get_logs(
+                    from_block=from_block, to_block=to_block
+                )
+                decoded[event_name] = from_event_data(event_name, logs)
+
             for event_name in event_names:
-                event = getattr(contract.events, event_name)
-                events[event_name] = await event.get_logs(from_block=from_block, to_block=to_block)
+                events[event_name] = decoded[event_name]
+                labels = {"chain": self.chain, "event": event_name}
+                metrics.GET_LOGS_BLOCKS.observe(to_block - from_block + 1, **labels)
+                metrics.GET_LOGS_EVENTS.observe(len(events[event_name]), **labels)
         return events
 
 
-def bootstrap_synthetix(chain_config: ChainConfig, etherscan_key: str) -> Synthetix:
-    web3 = AsyncWeb3(AsyncHTTPProvider(chain_config.api))
-    raw_contract_call = create_raw_contract_call()
+def bootstrap_synthetix(
+    chain_config: ChainConfig,
+    etherscan_key: str,
+    etherscan_api: str = ETHERSCAN_API,
+    provider: AsyncBaseProvider | None = None,
+    wrap_abi_fetch: Callable[[AbiFetchType], AbiFetchType] | None = None,
+    offload: Offload | None = None,
+) -> Synthetix:
+    """:param provider: replaces the HTTP provider of chain_config.api
+    :param offload: decodes large batches of logs in worker processes
+    """
+    web3 = AsyncWeb3(provider or AsyncHTTPProvider(chain_config.api))
+    raw_contract_call = create_raw_contract_call(chain_config.chain)
     contract_manager = ContractManager(
         chain_config.chain,
         web3,
         raw_contract_call,
         chain_config.address_resolver_address,
         etherscan_key,
+        etherscan_api,
+        wrap_abi_fetch,
     )
     contract_caller = ContractCaller(contract_manager, raw_contract_call)
-    synthetix = Synthetix(chain_config.chain, web3, contract_manager, contract_caller)
+    synthetix = Synthetix(chain_config.chain, web3, contract_manager, contract_caller, offload)
     return synthetix
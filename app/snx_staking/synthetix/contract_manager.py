@@ -1,4 +1,5 @@
 import asyncio
+from collections.abc import Awaitable, Callable
 
 import aiohttp
 from eth_typing import Address
@@ -12,6 +13,10 @@ from app.snx_staking.synthetix.constants import contract_names
 from app.snx_staking.synthetix.proxy_abi import proxy_abi
 from app.snx_staking.synthetix.utils import RawContractCall, str_to_bytes32
 
+ETHERSCAN_API = "https://api.etherscan.io/v2/api"
+
+AbiFetchType = Callable[[Address], Awaitable[str]]
+
 
 class ContractManager:
     def __init__(
@@ -21,6 +26,8 @@ class ContractManager:
         raw_contract_call: RawContractCall,
         address_resolver_address: Address,
         etherscan_key: str,
+        etherscan_api: str = ETHERSCAN_API,
+        wrap_abi_fetch: Callable[[AbiFetchType], AbiFetchType] | None = None,
     ) -> None:
         self._chain: Chain = chain
         self._web3: AsyncWeb3 = web3
@@ -29,6 +36,11 @@ class ContractManager:
             address=address_resolver_address, abi=address_resolver_abi
         )
         self._etherscan_key: str = etherscan_key
+        self._etherscan_api: str = etherscan_api
+        # Etherscan, or what wrap_abi_fetch makes of it, e.g. a traffic recorder
+        self._fetch_abi: AbiFetchType = (
+            wrap_abi_fetch(self._get_contract_abi) if wrap_abi_fetch else self._get_contract_abi
+        )
 
         self._contract_addresses: dict[str, Address] = {}
         self._contracts: dict[str, AsyncContract] = {}
@@ -70,7 +82,7 @@ class ContractManager:
         if contract_name.startswith("Proxy"):
             proxy_contract = self._web3.eth.contract(address=contract_address, abi=proxy_abi)
             target_address = await self._raw_contract_call(proxy_contract, "target", "latest")
-        abi = await self._get_contract_abi(target_address)
+        abi = await self._fetch_abi(target_address)
         contract = self._web3.eth.contract(address=contract_address, abi=abi)
 
         self._contracts[contract_name] = contract
@@ -87,7 +99,6 @@ class ContractManager:
         wait=wait_exponential(multiplier=1, min=1, max=5),
     )
     async def _get_contract_abi(self, contract_address: Address) -> str:
-        url = "https://api.etherscan.io/v2/api"
         params = {
             "chainid": self._chain.chain_id,
             "module": "contract",
@@ -95,7 +106,10 @@ class ContractManager:
             "address": contract_address,
             "apikey": self._etherscan_key,
         }
-        async with aiohttp.ClientSession() as session, session.get(url, params=params) as response:
+        async with (
+            aiohttp.ClientSession() as session,
+            session.get(self._etherscan_api, params=params) as response,
+        ):
             if response.status != 200:
                 raise Exception(f"HTTP {response.status}: {await response.text()}")
             data = await response.json()
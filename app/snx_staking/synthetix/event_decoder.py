@@ -0,0 +1,128 @@
+"""Decoding of raw eth_getLogs results of the events in contract_to_events.
+
+web3's get_logs formats every log into AttributeDicts and HexBytes and decodes
+it with the generic ABI codec. EventDecoder reads the arguments the observer
+uses straight from the hex of the topics and data words into compact tuples,
+AccountLog or TransferLog, a batch of logs at a time.
+
+Only arguments of one word each are read this way, what the Synthetix events
+have. EventDecoder raises ValueError for an ABI it can not read, its logs are
+then decoded by web3, see from_event_data.
+"""
+
+from collections.abc import Iterable, Mapping, Sequence
+from functools import lru_cache
+from typing import NamedTuple
+
+from eth_typing import ChecksumAddress
+from eth_utils import event_abi_to_log_topic, to_checksum_address
+from web3.types import EventData
+
+from app.snx_staking.synthetix.constants import EventName
+
+# hex digits of a topic or data word
+WORD = 64
+
+
+class AccountLog(NamedTuple):
+    block_number: int
+    account: ChecksumAddress
+    # amount, reward, deadline or time, see EVENT_FIELDS
+    value: int
+
+
+class TransferLog(NamedTuple):
+    block_number: int
+    sender: ChecksumAddress
+    receiver: ChecksumAddress
+    value: int
+
+
+EventLog = AccountLog | TransferLog
+# the fields of a raw log the decoder reads: hex block number, topics, data
+LogRow = tuple[str, Sequence[str], str]
+
+# event: arguments read into its log tuple, after the block number
+EVENT_FIELDS: dict[str, tuple[str, ...]] = {
+    EventName.MINT: ("account", "amount"),
+    EventName.BURN: ("account", "amount"),
+    EventName.SNX_TRANSFER: ("from", "to", "value"),
+    EventName.FEES_CLAIMED: ("account", "snxRewards"),
+    EventName.FLAGGED_FOR_LIQUIDATION: ("account", "deadline"),
+    EventName.REMOVED_FROM_LIQUIDATION: ("account", "time"),
+}
+
+
+def _log_type(event_name: str) -> type[EventLog]:
+    return TransferLog if event_name == EventName.SNX_TRANSFER else AccountLog
+
+
+# accounts repeat across logs, checksumming hashes the address
+@lru_cache(maxsize=2**16)
+def _checksum_word(word: str) -> ChecksumAddress:
+    return to_checksum_address("0x" + word[-40:])
+
+
+def _is_one_word(type_: str) -> bool:
+    # arrays and tuples may span several words of the data head
+    return not type_.endswith("]") and not type_.startswith("tuple")
+
+
+class EventDecoder:
+    def __init__(self, event_name: str, event_abi: Mapping) -> None:
+        """:raises ValueError: if the arguments of event_name can not be read from words"""
+        self.event_name: str = event_name
+        self.topic: str = "0x" + event_abi_to_log_topic(dict(event_abi)).hex()
+        self._log_type: type[EventLog] = _log_type(event_name)
+
+        inputs = event_abi["inputs"]
+        if not all(_is_one_word(arg["type"]) for arg in inputs if not arg["indexed"]):
+            raise ValueError(f"{event_name} has arguments over several words")
+        # topic 0 is the event signature, the data head has a word per argument
+        positions, topic, word = {}, 1, 0
+        for arg in inputs:
+            if arg["indexed"]:
+                positions[arg["name"]] = (True, topic, arg["type"])
+                topic += 1
+            else:
+                positions[arg["name"]] = (False, word, arg["type"])
+                word += 1
+
+        # (from topics, topic or data word index, is address)
+        self._fields: list[tuple[bool, int, bool]] = []
+        for name in EVENT_FIELDS[event_name]:
+            if name not in positions:
+                raise ValueError(f"{event_name} has no argument {name}")
+            indexed, index, type_ = positions[name]
+            if type_ != "address" and not type_.startswith("uint"):
+                raise ValueError(f"{event_name} argument {name} is {type_}")
+            self._fields.append((indexed, index, type_ == "address"))
+
+    def decode_all(self, logs: Iterable[Mapping]) -> list[EventLog]:
+        """:param logs: raw eth_getLogs results of the event, hex strings"""
+        return self.decode_rows((log["blockNumber"], log["topics"], log["data"]) for log in logs)
+
+    def decode_rows(self, rows: Iterable[LogRow]) -> list[EventLog]:
+        """Decodes raw logs reduced to rows, what is pickled to a worker of app.offload"""
+        make = self._log_type._make
+        fields = self._fields
+        checksum = _checksum_word
+        decoded = []
+        for block_number, topics, data in rows:
+            values = [int(block_number, 16)]
+            for indexed, index, is_address in fields:
+                if indexed:
+                    word = topics[index]
+                else:
+                    start = 2 + index * WORD
+                    word = data[start : start + WORD]
+                values.append(checksum(word) if is_address else int(word, 16))
+            decoded.append(make(values))
+        return decoded
+
+
+def from_event_data(event_name: str, logs: Iterable[EventData]) -> list[EventLog]:
+    """Log tuples of logs decoded by web3"""
+    make = _log_type(event_name)._make
+    fields = EVENT_FIELDS[event_name]
+    return [make([log["blockNumber"], *(log["args"][name] for name in fields)]) for log in logs]
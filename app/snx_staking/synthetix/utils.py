@@ -1,3 +1,4 @@
+import time
 from asyncio import Semaphore
 from typing import Any, Protocol
 
@@ -6,6 +7,9 @@ from tenacity import retry, stop_after_delay, wait_exponential
 from web3 import Web3
 from web3.contract.async_contract import AsyncContract, AsyncContractFunction
 
+from app import metrics
+from app.common import Chain
+
 sUSD_bytes = "0x7355534400000000000000000000000000000000000000000000000000000000"  # noqa N816
 SNX_bytes = "0x534e580000000000000000000000000000000000000000000000000000000000"
 
@@ -28,7 +32,7 @@ class RawContractCall(Protocol):
     ) -> Any: ...  # noqa: ANN401
 
 
-def create_raw_contract_call(max_parallel_calls: int = 10) -> RawContractCall:
+def create_raw_contract_call(chain: Chain, max_parallel_calls: int = 10) -> RawContractCall:
     semaphore: Semaphore = Semaphore(max_parallel_calls)
 
     @retry(wait=wait_exponential(max=60), stop=stop_after_delay(600))
@@ -43,6 +47,17 @@ def create_raw_contract_call(max_parallel_calls: int = 10) -> RawContractCall:
             *args, **kwargs
         )
         async with semaphore:
-            return await function.call(block_identifier=block_identifier)
+            started, outcome = time.perf_counter(), "error"
+            try:
+                result = await function.call(block_identifier=block_identifier)
+                outcome = "ok"
+                return result
+            finally:
+                metrics.RPC_CALL_SECONDS.observe(
+                    time.perf_counter() - started,
+                    chain=chain,
+                    function=function_name,
+                    outcome=outcome,
+                )
 
     return raw_contract_call
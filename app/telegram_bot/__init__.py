@@ -1,17 +1,29 @@
 from app.telegram_bot.account_update_processor import AccountUpdateProcessor
+from app.telegram_bot.chat_cache import ChatCache
 from app.telegram_bot.error_handler import error_handler
-from app.telegram_bot.handlers import handlers
+from app.telegram_bot.handlers import admin_handlers, handlers
+from app.telegram_bot.metered_request import MeteredRequest
 from app.telegram_bot.snx_bot_context import BotData, ChatData, NotFoundError, SnxBotContext
-from app.telegram_bot.utils import run_account_update_processor, update_staking_observers_job
+from app.telegram_bot.tracked_application import TrackedApplication
+from app.telegram_bot.utils import (
+    run_account_update_processor,
+    run_pg_listener,
+    update_staking_observers_job,
+)
 
 __all__ = [
     "AccountUpdateProcessor",
     "error_handler",
     "handlers",
+    "admin_handlers",
     "BotData",
+    "ChatCache",
     "ChatData",
+    "MeteredRequest",
     "SnxBotContext",
+    "TrackedApplication",
     "run_account_update_processor",
+    "run_pg_listener",
     "update_staking_observers_job",
     "NotFoundError",
 ]
@@ -1,18 +1,28 @@
 import asyncio
+import contextlib
 import logging
+import time
+from collections.abc import Coroutine
 from uuid import UUID
 
 from telegram import Bot, InlineKeyboardMarkup
-from telegram.error import Forbidden
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
 
-from app.common import SNXMultiChainData
-from app.data_access import UOWFactoryType
-from app.models import Account, Notif, NotifType
+from app import fixed_point, metrics
+from app.common import AccountUpdate, SNXMultiChainData
+from app.data_access import UOWFactoryType, track_queries
+from app.models import AccountOutbox, AccountRecord, Chat, NotifRecord, NotifType
+from app.profiling import ProfileTarget, profiled
 from app.telegram_bot import message_composer
+from app.telegram_bot.chat_cache import ChatCache
 from app.telegram_bot.dashboard import update_dashboard_message
 
 logger = logging.getLogger(__name__)
 
+# Seconds before an update whose processing failed is claimed again,
+# unless Telegram asks to wait longer
+RETRY_DELAY = 5
+
 
 class AccountUpdateProcessor:
     def __init__(
@@ -20,12 +30,29 @@ class AccountUpdateProcessor:
         bot: Bot,
         uow_factory: UOWFactoryType,
         snx_data: SNXMultiChainData,
-        updated_account_queue: asyncio.Queue,
+        updates_available: asyncio.Event,
+        digest_window: float = 0,
+        batch_size: int = 100,
+        lease: float = 300,
+        poll_interval: float = 5,
+        chat_cache: ChatCache | None = None,
     ):
         self._uow_factory: UOWFactoryType = uow_factory
         self._bot: Bot = bot
         self._snx_data: SNXMultiChainData = snx_data
-        self._updated_account_queue: asyncio.Queue = updated_account_queue
+        self._updates_available: asyncio.Event = updates_available
+        self._digest_window: float = digest_window
+        self._batch_size: int = batch_size
+        self._lease: float = lease
+        self._poll_interval: float = poll_interval
+        # the bot's cache, when it runs in the same process
+        self._chat_cache: ChatCache | None = chat_cache
+        # chat_id: {notif_id: (text, update, sent)}
+        self._pending_notifs: dict[int, dict[UUID, tuple[str, AccountUpdate, asyncio.Future]]] = {}
+        self._background_tasks: set[asyncio.Task] = set()
+        # claimed rows whose notifs are through, with None or seconds to retry after
+        self._finished: list[tuple[AccountOutbox, float | None]] = []
+        self._finished_available: asyncio.Event = asyncio.Event()
         self._satisfied = {
             NotifType.ratio: self._ratio_satisfied,
             NotifType.rewards_claimable: self._rewards_claimable_satisfied,
@@ -35,94 +62,281 @@ class AccountUpdateProcessor:
 
     # NOTIFS
     @staticmethod
-    def _ratio_satisfied(notif: Notif) -> bool:
+    def _ratio_satisfied(notif: NotifRecord, account: AccountRecord) -> bool:
         above, target, current = (
             notif.params["above"],
-            notif.params["target"],
-            notif.account.c_ratio,
+            fixed_point.c_ratio_from_float(notif.params["target"]),
+            account.c_ratio,
         )
         return (above and current > target) or (not above and current < target)
 
-    def _rewards_claimable_satisfied(self, notif: Notif) -> bool:
-        account = notif.account
+    def _rewards_claimable_satisfied(self, _: NotifRecord, account: AccountRecord) -> bool:
         if not account.claimable_snx:
             return False
 
-        issuance_ratio = self._snx_data[account.chain].issuance_ratio
-        ratio_threshold = issuance_ratio * 0.9902  # found experimentally
+        issuance_ratio = fixed_point.c_ratio_from_float(
+            self._snx_data[account.chain].issuance_ratio
+        )
+        ratio_threshold = issuance_ratio * 9902 // 10000  # found experimentally
         return account.c_ratio > ratio_threshold
 
     @staticmethod
-    def _rewards_claimed_satisfied(notif: Notif) -> bool:
-        return notif.account.claimable_snx == 0
+    def _rewards_claimed_satisfied(_: NotifRecord, account: AccountRecord) -> bool:
+        return account.claimable_snx == 0
 
     @staticmethod
-    def _flagged_for_liquidation_satisfied(notif: Notif) -> bool:
-        return notif.account.liquidation_deadline is not None
+    def _flagged_for_liquidation_satisfied(_: NotifRecord, account: AccountRecord) -> bool:
+        return account.liquidation_deadline is not None
+
+    def _invalidate_chat(self, chat_id: int) -> None:
+        if self._chat_cache is not None:
+            self._chat_cache.invalidate(chat_id)
 
-    async def _send_notif(self, notif: Notif) -> tuple[int, str] | None:
-        """:returns: int sent_message_id"""
-        text, keyboard = message_composer.render_notif(notif)
-        chat = notif.chat
+    def _run_in_background(self, coro: Coroutine) -> None:
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    def _queue_notif(
+        self, chat_id: int, notif_id: UUID, text: str, update: AccountUpdate
+    ) -> asyncio.Future:
+        """Notifs for one chat are collected for digest_window seconds and sent as one message.
+
+        :returns future resolved once the digest with the notif is sent or given up on,
+            with None, or seconds to retry after if sending failed
+        """
+        if chat_id not in self._pending_notifs:
+            self._pending_notifs[chat_id] = {}
+            self._run_in_background(self._send_chat_notifs(chat_id))
+        pending = self._pending_notifs[chat_id]
+        if notif_id in pending:
+            _, pending_update, sent = pending[notif_id]
+            update = pending_update.merge(update)
+        else:
+            sent = asyncio.get_running_loop().create_future()
+        pending[notif_id] = (text, update, sent)
+        return sent
+
+    async def _send_chat_notifs(self, chat_id: int) -> None:
+        """Sends digests one at a time until nothing is pending for the chat"""
+        try:
+            while self._pending_notifs[chat_id]:
+                await asyncio.sleep(self._digest_window)
+                pending, self._pending_notifs[chat_id] = self._pending_notifs[chat_id], {}
+                await self._send_notifs_digest(chat_id, pending)
+        finally:
+            del self._pending_notifs[chat_id]
+
+    async def _send_notifs_digest(
+        self, chat_id: int, pending: dict[UUID, tuple[str, AccountUpdate, asyncio.Future]]
+    ) -> None:
+        notif_texts, updates, sent = zip(*pending.values(), strict=True)
+        retry_after = RETRY_DELAY
+        try:
+            retry_after = await self._send_digest_message(
+                chat_id, list(pending), list(notif_texts), updates
+            )
+        finally:
+            for future in sent:
+                if not future.done():
+                    future.set_result(retry_after)
+
+    async def _send_digest_message(
+        self,
+        chat_id: int,
+        notif_ids: list[UUID],
+        notif_texts: list[str],
+        updates: tuple[AccountUpdate, ...],
+    ) -> float | None:
+        """:returns None once the notifs are done with, sent or their chat gone,
+        otherwise seconds to retry after
+        """
+        text, keyboard = message_composer.notifs_message(notif_texts)
 
         try:
             sent_message = await self._bot.send_message(
-                chat_id=chat.id, text=text, reply_markup=keyboard
+                chat_id=chat_id, text=text, reply_markup=keyboard
             )
-            if chat.sent_notif_message_id:
-                await self._bot.edit_message_text(
-                    chat.sent_notif_message_text,
-                    chat.id,
-                    chat.sent_notif_message_id,
-                    reply_markup=InlineKeyboardMarkup([]),
-                )
-            return sent_message.id, text
         except Forbidden:
-            return
+            async with self._uow_factory() as uow:
+                if chat := await uow.chats.get_one_or_none(Chat.id == chat_id):
+                    await uow.chats.delete(chat)
+            self._invalidate_chat(chat_id)
+            return None
+        except RetryAfter as e:
+            logger.warning(f"Flood control on chat {chat_id}, retrying in {e.retry_after}s")
+            return max(e.retry_after, RETRY_DELAY)
+        except Exception as e:
+            logger.error("Failed to send notifs, they stay enabled", exc_info=e)
+            return RETRY_DELAY
+        sent_at = time.time()
+        for update in updates:
+            metrics.NOTIF_LATENCY_SECONDS.observe(
+                sent_at - update.observed_at, lane="urgent" if update.urgent else "regular"
+            )
 
-    async def _process_notif(self, notif_id: UUID):
+        # disabled only once sent, so a crash before this point re-sends them
         async with self._uow_factory() as uow:
-            if not (notif := await uow.notifs.get_by_id_or_none(notif_id)):
-                return
-            if notif.enabled and self._satisfied[notif.type](notif):
-                message_details = await self._send_notif(notif)
-                if not message_details:
-                    await uow.chats.delete(notif.chat)
-                    return
-                sent_message_id, text = message_details
-                notif.chat.sent_notif_message_id = sent_message_id
-                notif.chat.sent_notif_message_text = text
-                notif.enabled = False
-            if not notif.enabled and not self._satisfied[notif.type](notif):
-                notif.enabled = True
-
-    async def _process_account_notifs(self, account: Account):
-        for chat_account in account.chat_accounts:
-            for notif in chat_account.notifs:
-                await self._process_notif(notif.id)
+            await uow.notifs.set_enabled(notif_ids, False)
+            if not (chat := await uow.chats.get_one_or_none(Chat.id == chat_id)):
+                return None
+            previous_message = chat.sent_notif_message_id, chat.sent_notif_message_text
+            chat.sent_notif_message_id = sent_message.id
+            chat.sent_notif_message_text = text
+        self._invalidate_chat(chat_id)
+        if previous_message[0]:
+            self._run_in_background(self._remove_notif_keyboard(chat_id, *previous_message))
+        return None
 
-    # DASHBOARD
-    async def _update_dashboard(self, account: Account):
-        for chat_account in account.chat_accounts:
-            await update_dashboard_message(
-                self._bot, chat_account.chat_id, self._uow_factory, self._snx_data
+    async def _remove_notif_keyboard(self, chat_id: int, message_id: int, text: str) -> None:
+        try:
+            await self._bot.edit_message_text(
+                text, chat_id, message_id, reply_markup=InlineKeyboardMarkup([])
             )
+        except BadRequest:
+            pass
+        except TelegramError as e:
+            logger.warning(f"Failed to remove notif keyboard: {e}")
+
+    async def _process_account_notifs(
+        self, account: AccountRecord, notifs: list[NotifRecord], update: AccountUpdate
+    ) -> list[asyncio.Future]:
+        """Queues enabled notifs the account satisfies, re-arms disabled ones it no longer does.
+
+        :returns futures of the queued notifs
+        """
+        sent, rearmed = [], []
+        for notif in notifs:
+            satisfied = self._satisfied[notif.type](notif, account)
+            if not notif.enabled:
+                # re-arm once the condition is no longer met
+                if not satisfied:
+                    rearmed.append(notif.id)
+            elif satisfied:
+                text = message_composer.render_notif(notif, account)
+                sent.append(self._queue_notif(notif.chat_id, notif.id, text, update))
+        if rearmed:
+            async with self._uow_factory() as uow:
+                await uow.notifs.set_enabled(rearmed, True)
+        return sent
+
+    # DASHBOARD
+    async def _update_dashboards(self, chat_ids: list[int]):
+        for chat_id in chat_ids:
+            await update_dashboard_message(self._bot, chat_id, self._uow_factory, self._snx_data)
 
     # WORKER
+    async def _process_account_update(
+        self, entry: AccountOutbox
+    ) -> tuple[bool, list[asyncio.Future]]:
+        """:returns whether dashboards and notifs were processed, futures of the queued notifs"""
+        async with self._uow_factory() as uow:
+            if not (account := await uow.accounts.get_record_by_id_or_none(entry.account_id)):
+                return True, []
+            chat_ids, notifs = await uow.notifs.get_subscriptions(account.id)
+        for chat_id in chat_ids:
+            self._invalidate_chat(chat_id)
+        dashboards, sent = await asyncio.gather(
+            self._update_dashboards(chat_ids),
+            self._process_account_notifs(
+                account, notifs, AccountUpdate(entry.observed_at, entry.urgent)
+            ),
+            return_exceptions=True,
+        )
+        for error in (dashboards, sent):
+            if isinstance(error, BaseException):
+                logger.error(
+                    f"Failed to process account {entry.account_id} update", exc_info=error
+                )
+        if isinstance(sent, BaseException):
+            return False, []
+        return not isinstance(dashboards, BaseException), sent
+
+    async def _wait_for_updates(self) -> None:
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(self._updates_available.wait(), self._poll_interval)
+        self._updates_available.clear()
+
+    def _finish_when_sent(
+        self, entry: AccountOutbox, ok: bool, sent: list[asyncio.Future]
+    ) -> None:
+        """Hands the row to _ack_finished once the digests of its notifs are sent or failed"""
+
+        def finish(results: asyncio.Future) -> None:
+            if results.cancelled():
+                return
+            delays = [delay for delay in results.result() if delay is not None]
+            retry_after = None if ok and not delays else max(delays, default=RETRY_DELAY)
+            self._finished.append((entry, retry_after))
+            self._finished_available.set()
+
+        asyncio.gather(*sent).add_done_callback(finish)
+
+    async def _ack_finished(self) -> None:
+        """Acks rows as their notifs are sent and releases the failed ones for a retry.
+
+        Rows finished meanwhile are acked together, in one transaction.
+        """
+        while True:
+            await self._finished_available.wait()
+            self._finished_available.clear()
+            finished, self._finished = self._finished, []
+            done, retries = [], {}
+            for entry, retry_after in finished:
+                if retry_after is None:
+                    done.append(entry)
+                else:
+                    retries.setdefault(retry_after, []).append(entry)
+            # noinspection PyBroadException
+            try:
+                async with self._uow_factory() as uow:
+                    await uow.outbox.ack(done)
+                    for delay, entries in retries.items():
+                        await uow.outbox.release(entries, delay)
+            except Exception as e:
+                # the rows are claimed again once their lease expires
+                logger.error(f"Failed to ack {len(finished)} outbox rows", exc_info=e)
+                continue
+            now = time.time()
+            for entry in done:
+                metrics.UPDATE_LATENCY_SECONDS.observe(now - entry.observed_at)
+
     async def worker(self):
+        """Drains the account outbox.
+
+        Claimed rows are acked once their notifs are sent, so pending work survives
+        restarts and several workers can share the outbox. The worker claims more
+        rows meanwhile, so the digest window holds back neither the next batch nor
+        urgent updates. Rows whose dashboards or notifs failed are released to be
+        retried after RETRY_DELAY, or after the wait Telegram asked for, rather than
+        once their lease expires.
+        """
+        acker = asyncio.create_task(self._ack_finished())
+        try:
+            await self._claim_updates()
+        finally:
+            acker.cancel()
+
+    async def _claim_updates(self) -> None:
         while True:
             # noinspection PyBroadException
             try:
-                account_id = await self._updated_account_queue.get()
                 async with self._uow_factory() as uow:
-                    if not (account := await uow.accounts.get_by_id_or_none(account_id)):
-                        continue
-                await asyncio.gather(
-                    self._update_dashboard(account),
-                    self._process_account_notifs(account),
-                    return_exceptions=True,
-                )
+                    claimed = await uow.outbox.claim(self._batch_size, self._lease)
+                if not claimed:
+                    await self._wait_for_updates()
+                    continue
+                for entry in claimed:
+                    with (
+                        metrics.UPDATE_PROCESSING_SECONDS.time(),
+                        profiled(ProfileTarget.worker, str(entry.account_id)),
+                        track_queries("worker_item", f"account {entry.account_id}"),
+                    ):
+                        ok, sent = await self._process_account_update(entry)
+                    self._finish_when_sent(entry, ok, sent)
             except asyncio.CancelledError:
-                pass
+                # stops only when the worker itself is cancelled
+                if asyncio.current_task().cancelling():
+                    raise
             except Exception as e:
                 logger.error("Unexpected exception in worker", exc_info=e)
@@ -0,0 +1,65 @@
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+from sqlalchemy import inspect
+
+
+class ChatCache:
+    """Detached chat graphs read by the menus, per chat.
+
+    Writes made through SnxBotContext drop the chat once committed, and so does
+    the update processor when it runs in the same process. Otherwise account
+    metrics may lag for up to ttl seconds. Only graphs that are fully loaded are
+    kept, an expired object would raise once read outside its session.
+    """
+
+    def __init__(self, ttl: float = 30, max_chats: int = 10_000) -> None:
+        self._ttl: float = ttl
+        self._max_chats: int = max_chats
+        # chat_id: {key: (expires_at, value)}
+        self._entries: OrderedDict[int, dict[Hashable, tuple[float, Any]]] = OrderedDict()
+        self._invalidations: int = 0
+
+    async def get_or_load[T](
+        self, chat_id: int, key: Hashable, loader: Callable[[], Awaitable[T]]
+    ) -> T:
+        now = time.monotonic()
+        entries = self._entries.get(chat_id)
+        if entries is not None and (entry := entries.get(key)) and entry[0] > now:
+            self._entries.move_to_end(chat_id)
+            return entry[1]
+
+        invalidations = self._invalidations
+        value = await loader()
+        # a write committed while loading may not be in the value, it is not kept then
+        if invalidations != self._invalidations or not _loaded(value):
+            return value
+        self._entries.setdefault(chat_id, {})[key] = (time.monotonic() + self._ttl, value)
+        self._entries.move_to_end(chat_id)
+        if len(self._entries) > self._max_chats:
+            self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, chat_id: int) -> None:
+        self._invalidations += 1
+        self._entries.pop(chat_id, None)
+
+
+def _loaded(value: object) -> bool:
+    """Whether no ORM object of the value's loaded graph has expired attributes"""
+    pending, seen = [value], set()
+    while pending:
+        state = inspect(pending.pop(), raiseerr=False)
+        if state is None or id(state) in seen:
+            continue
+        seen.add(id(state))
+        if state.expired_attributes:
+            return False
+        for relationship in state.mapper.relationships:
+            if relationship.key in state.unloaded:
+                continue
+            related = state.dict.get(relationship.key)
+            pending.extend(related if isinstance(related, list) else [related])
+    return True
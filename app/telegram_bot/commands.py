@@ -1,13 +1,16 @@
 import contextlib
+import datetime
 from collections.abc import Callable
 from uuid import UUID
 
 from telegram import Message, Update
 from telegram.ext import ConversationHandler
 
+from app.data_access import LoadPlan
 from app.models import NotifType
+from app.profiling import ProfileTarget, arm
 from app.telegram_bot import message_composer, utils
-from app.telegram_bot.constants import States
+from app.telegram_bot.constants import HISTORY_DEFAULT_DAYS, HISTORY_MAX_DAYS, States
 from app.telegram_bot.dashboard import compose_dashboard_message, update_dashboard_message
 from app.telegram_bot.snx_bot_context import SnxBotContext
 
@@ -39,17 +42,24 @@ async def dashboard(update: Update, context: SnxBotContext) -> int:
     chat = await context.get_chat()
     text = compose_dashboard_message(chat, context.snx_data)
     res: Message = await message_delivery(text=text)
-
-    async with context.uow_factory() as uow:
-        chat = await uow.merge(chat)
-        chat.dashboard_message_id = res.message_id
+    await context.set_dashboard_message_id(res.message_id)
     return ConversationHandler.END
 
 
+async def history(update: Update, context: SnxBotContext):
+    days = HISTORY_DEFAULT_DAYS
+    with contextlib.suppress(IndexError, ValueError):
+        days = min(max(int(context.args[0]), 1), HISTORY_MAX_DAYS)
+    since = datetime.datetime.now() - datetime.timedelta(days=days)
+    chat_accounts, account_history = await context.get_accounts_history(since)
+    text = message_composer.history(chat_accounts, account_history, days)
+    await update.effective_chat.send_message(text)
+
+
 # ACCOUNT CONVERSATION COMMANDS
 async def accounts_menu(update: Update, context: SnxBotContext) -> str:
     message_delivery: Callable = _get_message_delivery(update)
-    chat = await context.get_chat()
+    chat = await context.get_chat(LoadPlan.ACCOUNTS_MENU)
     text, keyboard = message_composer.accounts_menu(chat.chat_accounts)
     await message_delivery(text=text, reply_markup=keyboard)
     return States.ACCOUNTS_MENU
@@ -170,6 +180,22 @@ async def info(update: Update, _: SnxBotContext):
     await update.effective_chat.send_message(text, parse_mode="MarkdownV2")
 
 
+async def profile(update: Update, context: SnxBotContext):
+    """/profile <target> [count], admin only, see handlers.admin_handlers"""
+    try:
+        target = ProfileTarget(context.args[0])
+        count = int(context.args[1]) if len(context.args) > 1 else 1
+    except (IndexError, ValueError):
+        await update.effective_chat.send_message(
+            f"Usage: /profile {'|'.join(ProfileTarget)} [count]"
+        )
+        return
+    arm(target, count)
+    await update.effective_chat.send_message(
+        f"Profiling the next {count} {target} runs of the bot process."
+    )
+
+
 async def payday(update: Update, context: SnxBotContext):
     text = message_composer.payday(context.snx_data)
     await update.effective_chat.send_message(text)
@@ -52,4 +52,8 @@ COMMANDS = [
     ("accounts", "Edit accounts"),
     ("info", "Info"),
     ("payday", "Time remaining until the end of the epoch"),
+    ("history", "C-ratio history"),
 ]
+
+HISTORY_DEFAULT_DAYS = 7
+HISTORY_MAX_DAYS = 90
@@ -1,46 +1,83 @@
 import logging
+from collections import OrderedDict
+from uuid import UUID
 
 import httpx
 from telegram import Bot
 from telegram.error import BadRequest, NetworkError
 from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 
+from app import fixed_point
 from app.common import SNXMultiChainData
-from app.data_access import UOWFactoryType
-from app.models import Chat
+from app.data_access import LoadPlan, UOWFactoryType
+from app.models import Account, Chat, ChatAccountSettings
 
 logger = logging.getLogger(__name__)
 
 
+class DashboardFragmentCache:
+    """Rendered dashboard blocks per account.
+
+    A block depends only on the account state and the display settings, so
+    accounts watched by many chats are rendered once per change instead of
+    once per chat. A block is replaced when its account version changes.
+    """
+
+    def __init__(self, max_accounts: int = 10_000) -> None:
+        self._max_accounts: int = max_accounts
+        # account_id: (account version, {settings: block})
+        self._fragments: OrderedDict[UUID, tuple[int, dict[frozenset, str]]] = OrderedDict()
+
+    def get(self, account: Account, settings: ChatAccountSettings) -> str:
+        version = account.version
+        entry = self._fragments.get(account.id)
+        if entry is None or entry[0] != version:
+            entry = self._fragments[account.id] = (version, {})
+        self._fragments.move_to_end(account.id)
+        if len(self._fragments) > self._max_accounts:
+            self._fragments.popitem(last=False)
+
+        blocks = entry[1]
+        settings_key = frozenset(settings.items())
+        if (block := blocks.get(settings_key)) is None:
+            block = blocks[settings_key] = render_account_fragment(account, settings)
+        return block
+
+
+fragment_cache = DashboardFragmentCache()
+
+
+def render_account_fragment(account: Account, settings: ChatAccountSettings) -> str:
+    if not account.inited:
+        return "Not initialized yet. This may take up to 10 minutes.\n\n"
+    text = ""
+    if settings["address"]:
+        text += f"{account.address[:6]}... {account.chain}\n"
+    if settings["c_ratio"]:
+        text += f"C-ratio: {fixed_point.c_ratio_percent(account.c_ratio)}%\n"
+    if settings["collateral"]:
+        snx_count = fixed_point.from_wad(account.snx_count)
+        collateral = fixed_point.from_wad(account.collateral // fixed_point.WAD)
+        text += f"Collateral: {snx_count} SNX = ${collateral}\n"
+    if settings["debt"]:
+        text += f"Debt: {fixed_point.from_wad(account.debt)} sUSD\n"
+    if settings["claimable_snx"]:
+        text += f"Claimable SNX: {fixed_point.from_wad(account.claimable_snx)}\n"
+    if settings["liquidation_deadline"]:
+        if not account.liquidation_deadline:
+            liquidation_text = "Not flagged for liquidation"
+        else:
+            liquidation_text = f"Liquidation deadline: {
+                account.liquidation_deadline.strftime('%Y-%m-%d %H:%M:%S')
+            }"
+        text += liquidation_text + "\n"
+    return text + "\n"
+
+
 def compose_dashboard_message(chat: Chat, snx_data: SNXMultiChainData) -> str:
     text = f"SNX Price: ${snx_data.format_snx_price()} \n\n"
     for link in chat.chat_accounts:
-        account = link.account
-        settings = link.account_settings
-        if not account.inited:
-            text += "Not initialized yet. This may take up to 10 minutes.\n\n"
-            continue
-        if settings["address"]:
-            text += f"{account.address[:6]}... {account.chain}\n"
-        if settings["c_ratio"]:
-            text += f"C-ratio: {round(account.c_ratio * 100, 1)}%\n"
-        if settings["collateral"]:
-            snx_count = round(account.snx_count / 10**18, 2)
-            collateral = round(account.collateral / 10**36, 2)
-            text += f"Collateral: {snx_count} SNX = ${collateral}\n"
-        if settings["debt"]:
-            text += f"Debt: {round(account.debt / 10**18, 2)} sUSD\n"
-        if settings["claimable_snx"]:
-            text += f"Claimable SNX: {round(account.claimable_snx / 10**18, 2)}\n"
-        if settings["liquidation_deadline"]:
-            if not account.liquidation_deadline:
-                liquidation_text = "Not flagged for liquidation"
-            else:
-                liquidation_text = f"Liquidation deadline: {
-                    account.liquidation_deadline.strftime('%Y-%m-%d %H:%M:%S')
-                }"
-            text += liquidation_text + "\n"
-        text += "\n"
+        text += fragment_cache.get(link.account, link.account_settings)
     return text
 
 
@@ -61,7 +98,7 @@ async def update_dashboard_message(
     snx_data: SNXMultiChainData,
 ) -> None:
     async with uow_factory() as uow:
-        chat = await uow.chats.get_one_or_none(Chat.id == chat_id)
+        chat = await uow.chats.get_one_or_none(Chat.id == chat_id, load=LoadPlan.DASHBOARD)
         if not chat.dashboard_message_id:
             return
     text = compose_dashboard_message(chat, snx_data)
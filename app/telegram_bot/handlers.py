@@ -112,6 +112,13 @@ dash_command_handler = CommandHandler("dashboard", commands.dashboard)
 dash_callback_handler = CallbackQueryHandler(commands.dashboard, pattern=Callbacks.DASHBOARD)
 info_handler = CommandHandler("info", commands.info)
 payday_handler = CommandHandler("payday", commands.payday)
+history_handler = CommandHandler("history", commands.history)
+
+
+def admin_handlers(admin_ids: list[int]) -> list[CommandHandler]:
+    admin = filters.User(user_id=admin_ids)
+    return [CommandHandler("profile", commands.profile, filters=admin)]
+
 
 handlers = [
     start_handler,
@@ -121,4 +128,5 @@ handlers = [
     dash_command_handler,
     dash_callback_handler,
     payday_handler,
+    history_handler,
 ]
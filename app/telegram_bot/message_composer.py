@@ -2,8 +2,16 @@ from uuid import UUID
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
+from app import fixed_point
 from app.common import SNXMultiChainData
-from app.models import ChatAccount, Notif, NotifType
+from app.models import (
+    AccountRecord,
+    AccountSnapshotHourly,
+    ChatAccount,
+    Notif,
+    NotifRecord,
+    NotifType,
+)
 from app.telegram_bot import texts, utils
 from app.telegram_bot.constants import NOTIF_TYPE_NAMES, Callbacks
 from app.telegram_bot.utils import remaining_time_until
@@ -14,6 +22,7 @@ def start() -> str:
 👋 Welcome! I'm your personal SNX staking monitoring assistant.
 💼 /accounts
 📈 /dashboard
+📉 /history
 💸/payday
 ℹ️ /info
 
@@ -208,15 +217,20 @@ def create_notif_already_exists(selected_account_address: str) -> tuple[str, Inl
     return text, keyboard
 
 
-def render_notif(notif: Notif) -> tuple[str, InlineKeyboardMarkup]:
+def render_notif(notif: NotifRecord, account: AccountRecord) -> str:
     if notif.type == NotifType.ratio:
         direction = "above" if notif.params["above"] else "below"
         text = (
-            f"{notif.account.address[:6]}... c-ratio {direction}"
+            f"{account.address[:6]}... c-ratio {direction}"
             f" {round(notif.params['target'] * 100, 2)}%"
         )
     else:
-        text = f"{notif.account.address[:6]}... {NOTIF_TYPE_NAMES[notif.type]}"
+        text = f"{account.address[:6]}... {NOTIF_TYPE_NAMES[notif.type]}"
+    return text
+
+
+def notifs_message(notif_texts: list[str]) -> tuple[str, InlineKeyboardMarkup]:
+    text = "\n".join(notif_texts)
     buttons = [
         [
             InlineKeyboardButton(
@@ -240,3 +254,29 @@ def payday(snx_data: SNXMultiChainData) -> str:
         remaining_time = remaining_time_until(period_end)
         text += f"{chain}: {remaining_time}\n"
     return text
+
+
+def history(
+    chat_accounts: list[ChatAccount],
+    account_history: dict[UUID, list[AccountSnapshotHourly]],
+    days: int,
+) -> str:
+    if not chat_accounts:
+        return "No accounts yet, add one in /accounts"
+
+    text = f"C-RATIO HISTORY, {days}D\n"
+    for chat_account in chat_accounts:
+        account = chat_account.account
+        text += f"\n{account.address[:6]}... {account.chain}\n"
+        if not (hours := account_history.get(account.id)):
+            text += "No history yet\n"
+            continue
+        c_ratio_min = min(hour.c_ratio_min for hour in hours)
+        c_ratio_max = max(hour.c_ratio_max for hour in hours)
+        text += utils.sparkline([hour.c_ratio for hour in hours]) + "\n"
+        text += (
+            f"min {fixed_point.c_ratio_percent(c_ratio_min)}% "
+            f"max {fixed_point.c_ratio_percent(c_ratio_max)}% "
+            f"now {fixed_point.c_ratio_percent(hours[-1].c_ratio)}%\n"
+        )
+    return text
@@ -0,0 +1,21 @@
+from telegram.error import RetryAfter, TelegramError
+from telegram.request import HTTPXRequest
+
+from app import metrics
+
+
+class MeteredRequest(HTTPXRequest):
+    """HTTPXRequest counting Bot API requests by method and outcome"""
+
+    async def post(self, url: str, *args, **kwargs) -> dict | list | bool:
+        method = url.rsplit("/", 1)[-1]
+        try:
+            result = await super().post(url, *args, **kwargs)
+        except RetryAfter:
+            metrics.TELEGRAM_REQUESTS.inc(method=method, outcome="retry_after")
+            raise
+        except TelegramError:
+            metrics.TELEGRAM_REQUESTS.inc(method=method, outcome="error")
+            raise
+        metrics.TELEGRAM_REQUESTS.inc(method=method, outcome="ok")
+        return result
@@ -1,4 +1,6 @@
-import asyncio
+import datetime
+import time
+from collections import defaultdict
 from collections.abc import Callable
 from functools import wraps
 from typing import NotRequired, TypedDict, TypeVar
@@ -8,10 +10,11 @@ from eth_typing import AnyAddress
 from telegram.ext import Application, CallbackContext, ExtBot
 
 from app.common import Chain, SNXMultiChainData
-from app.data_access import UnitOfWork, UOWFactoryType
-from app.models import Account, Chat, ChatAccount, Notif, NotifType
+from app.data_access import LoadPlan, LoadPlanType, PgListener, UnitOfWork, UOWFactoryType
+from app.models import AccountSnapshotHourly, Chat, ChatAccount, Notif, NotifType
 from app.snx_staking import StakingObserver
 from app.telegram_bot.account_update_processor import AccountUpdateProcessor
+from app.telegram_bot.chat_cache import ChatCache
 
 T = TypeVar("T")
 
@@ -30,17 +33,47 @@ def with_uow(func: Callable[..., T]) -> Callable[..., T]:
     return wrapper
 
 
+def with_read_only_uow[T](func: Callable[..., T]) -> Callable[..., T]:
+    """with_uow for reads, served by the replica once the chat's own writes reached it"""
+
+    @wraps(func)
+    async def wrapper(self, *args, **kwargs) -> T:  # noqa
+        written_at = self.chat_data.get("written_at")
+        async with self.uow_factory(read_only=True, written_at=written_at) as uow:
+            return await func(self, *args, uow=uow, **kwargs)
+
+    return wrapper
+
+
+def invalidates_chat[T](func: Callable[..., T]) -> Callable[..., T]:
+    """Drops the cached chat once the write has committed or failed"""
+
+    @wraps(func)
+    async def wrapper(self, *args, **kwargs) -> T:  # noqa
+        try:
+            return await func(self, *args, **kwargs)
+        finally:
+            self.chat_data["written_at"] = time.monotonic()
+            self.chat_cache.invalidate(self._chat_id)
+
+    return wrapper
+
+
 class ChatData(TypedDict):
     selected_chat_account: NotRequired[UUID]
     notif_type: NotRequired[NotifType]
+    # time.monotonic() of the last write, see with_read_only_uow
+    written_at: NotRequired[float]
 
 
 class BotData(TypedDict):
     snx_data: SNXMultiChainData
     uow_factory: UOWFactoryType
-    new_accounts_queues: dict[Chain, asyncio.Queue[AnyAddress]]
-    staking_observers: dict[Chain, StakingObserver]
-    account_update_processor: AccountUpdateProcessor
+    pg_listener: PgListener
+    chat_cache: ChatCache
+    # only when observers and the update processor run in the bot process
+    staking_observers: NotRequired[dict[Chain, StakingObserver]]
+    account_update_processor: NotRequired[AccountUpdateProcessor]
 
 
 class SnxBotContext(CallbackContext[ExtBot, dict, ChatData, BotData]):
@@ -63,14 +96,37 @@ class SnxBotContext(CallbackContext[ExtBot, dict, ChatData, BotData]):
     def snx_data(self) -> SNXMultiChainData:
         return self.bot_data["snx_data"]
 
-    @with_uow
-    async def get_chat(self, *, uow: UnitOfWork) -> Chat:
-        """Gets current chat or raises ChatNotFoundError"""
-        chat = await uow.chats.get_one_or_none(Chat.id == self._chat_id)
+    @property
+    def chat_cache(self) -> ChatCache:
+        return self.bot_data["chat_cache"]
+
+    async def get_chat(self, load: LoadPlanType = LoadPlan.DASHBOARD) -> Chat:
+        """Gets current chat, cached, or raises NotFoundError"""
+        return await self.chat_cache.get_or_load(
+            self._chat_id, load, lambda: self._load_chat(load)
+        )
+
+    @with_read_only_uow
+    async def _load_chat(self, load: LoadPlanType, *, uow: UnitOfWork) -> Chat:
+        chat = await uow.chats.get_one_or_none(Chat.id == self._chat_id, load=load)
         if chat is None:
             raise NotFoundError("Chat")
         return chat
 
+    @with_read_only_uow
+    async def get_accounts_history(
+        self, since: datetime.datetime, *, uow: UnitOfWork
+    ) -> tuple[list[ChatAccount], dict[UUID, list[AccountSnapshotHourly]]]:
+        """:returns chat accounts and hourly history of their accounts"""
+        chat = await uow.chats.get_one_or_none(Chat.id == self._chat_id, load=LoadPlan.DASHBOARD)
+        if chat is None:
+            raise NotFoundError("Chat")
+        account_ids = [chat_account.account_id for chat_account in chat.chat_accounts]
+        account_history = defaultdict(list)
+        for hour in await uow.snapshots_hourly.get_history(account_ids, since):
+            account_history[hour.account_id].append(hour)
+        return chat.chat_accounts, account_history
+
     @with_uow
     async def create_chat_if_not_exists(self, *, uow: UnitOfWork) -> Chat:
         """Creates chat if it doesn't exist, otherwise returns existing one"""
@@ -78,41 +134,57 @@ class SnxBotContext(CallbackContext[ExtBot, dict, ChatData, BotData]):
             chat = Chat(id=self._chat_id)
             await uow.chats.add(chat)
 
-    async def _get_current_chat_account(self, uow: UnitOfWork) -> ChatAccount:
+    async def _get_current_chat_account(
+        self, uow: UnitOfWork, load: LoadPlanType = ()
+    ) -> ChatAccount:
         """Internal version without UOW decorator"""
         chat_account = await uow.chat_accounts.get_by_id_or_none(
-            self.chat_data["selected_chat_account"]
+            self.chat_data["selected_chat_account"], load=load
         )
         if chat_account is None:
             raise NotFoundError("ChatAccount")
         return chat_account
 
+    async def get_current_chat_account(self) -> ChatAccount:
+        """Gets current chat account, cached, or raises NotFoundError"""
+        return await self.chat_cache.get_or_load(
+            self._chat_id,
+            self.chat_data["selected_chat_account"],
+            self._load_current_chat_account,
+        )
+
+    @with_read_only_uow
+    async def _load_current_chat_account(self, *, uow: UnitOfWork) -> ChatAccount:
+        return await self._get_current_chat_account(uow, load=LoadPlan.CHAT_ACCOUNT_MENU)
+
+    @invalidates_chat
     @with_uow
-    async def get_current_chat_account(self, *, uow: UnitOfWork) -> ChatAccount:
-        """Gets current chat or raises NotFoundError"""
-        return await self._get_current_chat_account(uow)
+    async def set_dashboard_message_id(self, message_id: int, *, uow: UnitOfWork) -> None:
+        chat = await uow.chats.get_one_or_none(Chat.id == self._chat_id)
+        chat.dashboard_message_id = message_id
 
+    @invalidates_chat
     @with_uow
     async def process_account_creating(
         self, address: AnyAddress, chain: Chain, *, uow: UnitOfWork
     ) -> ChatAccount:
-        if not (account := await uow.accounts.get_by_address_chain_or_none(address, chain)):
-            account = Account(address=address, chain=chain)
-            account = await uow.accounts.add(account)
-            await self.bot_data["new_accounts_queues"][chain].put(address)
+        # created uninited, the chain observer picks it up on its next events check
+        account_id, _ = await uow.accounts.create_if_not_exists(address, chain)
         if not (
-            chat_account := await uow.chat_accounts.is_exist(
-                ChatAccount.chat_id == self._chat_id, ChatAccount.account_id == account.id
+            chat_account := await uow.chat_accounts.get_one_or_none(
+                ChatAccount.chat_id == self._chat_id, ChatAccount.account_id == account_id
             )
         ):
-            chat_account = ChatAccount(chat_id=self._chat_id, account_id=account.id)
-            await uow.accounts.add(chat_account)
+            chat_account = ChatAccount(chat_id=self._chat_id, account_id=account_id)
+            await uow.chat_accounts.add(chat_account)
         return chat_account
 
+    @invalidates_chat
     @with_uow
     async def delete_current_chat_account(self, uow: UnitOfWork):
         await uow.chat_accounts.delete_by_id(self.chat_data.pop("selected_chat_account"))
 
+    @invalidates_chat
     @with_uow
     async def toggle_current_chat_account_setting(self, setting_name: str, *, uow: UnitOfWork):
         chat_account = await self._get_current_chat_account(uow)
@@ -120,6 +192,7 @@ class SnxBotContext(CallbackContext[ExtBot, dict, ChatData, BotData]):
             **{setting_name: not chat_account.account_settings[setting_name]}
         )
 
+    @invalidates_chat
     @with_uow
     async def create_notif(
         self,
@@ -130,16 +203,17 @@ class SnxBotContext(CallbackContext[ExtBot, dict, ChatData, BotData]):
         uow: UnitOfWork,
     ) -> tuple[bool, Notif | None]:
         if await uow.notifs.is_exist(
-            Notif.chat_account == chat_account,
+            Notif.chat_account_id == chat_account.id,
             Notif.type == notif_type,
             Notif.params == notif_params,
         ):
             return True, None
 
-        notif = Notif(type=notif_type, chat_account=chat_account, params=notif_params)
+        notif = Notif(type=notif_type, chat_account_id=chat_account.id, params=notif_params)
         notif = await uow.notifs.add(notif)
         return False, notif
 
+    @invalidates_chat
     @with_uow
     async def delete_notif_by_id(self, notif_id: UUID, *, uow: UnitOfWork):
         await uow.notifs.delete_by_id(notif_id)
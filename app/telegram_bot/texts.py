@@ -12,6 +12,7 @@ info_command = """
 *Commands:*
 /accounts
 /dashboard
+/history \\[days\\] - C-ratio history of your accounts, 7 days by default
 /payday
 /info
 /start - Command to start using the bot. If the bot doesn't work correctly, it's possible you
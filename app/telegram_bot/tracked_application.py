@@ -0,0 +1,24 @@
+from telegram import Update
+from telegram.ext import Application
+
+from app.data_access import track_queries
+
+
+def _describe(update: object) -> str:
+    if not isinstance(update, Update):
+        return type(update).__name__
+    if update.callback_query:
+        return f"callback {update.callback_query.data}"
+    text = update.effective_message.text if update.effective_message else None
+    # commands only, other messages may be user input
+    if text and text.startswith("/"):
+        return text.split()[0]
+    return "message"
+
+
+class TrackedApplication(Application):
+    """Application counting the queries of every update, see app.data_access.query_stats"""
+
+    async def process_update(self, update: object) -> None:
+        with track_queries("handler", _describe(update)):
+            await super().process_update(update)
@@ -66,6 +66,18 @@ def remaining_time_until(timestamp: float) -> str:
     return text + ":".join(f"{int(value)}{label}" for value, label in non_zero_parts)
 
 
+SPARKLINE_BARS = "▁▂▃▄▅▆▇█"
+
+
+def sparkline(values: list[float], width: int = 24) -> str:
+    """Downsamples values to at most width points, each the last value of its bucket"""
+    if len(values) > width:
+        values = [values[(i + 1) * len(values) // width - 1] for i in range(width)]
+    low, high = min(values), max(values)
+    scale = (len(SPARKLINE_BARS) - 1) / (high - low) if high > low else 0
+    return "".join(SPARKLINE_BARS[round((value - low) * scale)] for value in values)
+
+
 async def update_staking_observers_job(context: CallbackContext):
     await asyncio.gather(
         *[observer.update() for observer in context.bot_data["staking_observers"].values()],
@@ -75,3 +87,7 @@ async def update_staking_observers_job(context: CallbackContext):
 
 async def run_account_update_processor(context: CallbackContext):
     asyncio.create_task(context.bot_data["account_update_processor"].worker())
+
+
+async def run_pg_listener(context: CallbackContext):
+    asyncio.create_task(context.bot_data["pg_listener"].run())
@@ -0,0 +1,255 @@
+"""Record and replay of chain RPC, Etherscan ABI and Bot API traffic.
+
+TrafficRecorder writes every request a process makes, with its response, start
+offset and duration, to a gzipped JSON lines file. TrafficReplay answers the
+same requests from recordings, offline, after the recorded duration divided
+by speed, so slow ticks can be reproduced without network access.
+
+Requests are matched by stream and key: the chain and JSON-RPC method with
+params, the chain and contract address of an ABI, the Bot API endpoint.
+Repeated requests get the recorded responses in order, the last one once
+they run out. An eth_call recorded at another block answers a miss,
+other misses are counted and fail.
+
+Bot API requests are recorded without their parameters, responses include
+the chats messages were sent to.
+"""
+
+import asyncio
+import atexit
+import gzip
+import json
+import math
+import os
+import time
+from collections import Counter, defaultdict, deque
+from collections.abc import Callable, Iterable
+from typing import Any
+
+from telegram.request import RequestData
+from web3 import AsyncHTTPProvider
+from web3.providers.async_base import AsyncBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+from app.common import Chain
+from app.snx_staking.synthetix.contract_manager import AbiFetchType
+from app.telegram_bot import MeteredRequest
+
+FORMAT_VERSION = 1
+# seconds between flushes, a killed process loses at most this much
+FLUSH_INTERVAL = 5
+
+TELEGRAM_STREAM = "telegram"
+
+AbiFetchWrapperType = Callable[[AbiFetchType], AbiFetchType]
+
+
+def _rpc_key(method: str, params: Any) -> str:  # noqa: ANN401
+    return json.dumps([method, params], separators=(",", ":"), sort_keys=True, default=str)
+
+
+def _rpc_stream(chain: Chain) -> str:
+    return f"rpc:{chain}"
+
+
+def _abi_stream(chain: Chain) -> str:
+    return f"abi:{chain}"
+
+
+def _endpoint(url: str) -> str:
+    return url.rsplit("/", 1)[-1]
+
+
+class TrafficRecorder:
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self._file = gzip.open(path, "wt", encoding="utf-8")  # noqa: SIM115, see close()
+        self._started: float = time.perf_counter()
+        self._flushed_at: float = self._started
+        self._write({"version": FORMAT_VERSION, "started_at": time.time()})
+        atexit.register(self.close)
+
+    @classmethod
+    def in_dir(cls, directory: str, name: str) -> "TrafficRecorder":
+        """Recorder of one process, its file named after name, start time and pid"""
+        os.makedirs(directory, exist_ok=True)
+        file_name = f"{name}-{int(time.time())}-{os.getpid()}.jsonl.gz"
+        return cls(os.path.join(directory, file_name))
+
+    def _write(self, record: dict) -> None:
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def record(self, stream: str, key: str, started: float, response: Any) -> None:  # noqa: ANN401
+        """:param started: time.perf_counter() the request was sent at"""
+        now = time.perf_counter()
+        self._write(
+            {
+                "s": stream,
+                "k": key,
+                "t": round(started - self._started, 4),
+                "d": round(now - started, 4),
+                "r": response,
+            }
+        )
+        if now - self._flushed_at > FLUSH_INTERVAL:
+            self._file.flush()
+            self._flushed_at = now
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+    # TAPS
+    def provider(self, chain: Chain, api: str) -> AsyncBaseProvider:
+        return RecordingProvider(api, self, _rpc_stream(chain))
+
+    def wrap_abi_fetch(self, chain: Chain) -> AbiFetchWrapperType:
+        def wrap(fetch: AbiFetchType) -> AbiFetchType:
+            async def recording_fetch(address: str) -> str:
+                started = time.perf_counter()
+                abi = await fetch(address)
+                self.record(_abi_stream(chain), address, started, abi)
+                return abi
+
+            return recording_fetch
+
+        return wrap
+
+    def telegram_request(self, **kwargs) -> MeteredRequest:
+        return RecordingRequest(self, **kwargs)
+
+
+class RecordingProvider(AsyncHTTPProvider):
+    def __init__(self, endpoint_uri: str, recorder: TrafficRecorder, stream: str) -> None:
+        super().__init__(endpoint_uri)
+        self._recorder: TrafficRecorder = recorder
+        self._stream: str = stream
+
+    async def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:  # noqa: ANN401
+        started = time.perf_counter()
+        response = await super().make_request(method, params)
+        self._recorder.record(self._stream, _rpc_key(method, params), started, response)
+        return response
+
+
+class RecordingRequest(MeteredRequest):
+    def __init__(self, recorder: TrafficRecorder, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._recorder: TrafficRecorder = recorder
+
+    async def do_request(self, url: str, method: str, *args, **kwargs) -> tuple[int, bytes]:
+        started = time.perf_counter()
+        status, payload = await super().do_request(url, method, *args, **kwargs)
+        self._recorder.record(
+            TELEGRAM_STREAM, _endpoint(url), started, [status, payload.decode("utf-8")]
+        )
+        return status, payload
+
+
+class TrafficReplay:
+    def __init__(self, paths: Iterable[str], speed: float = 1) -> None:
+        """:param speed: replay speed-up, math.inf answers without delay"""
+        self._speed: float = speed
+        # (stream, key): [(duration, response)]
+        self._responses: dict[tuple[str, str], deque[tuple[float, Any]]] = defaultdict(deque)
+        # (stream, eth_call params without the block): key of the last recorded call
+        self._calls: dict[tuple[str, str], str] = {}
+        self.misses: Counter = Counter()
+        for path in paths:
+            self._load(path)
+
+    def _load(self, path: str) -> None:
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            header = json.loads(file.readline())
+            if header.get("version") != FORMAT_VERSION:
+                raise ValueError(f"{path}: unsupported recording version {header.get('version')}")
+            try:
+                for line in file:
+                    record = json.loads(line)
+                    key = (record["s"], record["k"])
+                    self._responses[key].append((record["d"], record["r"]))
+                    if record["s"].startswith("rpc:"):
+                        method, params = json.loads(record["k"])
+                        if method == "eth_call":
+                            self._calls[(record["s"], _rpc_key(method, params[0]))] = record["k"]
+            except (EOFError, json.JSONDecodeError):
+                # the tail of a recording whose process was killed
+                pass
+
+    @property
+    def chains(self) -> list[Chain]:
+        """Chains with recorded RPC traffic"""
+        streams = {stream for stream, _ in self._responses}
+        return [chain for chain in Chain if _rpc_stream(chain) in streams]
+
+    async def respond(self, stream: str, key: str) -> Any:  # noqa: ANN401
+        """:raises KeyError: for requests not recorded"""
+        responses = self._responses.get((stream, key))
+        if not responses:
+            self.misses[stream] += 1
+            raise KeyError(f"{stream} {key} not recorded")
+        duration, response = responses.popleft() if len(responses) > 1 else responses[0]
+        if self._speed != math.inf:
+            await asyncio.sleep(duration / self._speed)
+        return response
+
+    async def respond_rpc(self, stream: str, method: str, params: Any) -> RPCResponse:  # noqa: ANN401
+        key = _rpc_key(method, params)
+        if (stream, key) not in self._responses and method == "eth_call":
+            key = self._calls.get((stream, _rpc_key(method, params[0])), key)
+        try:
+            return await self.respond(stream, key)
+        except KeyError as e:
+            return {"jsonrpc": "2.0", "id": 0, "error": {"code": -32000, "message": str(e)}}
+
+    # TAPS
+    def provider(self, chain: Chain, _: str = "") -> AsyncBaseProvider:
+        return ReplayProvider(self, _rpc_stream(chain))
+
+    def wrap_abi_fetch(self, chain: Chain) -> AbiFetchWrapperType:
+        def wrap(_: AbiFetchType) -> AbiFetchType:
+            async def replay_fetch(address: str) -> str:
+                return await self.respond(_abi_stream(chain), address)
+
+            return replay_fetch
+
+        return wrap
+
+    def telegram_request(self, **kwargs) -> MeteredRequest:
+        return ReplayRequest(self, **kwargs)
+
+
+class ReplayProvider(AsyncBaseProvider):
+    def __init__(self, replay: TrafficReplay, stream: str) -> None:
+        super().__init__()
+        self._replay: TrafficReplay = replay
+        self._stream: str = stream
+
+    async def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:  # noqa: ANN401
+        return await self._replay.respond_rpc(self._stream, method, params)
+
+    async def is_connected(self, show_traceback: bool = False) -> bool:
+        return True
+
+
+class ReplayRequest(MeteredRequest):
+    def __init__(self, replay: TrafficReplay, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._replay: TrafficReplay = replay
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(
+        self, url: str, method: str, request_data: RequestData | None = None, *args, **kwargs
+    ) -> tuple[int, bytes]:
+        try:
+            status, payload = await self._replay.respond(TELEGRAM_STREAM, _endpoint(url))
+        except KeyError as e:
+            return 400, json.dumps(
+                {"ok": False, "error_code": 400, "description": str(e)}
+            ).encode()
+        return status, payload.encode("utf-8")
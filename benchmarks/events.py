@@ -0,0 +1,339 @@
+"""Micro-benchmarks of decoding, grouping and applying account events.
+
+Synthetic raw eth_getLogs results, in the event mix and ABIs of
+benchmarks.fake_rpc, are decoded by web3's get_logs into AttributeDicts and by
+EventDecoder into log tuples, served by a provider holding the logs. The
+AttributeDicts are grouped and applied with the dict based implementation
+AccountManager used before app.snx_staking.account_events on ORM Accounts,
+the tuples with account_events on AccountRecords. Both must decode the same
+logs and leave the accounts in the same state.
+
+Usage:
+    python -m benchmarks.events --logs 1000 10000 --accounts 10000
+"""
+
+import argparse
+import asyncio
+import datetime
+import random
+import time
+import uuid
+from collections import defaultdict
+from collections.abc import Callable
+from typing import Any
+
+from eth_abi import encode
+from eth_utils import event_abi_to_log_topic
+from web3 import AsyncWeb3
+from web3.datastructures import AttributeDict
+from web3.providers.async_base import AsyncBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+from app.models import Account, AccountRecord
+from app.snx_staking.account_events import apply_events, group_events
+from app.snx_staking.synthetix import EventDecoder, EventLog, EventName
+from app.snx_staking.synthetix.event_decoder import from_event_data
+from benchmarks.fake_rpc import EVENT_WEIGHTS, EVENTS, account_address
+
+WAD = 10**18
+VESTING = account_address(-1)
+# transfers paid out by the vesting contract, skipped by the grouping
+VESTING_SHARE = 0.05
+# accounts are picked with a bias to the first ones, a few are very active
+ACTIVITY_SKEW = 3
+
+
+def _raw_log(name: str, block: int, values: dict) -> dict:
+    contract, abi = EVENTS[name]
+    indexed = [arg for arg in abi["inputs"] if arg["indexed"]]
+    data = [arg for arg in abi["inputs"] if not arg["indexed"]]
+    return {
+        "address": contract,
+        "topics": [
+            "0x" + event_abi_to_log_topic(abi).hex(),
+            *("0x" + encode([arg["type"]], [values[arg["name"]]]).hex() for arg in indexed),
+        ],
+        "data": "0x"
+        + encode([arg["type"] for arg in data], [values[arg["name"]] for arg in data]).hex(),
+        "blockNumber": hex(block),
+        "blockHash": "0x" + "ab" * 32,
+        "transactionHash": "0x" + "cd" * 32,
+        "transactionIndex": "0x0",
+        "logIndex": "0x0",
+        "removed": False,
+    }
+
+
+def synthetic_logs(logs: int, accounts: int, seed: int = 0) -> dict[str, list[dict]]:
+    """:returns {event: raw logs}"""
+    rnd = random.Random(seed)
+
+    def pick_account() -> str:
+        return account_address(int(accounts * rnd.random() ** ACTIVITY_SKEW))
+
+    raw_logs = {name: [] for name in EVENT_WEIGHTS}
+    names, weights = list(EVENT_WEIGHTS), list(EVENT_WEIGHTS.values())
+    for i, name in enumerate(rnd.choices(names, weights, k=logs)):
+        block = 20_000_000 + i // 3
+        amount = rnd.randrange(1, 100) * WAD
+        values = {
+            "account": pick_account(),
+            "from": VESTING if rnd.random() < VESTING_SHARE else pick_account(),
+            "to": pick_account(),
+            "amount": amount,
+            "value": amount,
+            "sUSDAmount": amount,
+            "snxRewards": amount,
+            "deadline": 1_700_000_000 + block,
+            "time": 1_700_000_000 + block,
+        }
+        raw_logs[name].append(_raw_log(name, block, values))
+    return raw_logs
+
+
+class LogsProvider(AsyncBaseProvider):
+    """Serves eth_getLogs from raw logs by event topic, ignoring the block range"""
+
+    def __init__(self, raw_logs: dict[str, list[dict]]) -> None:
+        super().__init__()
+        self._by_topic: dict[str, list[dict]] = {
+            logs[0]["topics"][0]: logs for logs in raw_logs.values() if logs
+        }
+
+    async def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:  # noqa: ANN401
+        if method != "eth_getLogs":
+            raise NotImplementedError(method)
+        topics = params[0]["topics"][0]
+        topics = [topics] if isinstance(topics, str) else topics
+        result = [log for topic in topics for log in self._by_topic.get(topic, ())]
+        return {"jsonrpc": "2.0", "id": 0, "result": result}
+
+
+async def legacy_decode(web3: AsyncWeb3) -> dict[str, list[AttributeDict]]:
+    """Decodes like get_all_events did, with get_logs of each event"""
+    events = {}
+    for name, (contract, abi) in EVENTS.items():
+        event = getattr(web3.eth.contract(address=contract, abi=[abi]).events, abi["name"])
+        events[name] = await event.get_logs(from_block=0, to_block=1)
+    return events
+
+
+async def typed_decode(web3: AsyncWeb3, decoders: dict[str, EventDecoder]) -> dict:
+    """Decodes like get_all_events, with one eth_getLogs per contract past the middleware"""
+    by_contract = defaultdict(list)
+    for name, (contract, _) in EVENTS.items():
+        by_contract[contract].append(decoders[name])
+    events: dict[str, list[EventLog]] = {}
+    for contract, contract_decoders in by_contract.items():
+        params = [
+            {
+                "address": [contract],
+                "fromBlock": "0x0",
+                "toBlock": "0x1",
+                "topics": [[decoder.topic for decoder in contract_decoders]],
+            }
+        ]
+        response = await web3.provider.make_request(RPCEndpoint("eth_getLogs"), params)
+        raw_logs = web3.manager.formatted_response(response, params)
+        by_topic = defaultdict(list)
+        for log in raw_logs:
+            by_topic[log["topics"][0]].append(log)
+        for decoder in contract_decoders:
+            events[decoder.event_name] = decoder.decode_all(by_topic[decoder.topic])
+    return events
+
+
+# LEGACY, AccountManager before account_events
+def legacy_group_events(events: dict, vesting_address: str) -> dict[str, list]:
+    if not events:
+        return {}
+    events_by_address = defaultdict(list)
+
+    transfers = events.pop("Transfer")
+    split_transfers = legacy_split_transfer_events(transfers, vesting_address)
+    if split_transfers:
+        events.update(split_transfers)
+
+    for event_type, event_list in events.items():
+        for event in event_list:
+            events_by_address[event["args"]["account"]].append(
+                {"type": event_type, "blockNumber": event.get("blockNumber"), **event["args"]}
+            )
+    return events_by_address
+
+
+def legacy_split_transfer_events(transfers: list, vesting_address: str) -> dict[str, list]:
+    events = defaultdict(list)
+    for transfer in transfers:
+        if transfer["args"]["from"] == vesting_address:
+            continue
+        events[EventName.SEND].append(
+            {"args": {"account": transfer["args"]["from"], "amount": transfer["args"]["value"]}}
+        )
+        events[EventName.RECEIVE].append(
+            {"args": {"account": transfer["args"]["to"], "amount": transfer["args"]["value"]}}
+        )
+    return events
+
+
+def legacy_apply_events(account: Account, events: list[dict]) -> None:
+    handlers = {
+        EventName.MINT: lambda _account, _event: setattr(
+            _account, "sds_count", _account.sds_count + _event["amount"]
+        ),
+        EventName.BURN: lambda _account, _event: setattr(
+            _account, "sds_count", _account.sds_count - _event["amount"]
+        ),
+        EventName.SEND: lambda _account, _event: setattr(
+            _account, "snx_count", _account.snx_count - _event["amount"]
+        ),
+        EventName.RECEIVE: lambda _account, _event: setattr(
+            _account, "snx_count", _account.snx_count + _event["amount"]
+        ),
+        EventName.FEES_CLAIMED: lambda _account, _event: (
+            setattr(_account, "snx_count", _account.snx_count + _event["snxRewards"]),
+            setattr(_account, "claimable_snx", 0),
+        ),
+        EventName.FLAGGED_FOR_LIQUIDATION: lambda _account, _event: setattr(
+            _account,
+            "liquidation_deadline",
+            datetime.datetime.fromtimestamp(_event["deadline"]),
+        ),
+        EventName.REMOVED_FROM_LIQUIDATION: lambda _account, _event: setattr(
+            _account, "liquidation_deadline", None
+        ),
+    }
+    for event in events:
+        handlers[event["type"]](account, event)
+
+
+def legacy_update(accounts: list[Account], address_to_event: dict) -> int:
+    """Applies the events like AccountManager._update_account, :returns accounts to recompute"""
+    recompute = 0
+    for account in accounts:
+        events = address_to_event.get(account.address, [])
+        legacy_apply_events(account, events)
+        collateral_updated = any(
+            event["type"] in {EventName.SEND, EventName.RECEIVE, EventName.FEES_CLAIMED}
+            for event in events
+        )
+        debt_updated = any(event["type"] in {EventName.MINT, EventName.BURN} for event in events)
+        recompute += collateral_updated or debt_updated
+    return recompute
+
+
+def typed_update(accounts: list[AccountRecord], address_to_event: dict) -> int:
+    recompute = 0
+    for account in accounts:
+        collateral_events, debt_events = apply_events(
+            account, address_to_event.get(account.address, ())
+        )
+        recompute += collateral_events or debt_events
+    return recompute
+
+
+def _accounts(addresses: list[str]) -> list[Account]:
+    return [
+        Account(
+            address=address,
+            chain="ethereum",
+            snx_count=10_000 * WAD,
+            sds_count=1_000 * WAD,
+            claimable_snx=WAD,
+        )
+        for address in addresses
+    ]
+
+
+def _records(addresses: list[str]) -> list[AccountRecord]:
+    return [
+        AccountRecord(
+            id=uuid.uuid4(),
+            address=address,
+            chain="ethereum",
+            c_ratio=0,
+            snx_count=10_000 * WAD,
+            collateral=0,
+            sds_count=1_000 * WAD,
+            debt=0,
+            claimable_snx=WAD,
+            liquidation_deadline=None,
+            inited=True,
+            version=0,
+        )
+        for address in addresses
+    ]
+
+
+def _state(accounts: list[Account] | list[AccountRecord]) -> list[tuple]:
+    return [
+        (a.address, a.snx_count, a.sds_count, a.claimable_snx, a.liquidation_deadline)
+        for a in accounts
+    ]
+
+
+def best_of(repeat: int, run: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--logs", type=int, nargs="+", default=[1_000, 10_000])
+    parser.add_argument("--accounts", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    decoders = {name: EventDecoder(name, abi) for name, (_, abi) in EVENTS.items()}
+    runner = asyncio.Runner()
+    print(  # noqa: T201
+        f"{'logs':>7}{'accounts':>9}  {'step':<8}{'legacy ms':>11}{'typed ms':>10}{'speed-up':>10}"
+    )
+    for logs in args.logs:
+        web3 = AsyncWeb3(LogsProvider(synthetic_logs(logs, args.accounts)))
+        events = runner.run(legacy_decode(web3))
+        logs_by_event = runner.run(typed_decode(web3, decoders))
+        assert logs_by_event == {
+            name: from_event_data(name, event_logs) for name, event_logs in events.items()
+        }, "decoded logs differ"
+
+        legacy_grouped = legacy_group_events(dict(events), VESTING)
+        typed_grouped = group_events(logs_by_event, VESTING)
+        assert legacy_grouped.keys() == typed_grouped.keys()
+        addresses = list(typed_grouped)
+
+        legacy_accounts, typed_accounts = _accounts(addresses), _records(addresses)
+        legacy_recompute = legacy_update(legacy_accounts, legacy_grouped)
+        typed_recompute = typed_update(typed_accounts, typed_grouped)
+        assert legacy_recompute == typed_recompute
+        assert _state(legacy_accounts) == _state(typed_accounts), "results differ"
+
+        steps = {
+            "decode": (
+                lambda w=web3: runner.run(legacy_decode(w)),
+                lambda w=web3: runner.run(typed_decode(w, decoders)),
+            ),
+            "group": (
+                lambda e=events: legacy_group_events(dict(e), VESTING),
+                lambda e=logs_by_event: group_events(e, VESTING),
+            ),
+            "apply": (
+                lambda a=legacy_accounts, g=legacy_grouped: legacy_update(a, g),
+                lambda a=typed_accounts, g=typed_grouped: typed_update(a, g),
+            ),
+        }
+        for step, (legacy, typed) in steps.items():
+            legacy_s, typed_s = best_of(args.repeat, legacy), best_of(args.repeat, typed)
+            print(  # noqa: T201
+                f"{logs:>7}{len(addresses):>9}  {step:<8}{legacy_s * 1000:>11.2f}"
+                f"{typed_s * 1000:>10.2f}{legacy_s / typed_s:>9.1f}x"
+            )
+    runner.close()
+
+
+if __name__ == "__main__":
+    main()
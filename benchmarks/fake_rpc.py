@@ -0,0 +1,431 @@
+"""Deterministic JSON-RPC stand-in for the Synthetix contracts.
+
+Serves what StakingObserver reads: eth_blockNumber, eth_getBlockByNumber,
+eth_call for the functions used by ContractManager and ContractCaller,
+eth_getLogs for the events in contract_to_events, and an Etherscan style
+getabi endpoint with ABIs of the fake contracts. Account balances derive from
+the account address and events from the block number, so runs with the same
+parameters observe the same chain.
+
+The chain head only moves when the harness posts to /control, /stats returns
+request counts per method and per eth_call function, and injected errors per
+method.
+"""
+
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from collections.abc import Callable
+from multiprocessing.synchronize import Event as EventType
+
+from aiohttp import web
+from eth_abi import decode, encode
+from eth_utils import (
+    event_abi_to_log_topic,
+    function_signature_to_4byte_selector,
+    keccak,
+    to_checksum_address,
+)
+
+from app.snx_staking.synthetix import ContractName, EventName, contract_names
+
+WAD = 10**18
+GENESIS_BLOCK = 20_000_000
+BLOCK_TIME = 12
+SNX_PRICE = 2 * WAD
+# debt share price unit, 1e27 is one sUSD per debt share
+SDS_PRICE = 10**27
+
+# Share of the events in a block per event, flags cost an extra eth_getBlockByNumber
+EVENT_WEIGHTS = {
+    EventName.MINT: 0.25,
+    EventName.BURN: 0.2,
+    EventName.SNX_TRANSFER: 0.4,
+    EventName.FEES_CLAIMED: 0.13,
+    EventName.FLAGGED_FOR_LIQUIDATION: 0.01,
+    EventName.REMOVED_FROM_LIQUIDATION: 0.01,
+}
+
+
+def address_of(seed: str | int) -> str:
+    return to_checksum_address(keccak(text=str(seed))[-20:])
+
+
+def account_address(index: int) -> str:
+    return address_of(f"account:{index}")
+
+
+ADDRESS_RESOLVER = address_of("AddressResolver")
+FEE_POOL = address_of("FeePool")
+CONTRACTS = {name: address_of(name) for name in contract_names}
+# proxy: target, its ABI is served for the proxy
+PROXY_TARGETS = {
+    CONTRACTS[ContractName.PROXY_FEE_POOL]: FEE_POOL,
+    CONTRACTS[ContractName.PROXY_ERC20]: CONTRACTS[ContractName.SYNTHETIX],
+}
+
+
+def _function(name: str, inputs: list[str], outputs: list[str]) -> dict:
+    return {
+        "type": "function",
+        "name": name,
+        "stateMutability": "view",
+        "inputs": [{"name": f"arg{i}", "type": type_} for i, type_ in enumerate(inputs)],
+        "outputs": [{"name": f"out{i}", "type": type_} for i, type_ in enumerate(outputs)],
+    }
+
+
+def _event(name: str, args: list[tuple[str, str, bool]]) -> dict:
+    return {
+        "type": "event",
+        "name": name,
+        "anonymous": False,
+        "inputs": [
+            {"name": arg, "type": type_, "indexed": indexed} for arg, type_, indexed in args
+        ],
+    }
+
+
+TRANSFER = _event(
+    EventName.SNX_TRANSFER,
+    [("from", "address", True), ("to", "address", True), ("value", "uint256", False)],
+)
+MINT = _event(EventName.MINT, [("account", "address", True), ("amount", "uint256", False)])
+BURN = _event(EventName.BURN, [("account", "address", True), ("amount", "uint256", False)])
+FEES_CLAIMED = _event(
+    EventName.FEES_CLAIMED,
+    [
+        ("account", "address", False),
+        ("sUSDAmount", "uint256", False),
+        ("snxRewards", "uint256", False),
+    ],
+)
+FLAGGED = _event(
+    EventName.FLAGGED_FOR_LIQUIDATION,
+    [("account", "address", True), ("deadline", "uint256", False)],
+)
+REMOVED = _event(
+    EventName.REMOVED_FROM_LIQUIDATION,
+    [("account", "address", True), ("time", "uint256", False)],
+)
+
+ABIS = {
+    CONTRACTS[ContractName.EXCHANGE_RATES]: [
+        _function("rateAndInvalid", ["bytes32"], ["uint256", "bool"])
+    ],
+    CONTRACTS[ContractName.SYNTHETIX]: [
+        _function("collateral", ["address"], ["uint256"]),
+        TRANSFER,
+    ],
+    CONTRACTS[ContractName.LIQUIDATOR]: [
+        _function("getLiquidationDeadlineForAccount", ["address"], ["uint256"]),
+        FLAGGED,
+        REMOVED,
+    ],
+    CONTRACTS[ContractName.SYNTHETIX_DEBT_SHARE]: [
+        _function("balanceOf", ["address"], ["uint256"]),
+        MINT,
+        BURN,
+    ],
+    FEE_POOL: [
+        _function(
+            "recentFeePeriods",
+            ["uint256"],
+            ["uint64", "uint64", "uint64", "uint256", "uint256", "uint256", "uint256"],
+        ),
+        _function("feesAvailable", ["address"], ["uint256", "uint256"]),
+        FEES_CLAIMED,
+    ],
+    CONTRACTS[ContractName.REWARD_ESCROW_V2]: [],
+    CONTRACTS[ContractName.AGGREGATOR_DEBT_RATIO]: [_function("latestAnswer", [], ["int256"])],
+}
+
+# event: (emitting contract, abi)
+EVENTS = {
+    EventName.SNX_TRANSFER: (CONTRACTS[ContractName.PROXY_ERC20], TRANSFER),
+    EventName.MINT: (CONTRACTS[ContractName.SYNTHETIX_DEBT_SHARE], MINT),
+    EventName.BURN: (CONTRACTS[ContractName.SYNTHETIX_DEBT_SHARE], BURN),
+    EventName.FEES_CLAIMED: (CONTRACTS[ContractName.PROXY_FEE_POOL], FEES_CLAIMED),
+    EventName.FLAGGED_FOR_LIQUIDATION: (CONTRACTS[ContractName.LIQUIDATOR], FLAGGED),
+    EventName.REMOVED_FROM_LIQUIDATION: (CONTRACTS[ContractName.LIQUIDATOR], REMOVED),
+}
+TOPIC_TO_EVENT = {
+    "0x" + event_abi_to_log_topic(abi).hex(): name for name, (_, abi) in EVENTS.items()
+}
+
+
+def _account_seed(address: str) -> int:
+    return int.from_bytes(keccak(hexstr=address)[:8])
+
+
+class FakeChain:
+    """State of the fake chain and the JSON-RPC handlers reading it"""
+
+    def __init__(
+        self,
+        accounts: int,
+        events_per_block: float = 2,
+        static_prices: bool = False,
+    ) -> None:
+        self.accounts: int = accounts
+        self.events_per_block: float = events_per_block
+        self.static_prices: bool = static_prices
+        self.head: int = GENESIS_BLOCK
+        self.genesis_time: int = int(time.time())
+        # (contract, selector): (name, input types, output types, handler)
+        self._functions: dict[tuple[str, bytes], tuple[str, list[str], list[str], Callable]] = {}
+        self._register_functions()
+
+    def _register(
+        self, contract: str, name: str, outputs: list[str], handler: Callable, *inputs: str
+    ) -> None:
+        selector = function_signature_to_4byte_selector(f"{name}({','.join(inputs)})")
+        self._functions[(contract.lower(), selector)] = (name, list(inputs), outputs, handler)
+
+    def _register_functions(self) -> None:
+        self._register(ADDRESS_RESOLVER, "getAddress", ["address"], self._get_address, "bytes32")
+        for proxy, target in PROXY_TARGETS.items():
+            self._register(proxy, "target", ["address"], lambda _t=target: (_t,))
+        for contract, abi in ABIS.items():
+            for entry in abi:
+                if entry["type"] != "function":
+                    continue
+                inputs = [arg["type"] for arg in entry["inputs"]]
+                outputs = [arg["type"] for arg in entry["outputs"]]
+                handler = getattr(self, f"_{entry['name']}")
+                self._register(contract, entry["name"], outputs, handler, *inputs)
+                # proxies forward to their target
+                for proxy, target in PROXY_TARGETS.items():
+                    if target == contract:
+                        self._register(proxy, entry["name"], outputs, handler, *inputs)
+
+    # CHAIN
+    def advance(self, blocks: int) -> None:
+        self.head += blocks
+
+    def block_time(self, block: int) -> int:
+        return self.genesis_time + (block - GENESIS_BLOCK) * BLOCK_TIME
+
+    def snx_price(self) -> int:
+        return SNX_PRICE if self.static_prices else SNX_PRICE + (self.head % 97) * 10**15
+
+    def sds_price(self) -> int:
+        return SDS_PRICE if self.static_prices else SDS_PRICE + (self.head % 89) * 10**24
+
+    # CONTRACT FUNCTIONS
+    @staticmethod
+    def _get_address(name: bytes) -> tuple:
+        name = name.rstrip(b"\0").decode()
+        return (CONTRACTS.get(name, "0x" + "00" * 20),)
+
+    def _rateAndInvalid(self, _: bytes) -> tuple:  # noqa: N802
+        return self.snx_price(), False
+
+    def _latestAnswer(self) -> tuple:  # noqa: N802
+        return (self.sds_price(),)
+
+    @staticmethod
+    def _collateral(address: str) -> tuple:
+        return ((1_000 + _account_seed(address) % 100_000) * WAD,)
+
+    def _balanceOf(self, address: str) -> tuple:  # noqa: N802
+        # c-ratio between 200% and 1000% at genesis prices
+        (collateral,) = self._collateral(address)
+        ratio = 2 + _account_seed(address) % 800 / 100
+        return (int(collateral * SNX_PRICE // WAD / ratio),)
+
+    @staticmethod
+    def _feesAvailable(address: str) -> tuple:  # noqa: N802
+        return 0, _account_seed(address) % 50 * WAD
+
+    def _recentFeePeriods(self, _: int) -> tuple:  # noqa: N802
+        return 1, 0, self.genesis_time - 3600, 0, 0, 0, 0
+
+    @staticmethod
+    def _getLiquidationDeadlineForAccount(_: str) -> tuple:  # noqa: N802
+        return (0,)
+
+    # RPC
+    def eth_call(self, call: dict, _: str) -> str:
+        data = bytes.fromhex(call["data"][2:])
+        key = (call["to"].lower(), data[:4])
+        if key not in self._functions:
+            raise ValueError("execution reverted")
+        _, inputs, outputs, handler = self._functions[key]
+        return "0x" + encode(outputs, handler(*decode(inputs, data[4:]))).hex()
+
+    def function_name(self, call: dict) -> str:
+        data = bytes.fromhex(call["data"][2:])
+        entry = self._functions.get((call["to"].lower(), data[:4]))
+        return entry[0] if entry else "unknown"
+
+    def eth_blockNumber(self) -> str:  # noqa: N802
+        return hex(self.head)
+
+    def eth_chainId(self) -> str:  # noqa: N802
+        return hex(1)
+
+    def eth_getBlockByNumber(self, block: str, _: bool = False) -> dict:  # noqa: N802
+        number = (
+            self.head if block in ("latest", "pending", "safe", "finalized") else int(block, 16)
+        )
+        return {
+            "number": hex(number),
+            "hash": "0x" + keccak(text=f"block:{number}").hex(),
+            "parentHash": "0x" + keccak(text=f"block:{number - 1}").hex(),
+            "timestamp": hex(self.block_time(number)),
+            "transactions": [],
+        }
+
+    def eth_getLogs(self, log_filter: dict) -> list[dict]:  # noqa: N802
+        from_block, to_block = int(log_filter["fromBlock"], 16), int(log_filter["toBlock"], 16)
+        address = log_filter.get("address")
+        addresses = {a.lower() for a in ([address] if isinstance(address, str) else address or [])}
+        topics = log_filter.get("topics") or [None]
+        topic0 = topics[0]
+        wanted = {topic0} if isinstance(topic0, str) else set(topic0 or TOPIC_TO_EVENT)
+
+        logs = []
+        for block in range(from_block, min(to_block, self.head) + 1):
+            for topic in wanted:
+                name = TOPIC_TO_EVENT.get(topic)
+                if name is None:
+                    continue
+                contract, abi = EVENTS[name]
+                if addresses and contract.lower() not in addresses:
+                    continue
+                logs.extend(self._block_logs(block, name, contract, abi))
+        return logs
+
+    def _block_logs(self, block: int, name: str, contract: str, abi: dict) -> list[dict]:
+        rnd = random.Random(f"{block}:{name}")
+        expected = self.events_per_block * EVENT_WEIGHTS[name]
+        count = int(expected) + (rnd.random() < expected % 1)
+        logs = []
+        for log_index in range(count):
+            values = {
+                "account": account_address(rnd.randrange(self.accounts)),
+                "from": account_address(rnd.randrange(self.accounts)),
+                "to": account_address(rnd.randrange(self.accounts)),
+                "amount": rnd.randrange(1, 100) * WAD,
+                "value": rnd.randrange(1, 100) * WAD,
+                "sUSDAmount": rnd.randrange(1, 100) * WAD,
+                "snxRewards": rnd.randrange(1, 100) * WAD,
+                "deadline": self.block_time(block) + 3 * 24 * 3600,
+                "time": self.block_time(block),
+            }
+            indexed = [arg for arg in abi["inputs"] if arg["indexed"]]
+            data = [arg for arg in abi["inputs"] if not arg["indexed"]]
+            logs.append(
+                {
+                    "address": contract,
+                    "topics": [
+                        "0x" + event_abi_to_log_topic(abi).hex(),
+                        *(
+                            "0x" + encode([arg["type"]], [values[arg["name"]]]).hex()
+                            for arg in indexed
+                        ),
+                    ],
+                    "data": "0x"
+                    + encode(
+                        [arg["type"] for arg in data], [values[arg["name"]] for arg in data]
+                    ).hex(),
+                    "blockNumber": hex(block),
+                    "blockHash": "0x" + keccak(text=f"block:{block}").hex(),
+                    "transactionHash": "0x" + keccak(text=f"tx:{block}:{name}:{log_index}").hex(),
+                    "transactionIndex": hex(log_index),
+                    "logIndex": hex(log_index),
+                    "removed": False,
+                }
+            )
+        return logs
+
+
+class FakeRpcServer:
+    """aiohttp app around FakeChain, with injected latency and request errors.
+
+    Any request may fail, eth_getLogs and eth_blockNumber included, so event
+    ingestion runs under faults as well as the contract calls.
+    """
+
+    def __init__(self, chain: FakeChain, latency: float = 0, error_rate: float = 0) -> None:
+        self._chain: FakeChain = chain
+        self._latency: float = latency
+        self._error_rate: float = error_rate
+        self._errors: random.Random = random.Random(0)
+        self.stats: Counter = Counter()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/", self._rpc)
+        app.router.add_get("/etherscan", self._abi)
+        app.router.add_post("/control", self._control)
+        app.router.add_get("/stats", self._stats)
+        return app
+
+    async def _rpc(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        if isinstance(body, list):
+            return web.json_response([self._handle(item) for item in body])
+        return web.json_response(self._handle(body))
+
+    def _handle(self, request: dict) -> dict:
+        method, params = request["method"], request.get("params", [])
+        self.stats[method] += 1
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        if method == "eth_call":
+            self.stats[f"eth_call:{self._chain.function_name(params[0])}"] += 1
+        if self._errors.random() < self._error_rate:
+            self.stats[f"errors:{method}"] += 1
+            return response | {"error": {"code": -32005, "message": "rate limited"}}
+        handler = getattr(self._chain, method, None)
+        if handler is None:
+            return response | {"error": {"code": -32601, "message": f"{method} not found"}}
+        try:
+            return response | {"result": handler(*params)}
+        except ValueError as e:
+            return response | {"error": {"code": -32000, "message": str(e)}}
+
+    async def _abi(self, request: web.Request) -> web.Response:
+        address = to_checksum_address(request.query["address"])
+        if address not in ABIS:
+            return web.json_response(
+                {"status": "0", "result": "Contract source code not verified"}
+            )
+        return web.json_response({"status": "1", "result": json.dumps(ABIS[address])})
+
+    async def _control(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self._chain.advance(body.get("advance", 0))
+        if body.get("reset_stats"):
+            self.stats.clear()
+        return web.json_response({"head": self._chain.head})
+
+    async def _stats(self, _: web.Request) -> web.Response:
+        return web.json_response(dict(self.stats))
+
+
+def serve(
+    port: int,
+    accounts: int,
+    latency: float,
+    error_rate: float,
+    events_per_block: float,
+    static_prices: bool,
+    ready: EventType,
+) -> None:
+    """Process target, serves on 127.0.0.1:port until terminated"""
+
+    async def run() -> None:
+        chain = FakeChain(accounts, events_per_block, static_prices)
+        runner = web.AppRunner(FakeRpcServer(chain, latency, error_rate).app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(run())
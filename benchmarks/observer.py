@@ -0,0 +1,251 @@
+"""End-to-end StakingObserver benchmark against benchmarks.fake_rpc.
+
+For every size a throwaway schema is seeded with that many uninited accounts
+and one observer runs its first update, installing the contracts and initing
+every account, then `--ticks` regular updates, each after the fake chain
+advanced by `--blocks-per-tick` blocks. Prices move with the chain head unless
+`--static-prices`, so every tick recomputes all accounts. The longest event
+loop lag during the ticks tells how long the bot would wait, compare it with
+and without `--offload-workers`. With `--error-rate` any RPC request may fail,
+event and block number requests included, an update failing on one is caught
+up by the next.
+
+Each size runs in its own process, so the reported peak RSS is that of one
+observer. The shard locks are taken on DB_CONNECTION, point it at a database
+no live observer uses.
+
+Usage:
+    DB_CONNECTION=postgresql+psycopg://... python -m benchmarks.observer \\
+        --accounts 1000 10000 100000 --latency 0.002 --error-rate 0.001
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import resource
+import socket
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import aiohttp
+from dotenv import load_dotenv
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel
+
+from app.common import Chain, ChainConfig, SNXMultiChainData
+from app.data_access import instrument_engine, track_queries, uow_factory_maker
+from app.models import Account
+from app.offload import MIN_BATCH, Offload
+from app.snx_staking import AccountManager, ShardCoordinator, SNXDataManager, StakingObserver
+from app.snx_staking.synthetix import bootstrap_synthetix
+from benchmarks.fake_rpc import ADDRESS_RESOLVER, account_address, serve
+
+SCHEMA = "bench_observer"
+CHAIN = Chain.ethereum
+SEED_CHUNK = 10_000
+# seconds between event loop lag samples
+LAG_INTERVAL = 0.01
+
+
+async def _rpc_stats(session: aiohttp.ClientSession, url: str, **control) -> Counter:
+    """:returns requests since the last reset, then applies control"""
+    async with session.get(f"{url}/stats") as response:
+        stats = Counter(await response.json())
+    async with session.post(f"{url}/control", json={"reset_stats": True, **control}):
+        pass
+    return stats
+
+
+async def _sample_lag(lags: list[float]) -> None:
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        lags.append(time.perf_counter() - started - LAG_INTERVAL)
+
+
+async def _run(
+    url: str, accounts: int, ticks: int, blocks_per_tick: int, offload: Offload
+) -> dict:
+    engine = instrument_engine(
+        create_async_engine(
+            os.environ["DB_CONNECTION"], connect_args={"options": f"-csearch_path={SCHEMA}"}
+        )
+    )
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    uow_factory = uow_factory_maker(session_factory)
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    try:
+        for start in range(0, accounts, SEED_CHUNK):
+            async with uow_factory() as uow:
+                await uow.accounts.insert_all(
+                    Account(address=account_address(i), chain=CHAIN)
+                    for i in range(start, min(start + SEED_CHUNK, accounts))
+                )
+
+        chain_config = ChainConfig(CHAIN, url, ADDRESS_RESOLVER, 5)
+        snx_data = SNXMultiChainData({chain: chain_config for chain in Chain})[CHAIN]
+        synthetix = bootstrap_synthetix(
+            chain_config, "", etherscan_api=f"{url}/etherscan", offload=offload
+        )
+        shard_coordinator = ShardCoordinator(CHAIN, os.environ["DB_CONNECTION"])
+        account_manager = AccountManager(
+            CHAIN, snx_data, synthetix, uow_factory, shard_coordinator, offload=offload
+        )
+        observer = StakingObserver(
+            CHAIN,
+            synthetix,
+            SNXDataManager(synthetix, snx_data, uow_factory),
+            account_manager,
+            shard_coordinator,
+            events_check_interval=0,
+        )
+
+        async with aiohttp.ClientSession() as session:
+            await _rpc_stats(session, url)
+            started = time.perf_counter()
+            with track_queries("benchmark_init") as init_queries:
+                await observer.update()
+            init_seconds = time.perf_counter() - started
+            init_rpc = await _rpc_stats(session, url, advance=blocks_per_tick)
+
+            tick_seconds, tick_rpc, tick_statements, lags = [], Counter(), [], []
+            lag_sampler = asyncio.create_task(_sample_lag(lags))
+            for _ in range(ticks):
+                started = time.perf_counter()
+                with track_queries("benchmark_tick") as tick_queries:
+                    await observer.update()
+                tick_statements.append(tick_queries.statements)
+                tick_seconds.append(time.perf_counter() - started)
+                tick_rpc += await _rpc_stats(session, url, advance=blocks_per_tick)
+            lag_sampler.cancel()
+
+        async with uow_factory() as uow:
+            inited = await uow._session.scalar(
+                select(func.count()).select_from(Account).where(Account.inited)
+            )
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+        await engine.dispose()
+        offload.shutdown()
+
+    return {
+        "accounts": accounts,
+        "inited": inited,
+        "init_s": init_seconds,
+        "tick_mean_s": statistics.fmean(tick_seconds) if tick_seconds else 0,
+        "tick_max_s": max(tick_seconds, default=0),
+        "max_lag_s": max(lags, default=0),
+        "init_statements": init_queries.statements,
+        "tick_statements": statistics.fmean(tick_statements) if tick_statements else 0,
+        "init_rpc": init_rpc,
+        "tick_rpc": tick_rpc,
+        # KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_size(
+    url: str,
+    accounts: int,
+    ticks: int,
+    blocks_per_tick: int,
+    offload_workers: int = 0,
+    offload_min_batch: int = MIN_BATCH,
+) -> dict:
+    load_dotenv()
+    logging.basicConfig(level=logging.WARNING)
+    offload = Offload(offload_workers, offload_min_batch)
+    return asyncio.run(_run(url, accounts, ticks, blocks_per_tick, offload))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _format_rpc(stats: Counter, ticks: int = 1) -> str:
+    calls = {key.removeprefix("eth_call:"): count for key, count in stats.items() if ":" in key}
+    methods = {key: count for key, count in stats.items() if ":" not in key}
+    return " ".join(f"{key}={count / ticks:g}" for key, count in sorted((methods | calls).items()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--accounts", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--blocks-per-tick", type=int, default=50)
+    parser.add_argument("--events-per-block", type=float, default=2)
+    parser.add_argument("--latency", type=float, default=0, help="seconds per RPC request")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of failed RPC requests")
+    parser.add_argument("--static-prices", action="store_true")
+    parser.add_argument("--offload-workers", type=int, default=0)
+    parser.add_argument("--offload-min-batch", type=int, default=MIN_BATCH)
+    args = parser.parse_args()
+
+    spawn = multiprocessing.get_context("spawn")
+    results = []
+    for accounts in args.accounts:
+        port, ready = _free_port(), spawn.Event()
+        server = spawn.Process(
+            target=serve,
+            args=(
+                port,
+                accounts,
+                args.latency,
+                args.error_rate,
+                args.events_per_block,
+                args.static_prices,
+                ready,
+            ),
+            daemon=True,
+        )
+        server.start()
+        try:
+            ready.wait(30)
+            with ProcessPoolExecutor(1, mp_context=spawn) as executor:
+                results.append(
+                    executor.submit(
+                        run_size,
+                        f"http://127.0.0.1:{port}",
+                        accounts,
+                        args.ticks,
+                        args.blocks_per_tick,
+                        args.offload_workers,
+                        args.offload_min_batch,
+                    ).result()
+                )
+        finally:
+            server.terminate()
+
+    print(  # noqa: T201
+        f"{'accounts':>9}{'inited':>9}{'init s':>9}{'tick s':>9}{'max s':>9}{'lag ms':>9}"
+        f"{'rss MB':>9}"
+    )
+    for r in results:
+        print(  # noqa: T201
+            f"{r['accounts']:>9}{r['inited']:>9}{r['init_s']:>9.2f}"
+            f"{r['tick_mean_s']:>9.2f}{r['tick_max_s']:>9.2f}{r['max_lag_s'] * 1000:>9.0f}"
+            f"{r['peak_rss_mb']:>9.0f}"
+        )
+    for r in results:
+        print(f"\n{r['accounts']} accounts")  # noqa: T201
+        print(f"  init rpc: {_format_rpc(r['init_rpc'])}")  # noqa: T201
+        print(f"  rpc per tick: {_format_rpc(r['tick_rpc'], args.ticks)}")  # noqa: T201
+        print(  # noqa: T201
+            f"  statements: init={r['init_statements']} per tick={r['tick_statements']:g}"
+        )
+
+
+if __name__ == "__main__":
+    main()
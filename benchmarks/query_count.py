@@ -0,0 +1,166 @@
+"""Query-count benchmark for relationship load plans and plain records.
+
+Seeds a throwaway schema with chats that share popular accounts, then loads
+the entities each hot path needs, once the current way, with its LoadPlan or
+as plain records, and once with the graph the old blanket `selectin`
+relationships pulled in. Current loads running more statements than their
+budget fail the benchmark.
+
+Usage:
+    DB_CONNECTION=postgresql+psycopg://... python -m benchmarks.query_count
+"""
+
+import asyncio
+import contextlib
+import os
+import random
+import time
+from collections.abc import Callable
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+from sqlmodel import SQLModel
+
+from app.common import Chain
+from app.data_access import (
+    LoadPlan,
+    LoadPlanType,
+    expect_queries,
+    instrument_engine,
+    track_queries,
+)
+from app.data_access.repositories import AccountRepository, ChatRepository, NotifRepository
+from app.models import Account, Chat, ChatAccount, Notif, NotifType
+
+SCHEMA = "bench_query_count"
+
+CHATS = 500
+ACCOUNTS = 200
+ACCOUNTS_PER_CHAT = 5
+NOTIFS_PER_CHAT_ACCOUNT = 2
+
+# Two hops of what lazy="selectin" on every relationship used to load.
+_chat_accounts_graph = (
+    selectinload(ChatAccount.account),
+    selectinload(ChatAccount.notifs),
+    selectinload(ChatAccount.chat)
+    .selectinload(Chat.chat_accounts)
+    .options(selectinload(ChatAccount.account), selectinload(ChatAccount.notifs)),
+)
+LEGACY_ACCOUNT: LoadPlanType = (
+    selectinload(Account.chat_accounts).options(*_chat_accounts_graph),
+)
+LEGACY_CHAT: LoadPlanType = (
+    selectinload(Chat.chat_accounts).options(
+        selectinload(ChatAccount.notifs),
+        selectinload(ChatAccount.account)
+        .selectinload(Account.chat_accounts)
+        .options(selectinload(ChatAccount.chat), selectinload(ChatAccount.notifs)),
+    ),
+)
+
+
+async def seed(session_factory: async_sessionmaker) -> None:
+    rnd = random.Random(0)
+    async with session_factory() as session:
+        accounts = [
+            Account(address=f"0x{i:040x}", chain=Chain.ethereum, inited=True)
+            for i in range(ACCOUNTS)
+        ]
+        session.add_all(accounts)
+        for chat_id in range(1, CHATS + 1):
+            session.add(Chat(id=chat_id))
+            # Popular accounts: the first accounts are picked far more often.
+            picked = {
+                accounts[int(rnd.paretovariate(1.2)) % ACCOUNTS] for _ in range(ACCOUNTS_PER_CHAT)
+            }
+            for account in picked:
+                chat_account = ChatAccount(chat_id=chat_id, account_id=account.id)
+                session.add(chat_account)
+                for target in range(NOTIFS_PER_CHAT_ACCOUNT):
+                    session.add(
+                        Notif(
+                            type=NotifType.ratio,
+                            params={"above": False, "target": 4 + target},
+                            chat_account_id=chat_account.id,
+                        )
+                    )
+        await session.commit()
+
+
+async def measure(
+    session_factory: async_sessionmaker,
+    load: Callable[[AsyncSession], object],
+    max_statements: int | None = None,
+) -> tuple[int, int, float]:
+    """:returns statements, hydrated objects, seconds"""
+    budget = (
+        expect_queries(max_statements) if max_statements is not None else contextlib.nullcontext()
+    )
+    async with session_factory() as session:
+        with budget, track_queries("query_count") as stats:
+            started = time.perf_counter()
+            loaded = await load(session)  # noqa: F841 keeps the graph referenced
+            elapsed = time.perf_counter() - started
+        return stats.statements, len(session.identity_map), elapsed
+
+
+async def main() -> None:
+    load_dotenv()
+    engine = instrument_engine(
+        create_async_engine(
+            os.environ["DB_CONNECTION"], connect_args={"options": f"-csearch_path={SCHEMA}"}
+        )
+    )
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    try:
+        await seed(session_factory)
+        async with session_factory() as session:
+            # paretovariate() >= 1, so the second account is the most watched one
+            popular = await AccountRepository(session).get_by_address_chain_or_none(
+                f"0x{1:040x}", Chain.ethereum
+            )
+
+        async def worker_account(session: AsyncSession) -> object:
+            record = await AccountRepository(session).get_record_by_id_or_none(popular.id)
+            return record, await NotifRepository(session).get_subscriptions(popular.id)
+
+        # current load, its statement budget, legacy load
+        cases = {
+            "worker account": (
+                worker_account,
+                2,
+                lambda s: AccountRepository(s).get_by_id_or_none(popular.id, load=LEGACY_ACCOUNT),
+            ),
+            "dashboard chat": (
+                lambda s: ChatRepository(s).get_one_or_none(Chat.id == 1, load=LoadPlan.DASHBOARD),
+                2,
+                lambda s: ChatRepository(s).get_one_or_none(Chat.id == 1, load=LEGACY_CHAT),
+            ),
+        }
+
+        print(f"{'case':<18}{'graph':<8}{'queries':>9}{'objects':>9}{'ms':>9}")  # noqa: T201
+        for name, (current, budget, legacy) in cases.items():
+            for label, load, max_statements in (
+                ("legacy", legacy, None),
+                ("current", current, budget),
+            ):
+                statements, objects, elapsed = await measure(session_factory, load, max_statements)
+                print(  # noqa: T201
+                    f"{name:<18}{label:<8}{statements:>9}{objects:>9}{elapsed * 1000:>9.1f}"
+                )
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
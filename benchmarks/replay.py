@@ -0,0 +1,118 @@
+"""Replays recorded traffic through the observers and the update processor.
+
+An observer runs `--ticks` updates for every chain in the recordings, the first
+one installing the contracts and initing the accounts. With `--worker` the
+account outbox is then drained by the update processor, against the recorded
+Bot API responses. Recordings come from TRAFFIC_RECORD_DIR, see app.traffic.
+
+The database must hold the accounts and chats the traffic was recorded with,
+e.g. a restored dump, and is written to. The address resolvers are read from
+the environment, as for the app.
+
+Usage:
+    DB_CONNECTION=postgresql+psycopg://... python -m benchmarks.replay \\
+        recordings/all-*.jsonl.gz --speed 10 --ticks 5 --worker
+"""
+
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from telegram import Bot
+
+from app.common import Chain, ChainConfig, SNXMultiChainData
+from app.data_access import uow_factory_maker
+from app.snx_staking import (
+    AccountManager,
+    ShardCoordinator,
+    SNXDataManager,
+    StakingObserver,
+    bootstrap_synthetix,
+)
+from app.telegram_bot import AccountUpdateProcessor
+from app.traffic import TrafficReplay
+
+DRAIN_CHECK_INTERVAL = 0.5
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("recordings", nargs="+")
+    parser.add_argument("--speed", type=float, default=1, help="speed-up, inf for no delays")
+    parser.add_argument("--ticks", type=int, default=3)
+    parser.add_argument("--worker", action="store_true")
+    parser.add_argument("--issuance-ratio", type=float, default=5)
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.WARNING)
+    db_connection = os.environ["DB_CONNECTION"]
+    engine = create_async_engine(db_connection)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    uow_factory = uow_factory_maker(session_factory)
+
+    replay = TrafficReplay(args.recordings, args.speed)
+    # the recorded calls are to the resolvers of the recording environment
+    chain_configs = {
+        chain: ChainConfig(
+            chain,
+            "",
+            os.environ[f"{chain.value.upper()}_ADDRESS_RESOLVER_ADDRESS"],
+            args.issuance_ratio,
+        )
+        for chain in Chain
+    }
+    snx_multichain_data = SNXMultiChainData(chain_configs)
+
+    for chain in replay.chains:
+        synthetix = bootstrap_synthetix(
+            chain_configs[chain],
+            "",
+            provider=replay.provider(chain),
+            wrap_abi_fetch=replay.wrap_abi_fetch(chain),
+        )
+        shard_coordinator = ShardCoordinator(chain, db_connection)
+        observer = StakingObserver(
+            chain,
+            synthetix,
+            SNXDataManager(synthetix, snx_multichain_data[chain], uow_factory),
+            AccountManager(
+                chain, snx_multichain_data[chain], synthetix, uow_factory, shard_coordinator
+            ),
+            shard_coordinator,
+            events_check_interval=0,
+        )
+        for tick in range(args.ticks):
+            started = time.perf_counter()
+            await observer.update()
+            print(f"{chain} tick {tick}: {time.perf_counter() - started:.2f}s")  # noqa: T201
+
+    if args.worker:
+        async with Bot("0:replay", request=replay.telegram_request()) as bot:
+            processor = AccountUpdateProcessor(
+                bot, uow_factory, snx_multichain_data, asyncio.Event(), poll_interval=0.1
+            )
+            started = time.perf_counter()
+            worker = asyncio.create_task(processor.worker())
+            while True:
+                await asyncio.sleep(DRAIN_CHECK_INTERVAL)
+                async with uow_factory() as uow:
+                    pending, _ = await uow.outbox.pending_stats()
+                if not pending:
+                    break
+            worker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await worker
+            print(f"outbox drained in {time.perf_counter() - started:.2f}s")  # noqa: T201
+
+    print(f"not recorded: {dict(replay.misses) or 'none'}")  # noqa: T201
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
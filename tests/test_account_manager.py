@@ -0,0 +1,177 @@
+import asyncio
+import dataclasses
+import unittest
+import uuid
+from collections.abc import Callable
+
+from app.common import Chain, SNXData
+from app.fixed_point import WAD
+from app.models import AccountRecord
+from app.snx_staking.account_manager import AccountManager
+from app.snx_staking.synthetix import AddressData, EventName
+from app.snx_staking.synthetix.event_decoder import AccountLog
+
+ADDRESS = "0x" + "ab" * 20
+OTHER_ADDRESS = "0x" + "cd" * 20
+EVENTS_BLOCK = 42
+
+
+def make_account(address: str) -> AccountRecord:
+    return AccountRecord(
+        id=uuid.uuid4(),
+        address=address,
+        chain=Chain.ethereum,
+        c_ratio=0,
+        snx_count=1_000 * WAD,
+        collateral=0,
+        sds_count=100 * WAD,
+        debt=0,
+        claimable_snx=0,
+        liquidation_deadline=None,
+        inited=True,
+        version=0,
+    )
+
+
+class FakeAccounts:
+    def __init__(self, rows: dict[uuid.UUID, AccountRecord]) -> None:
+        self.rows = rows
+        # runs once before the next write, as a writer committing in between
+        self.before_write: Callable[[], None] | None = None
+
+    async def get_records(self, *_: object) -> list:
+        return [dataclasses.replace(row) for row in self.rows.values()]
+
+    async def get_records_by_addresses(self, addresses: object, _: Chain) -> list:
+        return [dataclasses.replace(row) for row in self.rows.values() if row.address in addresses]
+
+    async def get_records_by_ids(self, ids: list[uuid.UUID]) -> list:
+        return [dataclasses.replace(self.rows[id_]) for id_ in ids]
+
+    async def update_all_versioned(self, records: list, fields: tuple) -> list:
+        if self.before_write is not None:
+            self.before_write()
+            self.before_write = None
+        stale = []
+        for record in records:
+            row = self.rows[record.id]
+            if row.version != record.version:
+                stale.append(record)
+                continue
+            for field in fields:
+                setattr(row, field, getattr(record, field))
+            row.version = record.version = row.version + 1
+        return stale
+
+
+class FakeOutbox:
+    async def put_all(self, _: dict) -> None:
+        pass
+
+
+class FakeSnapshots:
+    async def append_all(self, *_: object) -> None:
+        pass
+
+
+class FakeUnitOfWork:
+    def __init__(self, accounts: FakeAccounts) -> None:
+        self.accounts = accounts
+        self.outbox = FakeOutbox()
+        self.snapshots = FakeSnapshots()
+
+    async def __aenter__(self) -> "FakeUnitOfWork":
+        return self
+
+    async def __aexit__(self, *_: object) -> None:
+        pass
+
+
+class FakeSynthetix:
+    vesting_contract_address = None
+
+    def __init__(self, debt_share: int) -> None:
+        self.debt_share = debt_share
+        self.loaded_at: list = []
+
+    async def load_address_data(self, _: str, block_identifier: object) -> AddressData:
+        self.loaded_at.append(block_identifier)
+        return AddressData(1_000 * WAD, self.debt_share, (0, 0), 0)
+
+
+class OwnsAll:
+    @staticmethod
+    def owns(_: str) -> bool:
+        return True
+
+
+class OwnsOnly:
+    def __init__(self, address: str) -> None:
+        self.address = address
+
+    def owns(self, address: str) -> bool:
+        return address == self.address
+
+
+class WriteConflictTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.account = make_account(ADDRESS)
+        self.accounts = FakeAccounts({self.account.id: self.account})
+        # the chain state at EVENTS_BLOCK, with the mint of _mint included
+        self.synthetix = FakeSynthetix(debt_share=150 * WAD)
+        self.manager = AccountManager(
+            Chain.ethereum,
+            SNXData(Chain.ethereum, 5, snx_price=2 * WAD, sds_price=10**27),
+            self.synthetix,
+            lambda **_: FakeUnitOfWork(self.accounts),
+            OwnsAll(),
+        )
+
+    def _mint(self) -> None:
+        mint = AccountLog(EVENTS_BLOCK, ADDRESS, 50 * WAD)
+        asyncio.run(self.manager.update_accounts({EventName.MINT: [mint]}, EVENTS_BLOCK))
+
+    def test_init_between_read_and_write_of_events(self) -> None:
+        def init() -> None:
+            self.account.sds_count = self.synthetix.debt_share
+            self.account.version += 1
+
+        self.accounts.before_write = init
+        self._mint()
+
+        # the chain state, not the mint applied again on top of the init
+        self.assertEqual(self.account.sds_count, 150 * WAD)
+        self.assertEqual(self.account.debt, 150 * WAD)
+        self.assertEqual(self.account.version, 2)
+        self.assertEqual(self.synthetix.loaded_at, [EVENTS_BLOCK])
+
+    def test_events_applied_once_without_conflict(self) -> None:
+        self._mint()
+
+        self.assertEqual(self.account.sds_count, 150 * WAD)
+        self.assertEqual(self.account.version, 1)
+        self.assertEqual(self.synthetix.loaded_at, [])
+
+
+class SnapshotTimesTest(unittest.TestCase):
+    def test_price_update_forgets_accounts_not_owned(self) -> None:
+        owned, other = make_account(ADDRESS), make_account(OTHER_ADDRESS)
+        accounts = FakeAccounts({owned.id: owned, other.id: other})
+        manager = AccountManager(
+            Chain.ethereum,
+            SNXData(Chain.ethereum, 5, snx_price=2 * WAD, sds_price=10**27, snx_updated=True),
+            FakeSynthetix(debt_share=100 * WAD),
+            lambda **_: FakeUnitOfWork(accounts),
+            OwnsOnly(ADDRESS),
+        )
+        deleted_id = uuid.uuid4()
+        # other was owned before a rebalance
+        manager._snapshot_at = {owned.id: 0, other.id: 0, deleted_id: 0}
+
+        asyncio.run(manager.update_accounts({}))
+
+        self.assertEqual(manager._snapshot_at.keys(), {owned.id})
+
+
+if __name__ == "__main__":
+    unittest.main()
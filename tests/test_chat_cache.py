@@ -0,0 +1,63 @@
+import asyncio
+import unittest
+
+from sqlalchemy import JSON, MetaData, create_engine, select
+from sqlalchemy.orm import Session
+
+from app.common import Chain
+from app.data_access import LoadPlan
+from app.models import Account, Chat, ChatAccount
+from app.telegram_bot.chat_cache import ChatCache
+
+
+class ChatCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.engine = create_engine("sqlite://")
+        # copies without Postgres server defaults and JSONB, the models set every column
+        metadata = MetaData()
+        for table in (Account.__table__, Chat.__table__, ChatAccount.__table__):
+            for column in table.to_metadata(metadata).columns:
+                column.server_default = None
+                if isinstance(column.type, JSON):
+                    column.type = JSON()
+        metadata.create_all(self.engine)
+        with Session(self.engine) as session:
+            account = Account(address="0x" + "ab" * 20, chain=Chain.ethereum, c_ratio=3)
+            session.add_all([account, Chat(id=1)])
+            session.flush()
+            session.add(ChatAccount(chat_id=1, account_id=account.id))
+            session.commit()
+
+    def tearDown(self) -> None:
+        self.engine.dispose()
+
+    def _load_chat(self, rollback: bool) -> Chat:
+        """Loads the dashboard graph like a read-only unit of work, or rolls it back"""
+        session = Session(self.engine, expire_on_commit=False)
+        chat = session.scalars(select(Chat).options(*LoadPlan.DASHBOARD)).one()
+        if rollback:
+            session.rollback()
+        session.close()
+        return chat
+
+    async def _get(self, cache: ChatCache, rollback: bool) -> Chat:
+        async def load() -> Chat:
+            return self._load_chat(rollback)
+
+        return await cache.get_or_load(1, "dashboard", load)
+
+    def test_cached_chat_is_usable(self) -> None:
+        cache = ChatCache()
+        asyncio.run(self._get(cache, rollback=False))
+        cached = asyncio.run(self._get(cache, rollback=True))
+        self.assertEqual(cached.chat_accounts[0].account.c_ratio, 3)
+
+    def test_expired_chat_is_not_cached(self) -> None:
+        cache = ChatCache()
+        asyncio.run(self._get(cache, rollback=True))
+        cached = asyncio.run(self._get(cache, rollback=False))
+        self.assertEqual(cached.chat_accounts[0].account.c_ratio, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()